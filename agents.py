@@ -1,42 +1,65 @@
 from langchain.chains.openai_functions import create_structured_output_runnable
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import AzureChatOpenAI
 from models import Code, Test, ExecutableCode, RefineCode
+from response_cache import CachedRunnable, get_response_cache
+from token_budget import BudgetedRunnable, count_tokens, max_output_tokens
+
+# Shared by the coder and the best-of-N candidate coders
+CODE_GEN_TEMPLATE = '''**Role**: You are a expert software python programmer. You need to develop python code
+**Task**: As a programmer, you are required to complete the function. Use a Chain-of-Thought approach to break
+down the problem, create pseudocode, and then write the code in Python language. Ensure that your code is
+efficient, readable, and well-commented.
+
+**Instructions**:
+1. **Understand and Clarify**: Make sure you understand the task.
+2. **Algorithm/Method Selection**: Decide on the most efficient way.
+3. **Pseudocode Creation**: Write down the steps you will follow in pseudocode.
+4. **Code Generation**: Translate your pseudocode into executable Python code
+
+{approach}*REQURIEMENT*
+{requirement}'''
+
+# Typical answer sizes used to size max_tokens before any code exists
+EXPECTED_PROGRAM_TOKENS = 1024
+EXPECTED_TESTS_TOKENS = 512
 
 def setup_environment():
     """Setup environment variables and LLM"""
     from dotenv import load_dotenv
+    from langchain_openai import AzureChatOpenAI
     import os
     
     # Load environment variables from .env file
     load_dotenv()
     
+    # Several deployments configured: spread calls over them with failover
+    from llm_router import create_router, load_deployments
+    if load_deployments():
+        return create_router(temperature=float(os.getenv("LLM_TEMPERATURE") or 0), max_tokens=max_output_tokens())
+
     # Environment variables are now loaded from .env file
     return AzureChatOpenAI(
-        temperature=0,
-        max_tokens=1024,
+        temperature=float(os.getenv("LLM_TEMPERATURE") or 0),
+        max_tokens=max_output_tokens(),
         openai_api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2023-07-01-preview"),
         azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4-1106-preview")
     )
 
-def create_agents(llm):
-    """Create all the necessary agents"""
-    # Code generation prompt
-    code_gen_prompt = ChatPromptTemplate.from_template(
-        '''**Role**: You are a expert software python programmer. You need to develop python code
-**Task**: As a programmer, you are required to complete the function. Use a Chain-of-Thought approach to break
-down the problem, create pseudocode, and then write the code in Python language. Ensure that your code is
-efficient, readable, and well-commented.
+def for_role(llm, role):
+    """The model to use for an agent role; plain chat models serve every role"""
+    try:
+        return llm.for_role(role)
+    except AttributeError:
+        return llm
 
-**Instructions**:
-1. **Understand and Clarify**: Make sure you understand the task.
-2. **Algorithm/Method Selection**: Decide on the most efficient way.
-3. **Pseudocode Creation**: Write down the steps you will follow in pseudocode.
-4. **Code Generation**: Translate your pseudocode into executable Python code
+def create_agents(llm, cache=None):
+    """Create all the necessary agents
 
-*REQURIEMENT*
-{requirement}'''
-    )
+    Each agent is wrapped in the response cache; pass ``cache`` to use a
+    specific ResponseCache instead of the process-wide one.
+    """
+    # Code generation prompt
+    code_gen_prompt = ChatPromptTemplate.from_template(CODE_GEN_TEMPLATE.replace('{approach}', ''))
 
     # Test generation prompt
     test_gen_prompt = ChatPromptTemplate.from_template(
@@ -114,10 +137,92 @@ Input and Output For Code:
     """
     )
 
-    # Create the agents
-    coder = create_structured_output_runnable(Code, llm, code_gen_prompt)
-    tester_agent = create_structured_output_runnable(Test, llm, test_gen_prompt)
-    execution = create_structured_output_runnable(ExecutableCode, llm, python_execution_gen)
-    refine_code = create_structured_output_runnable(RefineCode, llm, python_refine_gen)
+    # With the deployment router each role can use its own model (LLM_ROLE_MODELS)
+    coder_llm, tester_llm = for_role(llm, "coder"), for_role(llm, "tester")
+    execution_llm, refine_llm = for_role(llm, "execution"), for_role(llm, "refine")
+
+    # Create the agents; each call measures its prompt and sizes max_tokens from the expected answer
+    coder = BudgetedRunnable(Code, coder_llm, code_gen_prompt, lambda input: EXPECTED_PROGRAM_TOKENS, name="coder")
+    tester_agent = BudgetedRunnable(Test, tester_llm, test_gen_prompt, lambda input: EXPECTED_TESTS_TOKENS,
+                                    name="tester")
+    execution = BudgetedRunnable(
+        ExecutableCode, execution_llm, python_execution_gen,
+        lambda input: count_tokens(input['code'] + str(input['input']) + str(input['output'])),
+        name="execution",
+    )
+    refine_code = BudgetedRunnable(RefineCode, refine_llm, python_refine_gen,
+                                   lambda input: count_tokens(input['code']), name="refine")
+
+    # Serve repeated (prompt, inputs, deployment) tuples from the response cache
+    cache = cache or get_response_cache()
+    coder = CachedRunnable(coder, code_gen_prompt, Code, coder_llm, cache)
+    tester_agent = CachedRunnable(tester_agent, test_gen_prompt, Test, tester_llm, cache)
+    execution = CachedRunnable(execution, python_execution_gen, ExecutableCode, execution_llm, cache)
+    refine_code = CachedRunnable(refine_code, python_refine_gen, RefineCode, refine_llm, cache)
+
+    return coder, tester_agent, execution, refine_code
+
+def create_spec_tester(llm, cache=None):
+    """Create a tester that works from the requirement alone
+
+    Used by the parallel topology, where tests are generated while the
+    programmer is still writing the code.
+    """
+    spec_test_gen_prompt = ChatPromptTemplate.from_template(
+        '''**Role**: As a tester, your task is to create Basic and Simple test cases based only on the provided Requirement.
+The code is being written at the same time, so infer the function's name and arguments from the Requirement and
+pass the arguments in the order the Requirement states them.
+
+**CRITICAL FORMAT REQUIREMENTS**:
+1. Input MUST be a list of lists: [[test1_inputs], [test2_inputs], ...]
+2. Output MUST be a list of lists: [[test1_output], [test2_output], ...]
+3. Each output MUST be a list containing exactly one value
+4. The number of input test cases MUST match the number of output test cases
+
+Examples:
+
+1. For a function that adds two numbers:
+Input: [[1, 2], [3, 4]]  # Two test cases
+Output: [[3], [7]]       # Each output is a list with one value
+
+2. For a function that returns a string:
+Input: [["hello"], ["world"]]  # Two test cases
+Output: [["HELLO"], ["WORLD"]] # Each output is a list with one value
+
+**Instructions**:
+- Only Generate Basics and Edge cases which are small
+- Avoid generating Large scale and Medium scale test case
+- CRITICAL: Each output MUST be a list containing exactly one value
+- CRITICAL: The number of input and output test cases MUST match
+
+*REQURIEMENT*
+{requirement}
+'''
+    )
+    llm = for_role(llm, "tester")
+    spec_tester = BudgetedRunnable(Test, llm, spec_test_gen_prompt, lambda input: EXPECTED_TESTS_TOKENS,
+                                   name="spec_tester")
+    return CachedRunnable(spec_tester, spec_test_gen_prompt, Test, llm, cache or get_response_cache())
+
+# Nudges that make best-of-N candidates differ beyond sampling noise
+CANDIDATE_APPROACHES = [
+    "",
+    "Prefer the simplest straightforward solution, even if it is not the fastest.",
+    "Prefer solutions built on the Python standard library (collections, itertools, math).",
+    "Validate inputs and handle edge cases (empty inputs, zero, negative numbers) explicitly.",
+    "Think about the algorithmic complexity first and pick the asymptotically best approach.",
+]
+
+def create_candidate_coder(llm, temperature=0.8):
+    """Create a coder for best-of-N generation
+
+    Takes ``requirement`` and ``approach`` inputs and samples at
+    ``temperature``. It is not cached: candidates are meant to differ.
+    """
+    candidate_prompt = ChatPromptTemplate.from_template(CODE_GEN_TEMPLATE)
+    return create_structured_output_runnable(Code, for_role(llm, "coder").bind(temperature=temperature),
+                                             candidate_prompt)
 
-    return coder, tester_agent, execution, refine_code 
\ No newline at end of file
+def candidate_approach(index):
+    hint = CANDIDATE_APPROACHES[index % len(CANDIDATE_APPROACHES)]
+    return f"*APPROACH*\n{hint}\n\n" if hint else ""
@@ -1,300 +1,195 @@
-import os
-from dotenv import load_dotenv
 import streamlit as st
-from langchain import hub
-from langchain.agents import create_openai_functions_agent
-from langchain_openai import AzureChatOpenAI
-from pydantic import BaseModel, Field, ConfigDict
-from langchain.chains.openai_functions import create_structured_output_runnable
-from langchain_core.prompts import ChatPromptTemplate
-from typing import Annotated, Any, Dict, Optional, Sequence, TypedDict, List, Tuple
-from langgraph.graph import END, StateGraph
-from agents import setup_environment, create_agents
-from workflow import create_workflow
 
-# Define the Code model
-class Code(BaseModel):
-    """Plan to follow in future"""
-    code: str = Field(description="Detailed optimized error-free Python code on the provided requirements")
-    
-    model_config = ConfigDict(
-        arbitrary_types_allowed=True,
-        json_schema_serialization_defaults=True
-    )
-
-# Define the Test model
-class Test(BaseModel):
-    """Plan to follow in future"""
-    Input: List[List[Any]] = Field(description="Input for Test cases to evaluate the provided code")
-    Output: List[Any] = Field(description="Expected Output for Test cases to evaluate the provided code")
-    
-    model_config = ConfigDict(
-        arbitrary_types_allowed=True,
-        json_schema_serialization_defaults=True
-    )
-
-# Define the ExecutableCode model
-class ExecutableCode(BaseModel):
-    """Plan to follow in future"""
-    code: str = Field(description="Detailed optimized error-free Python code with test cases assertion")
-    
-    model_config = ConfigDict(
-        arbitrary_types_allowed=True,
-        json_schema_serialization_defaults=True
-    )
-
-# Define the RefineCode model
-class RefineCode(BaseModel):
-    code: str = Field(description="Optimized and Refined Python code to resolve the error")
-    
-    model_config = ConfigDict(
-        arbitrary_types_allowed=True,
-        json_schema_serialization_defaults=True
-    )
-
-# Define the AgentCoder state
-class AgentCoder(TypedDict):
-    requirement: str
-    code: str
-    tests: Dict[str, Any]
-    errors: Optional[str]
-    retry_count: int
-
-def setup_environment():
-    """Setup environment variables and LLM"""
-    # Load environment variables from .env file
-    load_dotenv()
-    
-    # Environment variables are now loaded from .env file
-    return AzureChatOpenAI(
-        temperature=0,
-        max_tokens=1024,
-        openai_api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2023-07-01-preview"),
-        azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT", "gpt-4-1106-preview")
-    )
-
-def create_agents(llm):
-    """Create all the necessary agents"""
-    # Code generation prompt
-    code_gen_prompt = ChatPromptTemplate.from_template(
-        '''**Role**: You are a expert software python programmer. You need to develop python code
-**Task**: As a programmer, you are required to complete the function. Use a Chain-of-Thought approach to break
-down the problem, create pseudocode, and then write the code in Python language. Ensure that your code is
-efficient, readable, and well-commented.
-
-**Instructions**:
-1. **Understand and Clarify**: Make sure you understand the task.
-2. **Algorithm/Method Selection**: Decide on the most efficient way.
-3. **Pseudocode Creation**: Write down the steps you will follow in pseudocode.
-4. **Code Generation**: Translate your pseudocode into executable Python code
-5. **Important**: Always define the function first, then write the test cases
-6. **Important**: Make sure the function name matches exactly what is being called in the test cases
-
-*REQURIEMENT*
-{requirement}'''
-    )
-
-    # Test generation prompt
-    test_gen_prompt = ChatPromptTemplate.from_template(
-        '''**Role**: As a tester, your task is to create Basic and Simple test cases based on provided Requirement and Python Code. 
-These test cases should encompass Basic, Edge scenarios to ensure the code's robustness, reliability, and scalability.
-**1. Basic Test Cases**:
-- **Objective**: Basic and Small scale test cases to validate basic functioning 
-**2. Edge Test Cases**:
-- **Objective**: To evaluate the function's behavior under extreme or unusual conditions.
-**Instructions**:
-- Implement a comprehensive set of test cases based on requirements.
-- Pay special attention to edge cases as they often reveal hidden bugs.
-- Only Generate Basics and Edge cases which are small
-- Avoid generating Large scale and Medium scale test case. Focus only small, basic test-cases
-- Make sure to use the exact function name that was defined in the code
-
-*REQURIEMENT*
-{requirement}
-**Code**
-{code}
-'''
-    )
-
-    # Execution prompt
-    python_execution_gen = ChatPromptTemplate.from_template(
-        """You have to add testing layer in the *Python Code* that can help to execute the code. You need to pass only Provided Input as argument and validate if the Given Expected Output is matched.
-*Instruction*:
-- Make sure to return the error if the assertion fails
-- Generate the code that can be execute
-- Ensure the function definition is included before the test cases
-- Make sure the function name matches exactly what is being called
-
-Python Code to excecute:
-*Python Code*:{code}
-Input and Output For Code:
-*Input*:{input}
-*Expected Output*:{output}"""
-    )
-
-    # Refinement prompt
-    python_refine_gen = ChatPromptTemplate.from_template(
-        """You are expert in Python Debugging. You have to analysis Given Code and Error and generate code that handles the error
-    *Instructions*:
-    - Make sure to generate error free code
-    - Generated code is able to handle the error
-    - Ensure the function definition is included before the test cases
-    - Make sure the function name matches exactly what is being called
-    
-    *Code*: {code}
-    *Error*: {error}
+# Agent, graph and checkpoint modules pull in langchain, langgraph and the
+# OpenAI SDK; they are imported inside the functions below so the page
+# renders before any of them load, and only once a run actually needs them.
+
+def load_graph():
+    """Compiled workflow shared across reruns and sessions, built on first use"""
+    from metrics import start_metrics_server
+    from resources import get_resources
+
+    app = get_resources().app
+    start_metrics_server()
+    return app
+
+def show_timeline(rows, totals):
+    """Per-run timeline of node spans with their LLM usage"""
+    import altair as alt
+
+    if not rows:
+        return
+    with st.expander("Run timeline"):
+        st.caption(
+            f"{totals['wall_time']:.1f}s across {len(rows)} node runs, {totals['llm_calls']} LLM calls "
+            f"({totals['cache_hits']} cached), {totals['prompt_tokens'] + totals['completion_tokens']} tokens, "
+            f"~${totals['cost']:.4f}"
+        )
+        chart = alt.Chart(alt.Data(values=rows)).mark_bar().encode(
+            x=alt.X("start:Q", title="seconds"),
+            x2="end:Q",
+            y=alt.Y("node:N", sort=None),
+            tooltip=["node:N", "duration:Q", "queue_time:Q", "prompt_tokens:Q", "completion_tokens:Q", "cost:Q"],
+        )
+        st.altair_chart(chart, use_container_width=True)
+        st.dataframe(rows, use_container_width=True)
+
+def run_events(inputs, run_id, checkpoint_id=None):
+    """Workflow events from the service at SERVICE_URL, or from the graph in this process
+
+    New runs of a requirement already running in this process, for any
+    session, attach to that run (see single_flight.py); the returned
+    events then carry its ``run_id``.
     """
+    from service_client import get_service_client
+
+    client = get_service_client()
+    if client is not None:
+        return client.run_events(inputs, run_id, checkpoint_id)
+    from resources import env_flag, get_resources
+    from single_flight import coalesce_key, get_single_flight
+    from streaming import run_events
+
+    app = load_graph()
+    if inputs is None or env_flag("SINGLE_FLIGHT_DISABLED"):
+        return run_events(app, inputs, run_id, checkpoint_id)
+    key = coalesce_key(inputs["requirement"], get_resources().fingerprint)
+    return get_single_flight().subscribe(key, run_id, lambda: run_events(app, inputs, run_id))
+
+def show_entry(entry):
+    """One compact node update: code as a diff, test vectors cut short"""
+    st.caption(entry["node"])
+    if "code_diff" in entry:
+        st.code(entry["code_diff"], language="diff")
+    fields = {k: v for k, v in entry.items() if k not in ("node", "code_diff")}
+    if fields:
+        st.write(fields)
+    st.write('----------' * 20)
+
+def show_result(log):
+    """Final code, the full tests on request and the run's timeline and UI footprint"""
+    if log.code:
+        st.subheader("Generated Code:")
+        st.code(log.code, language='python')
+    if log.tests and st.toggle(f"Show all {len(log.tests.get('input') or [])} test cases", key="show_all_tests"):
+        st.write(log.tests)
+    summary = log.summary or {}
+    show_timeline(summary.get("timeline"), summary.get("totals"))
+    stats = log.stats()
+    st.caption(
+        f"{stats['events']} events kept ({stats['dropped']} dropped), {stats['bytes_rendered'] / 1024:.1f} KB "
+        f"rendered instead of {stats['bytes_full'] / 1024:.1f} KB, {stats['memory_bytes'] / 1024:.1f} KB held"
     )
 
-    # Create the agents using create_structured_output_runnable for compatibility with current API version
-    coder = create_structured_output_runnable(Code, llm, code_gen_prompt)
-    tester_agent = create_structured_output_runnable(Test, llm, test_gen_prompt)
-    execution = create_structured_output_runnable(ExecutableCode, llm, python_execution_gen)
-    refine_code = create_structured_output_runnable(RefineCode, llm, python_refine_gen)
-
-    return coder, tester_agent, execution, refine_code
-
-def create_workflow(coder, tester_agent, execution, refine_code):
-    """Create the workflow graph"""
-    def programmer(state):
-        print(f'Entering in Programmer')
-        requirement = state['requirement']
-        code_ = coder.invoke({'requirement': requirement})
-        return {
-            'code': code_.code, 
-            'requirement': requirement,
-            'retry_count': 0,
-            'errors': None,
-            'tests': {}
-        }
-
-    def debugger(state):
-        print(f'Entering in Debugger')
-        errors = state['errors']
-        code = state['code']
-        retry_count = state.get('retry_count', 0) + 1
-        
-        if retry_count > 3:  # Maximum retry limit
-            print("Maximum retry limit reached. Stopping debug cycle.")
-            return {
-                'code': code,
-                'errors': None,
-                'requirement': state['requirement'],
-                'retry_count': retry_count,
-                'tests': state['tests']
-            }
-            
-        refine_code_ = refine_code.invoke({'code': code, 'error': errors})
-        return {
-            'code': refine_code_.code,
-            'errors': None,
-            'requirement': state['requirement'],
-            'retry_count': retry_count,
-            'tests': state['tests']
-        }
-
-    def executer(state):
-        print(f'Entering in Executer')
-        tests = state['tests']
-        input_ = tests['input']
-        output_ = tests['output']
-        code = state['code']
-        executable_code = execution.invoke({"code": code, "input": input_, 'output': output_})
-        error = None
-        try:
-            exec(executable_code.code)
-            print("Code Execution Successful")
-        except Exception as e:
-            print('Found Error While Running')
-            error = f"Execution Error : {e}"
-            print(error)
-        return {
-            'code': executable_code.code,
-            'errors': error,
-            'requirement': state['requirement'],
-            'tests': state['tests'],
-            'retry_count': state.get('retry_count', 0)
-        }
-
-    def tester(state):
-        print(f'Entering in Tester')
-        requirement = state['requirement']
-        code = state['code']
-        tests = tester_agent.invoke({'requirement': requirement, 'code': code})
-        return {
-            'tests': {'input': tests.Input, 'output': tests.Output},
-            'requirement': requirement,
-            'code': state['code'],
-            'retry_count': state.get('retry_count', 0),
-            'errors': None
-        }
-
-    def decide_to_end(state):
-        print(f'Entering in Decide to End')
-        retry_count = state.get('retry_count', 0)
-        if state.get('errors') and retry_count <= 3:
-            return 'debugger'
-        return 'end'
-
-    # Create the workflow
-    workflow = StateGraph(AgentCoder)
-
-    # Add nodes
-    workflow.add_node("programmer", programmer)
-    workflow.add_node("debugger", debugger)
-    workflow.add_node("executer", executer)
-    workflow.add_node("tester", tester)
-
-    # Build graph
-    workflow.set_entry_point("programmer")
-    workflow.add_edge("programmer", "tester")
-    workflow.add_edge("debugger", "executer")
-    workflow.add_edge("tester", "executer")
-
-    workflow.add_conditional_edges(
-        "executer",
-        decide_to_end,
-        {
-            "end": END,
-            "debugger": "debugger",
-        },
-    )
-
-    return workflow.compile()
+def show_log(log):
+    """Re-render the session's last run from its event log"""
+    if log.dropped:
+        st.caption(f"{log.dropped} earlier events are no longer kept")
+    for entry in log.events:
+        show_entry(entry)
+    show_result(log)
+
+def run_workflow(inputs, run_id, checkpoint_id=None):
+    """Stream a run (or resume it when ``inputs`` is None) into the page"""
+    import contextlib
+
+    from event_log import EventLog
+
+    # One bounded log per session, replaced by each run and re-rendered on reruns
+    log = st.session_state["event_log"] = EventLog()
+    with st.spinner("Generating code..."):
+        # Filled token by token while the agents are still generating
+        live_code = st.empty()
+        live_tests = st.empty()
+
+        # Closed when the script stops (e.g. a rerun), so an abandoned shared run can be cancelled
+        with contextlib.closing(run_events(inputs, run_id, checkpoint_id)) as stream:
+            shared_run_id = getattr(stream, "run_id", run_id)
+            if shared_run_id != run_id:
+                run_id = st.query_params["run"] = shared_run_id
+                st.info("The same requirement is already being worked on; following that run.")
+            for kind, k, v in stream:
+                if kind == "partial":
+                    if k in ("programmer", "debugger") and v.get("code"):
+                        live_code.code(v["code"], language='python')
+                    elif k == "tester":
+                        live_tests.write(v)
+                    continue
+                if kind == "done":
+                    log.code = v["state"].get("code") or log.code
+                    log.tests = v["state"].get("tests") or log.tests
+                    log.summary = {"timeline": v["timeline"], "totals": v["totals"]}
+                    continue
+                if k != "__end__":
+                    show_entry(log.add(k, v))
+
+        # Display final results
+        live_code.empty()
+        live_tests.empty()
+        show_result(log)
+    print(f"UI event log for run {run_id}: {log.stats()}")
+    return True
+
+def run_info(run_id):
+    """Checkpoint status and history of a run, from the service when one is configured"""
+    from service_client import get_service_client
+
+    client = get_service_client()
+    if client is not None:
+        info = client.run_info(run_id)
+        return info["status"], info["history"]
+    from checkpoints import run_history, run_status
+
+    status = run_status(run_id)
+    return status, run_history(run_id) if status != "new" else []
+
+def show_history(run_id, history):
+    """Checkpoints of the current run; returns the one the user chose to branch from"""
+    branch_from = None
+    with st.expander(f"Run history ({run_id})"):
+        for entry in history:
+            next_nodes = ", ".join(entry["next"]) or "done"
+            label = f"Step {entry['step']}: next {next_nodes} (retries {entry['retry_count']})"
+            cols = st.columns([4, 1])
+            cols[0].write(label)
+            if entry["next"] and cols[1].button("Branch", key=entry["checkpoint_id"]):
+                branch_from = entry["checkpoint_id"]
+    return branch_from
 
 def main():
     st.title("Development Assistant Starter")
     st.subheader("by Erno Vuori (erno.vuori@gmail.com)")
-    
-    # Setup environment and create agents
-    llm = setup_environment()
-    coder, tester_agent, execution, refine_code = create_agents(llm)
-    app = create_workflow(coder, tester_agent, execution, refine_code)
+
+    # The run id lives in the URL so a refresh or restart can find its checkpoints
+    run_id = st.query_params.get("run")
+    ran = False
+    if run_id:
+        status, history = run_info(run_id)
+        if status == "interrupted":
+            st.info(f"Run {run_id} stopped before finishing; completed steps are saved.")
+            if st.button("Resume run"):
+                ran = run_workflow(None, run_id)
+        if status != "new":
+            branch_from = show_history(run_id, history)
+            if branch_from:
+                ran = run_workflow(None, run_id, checkpoint_id=branch_from)
 
     # Get user input
     requirement = st.text_area("Enter your coding requirement:", height=150)
     
     if st.button("Generate Code"):
         if requirement:
-            with st.spinner("Generating code..."):
-                # Run the workflow
-                config = {"recursion_limit": 50}
-                inputs = {"requirement": requirement}
-                running_dict = {}
-                
-                for event in app.stream(inputs, config=config):
-                    for k, v in event.items():
-                        running_dict[k] = v
-                        if k != "__end__":
-                            st.write(v)
-                            st.write('----------' * 20)
-                
-                # Display final results
-                if 'code' in running_dict:
-                    st.subheader("Generated Code:")
-                    st.code(running_dict['code'], language='python')
+            from checkpoints import new_run_id
+
+            run_id = new_run_id()
+            st.query_params["run"] = run_id
+            ran = run_workflow({"requirement": requirement}, run_id)
         else:
             st.warning("Please enter a requirement first.")
 
+    # On other reruns (e.g. expanding the test cases) show the last run again
+    if not ran and "event_log" in st.session_state:
+        show_log(st.session_state["event_log"])
+
 if __name__ == "__main__":
     main() 
\ No newline at end of file
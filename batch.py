@@ -0,0 +1,127 @@
+"""Run many requirements through the workflow concurrently
+
+Python API::
+
+    results = asyncio.run(run_batch(requirements, "results.jsonl", concurrency=8))
+
+CLI::
+
+    python batch.py requirements.jsonl -o results.jsonl --concurrency 8 --rpm 60 --tpm 80000
+
+The input is either JSONL with a ``requirement`` field per line or plain
+text with one requirement per line. One JSON line is appended to the
+output file as each run completes.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from agents import setup_environment, create_agents, create_candidate_coder, create_spec_tester
+from metrics import MetricsCallbackHandler, track_run
+from perf_check import perf_budget_from_env
+from rate_limit import RateLimiter, RateLimitedChatModel
+from retry_policy import retry_policy_from_env
+from workflow import create_workflow
+
+def load_requirements(path):
+    """Read requirements from a JSONL file or a plain text file"""
+    with open(path, encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if path.endswith(".jsonl"):
+        return [json.loads(line)["requirement"] for line in lines]
+    return lines
+
+def build_app(rpm=None, tpm=None, max_retries=5, llm=None, parallel_tests=False, candidates=1, perf_budget=None):
+    """Compile a workflow whose LLM calls share one rate limiter"""
+    limiter = RateLimiter(requests_per_minute=rpm, tokens_per_minute=tpm)
+    llm = RateLimitedChatModel(llm or setup_environment(), limiter, max_retries=max_retries)
+    spec_tester = create_spec_tester(llm) if parallel_tests else None
+    candidate_coder = create_candidate_coder(llm) if candidates > 1 else None
+    return create_workflow(*create_agents(llm), spec_tester=spec_tester,
+                           candidate_coder=candidate_coder, candidates=candidates, perf_budget=perf_budget,
+                           retry_policy=retry_policy_from_env())
+
+def _run_one(app, index, requirement, recursion_limit):
+    """Run the workflow once on ``requirement`` in the calling thread"""
+    start = time.perf_counter()
+    record = {"index": index, "requirement": requirement}
+    try:
+        config = {"recursion_limit": recursion_limit, "callbacks": [MetricsCallbackHandler()]}
+        with track_run() as run:
+            state = app.invoke({"requirement": requirement}, config=config)
+        record.update({
+            "success": bool(state.get("success")),
+            "code": state.get("code"),
+            "tests": state.get("tests"),
+            "errors": state.get("errors"),
+            "retry_count": state.get("retry_count", 0),
+            "performance": state.get("performance"),
+            "retry_history": state.get("retry_history"),
+            "metrics": run.totals(),
+        })
+    except Exception as e:
+        record.update({"success": False, "exception": f"{type(e).__name__}: {e}"})
+    record["duration"] = time.perf_counter() - start
+    return record
+
+async def run_batch(requirements, output_path, concurrency=4, rpm=None, tpm=None, max_retries=5,
+                    recursion_limit=50, app=None, parallel_tests=False, candidates=1, perf_budget=None):
+    """Run every requirement through the workflow, at most ``concurrency`` at a time
+
+    Results are appended to ``output_path`` as JSON lines in completion
+    order and also returned, sorted by input position.
+    """
+    app = app or build_app(rpm, tpm, max_retries, parallel_tests=parallel_tests, candidates=candidates,
+                           perf_budget=perf_budget)
+    loop = asyncio.get_running_loop()
+    results = []
+    start = time.perf_counter()
+    # Graph nodes are synchronous, so each run gets a thread of its own; the pool is the concurrency limit
+    with ThreadPoolExecutor(max_workers=concurrency) as executor, open(output_path, "a", encoding="utf-8") as out:
+        tasks = [
+            loop.run_in_executor(executor, _run_one, app, i, requirement, recursion_limit)
+            for i, requirement in enumerate(requirements)
+        ]
+        for task in asyncio.as_completed(tasks):
+            record = await task
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+            results.append(record)
+            print(f"[{len(results)}/{len(tasks)}] requirement {record['index']}: "
+                  f"{'passed' if record['success'] else 'failed'} in {record['duration']:.1f}s")
+    elapsed = time.perf_counter() - start
+    passed = sum(r["success"] for r in results)
+    print(f"Batch finished: {passed}/{len(results)} passed in {elapsed:.1f}s")
+    return sorted(results, key=lambda r: r["index"])
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run a batch of requirements through the workflow")
+    parser.add_argument("input", help="JSONL file with a 'requirement' field, or text with one requirement per line")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("-c", "--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY") or 4))
+    parser.add_argument("--rpm", type=int, default=int(os.getenv("AZURE_OPENAI_RPM") or 0) or None,
+                        help="Requests per minute allowed against the deployment")
+    parser.add_argument("--tpm", type=int, default=int(os.getenv("AZURE_OPENAI_TPM") or 0) or None,
+                        help="Tokens per minute allowed against the deployment")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries on HTTP 429 per LLM call")
+    parser.add_argument("--parallel-tests", action="store_true",
+                        help="Generate tests from the requirement while the code is being written")
+    parser.add_argument("--candidates", type=int, default=int(os.getenv("WORKFLOW_CANDIDATES") or 1),
+                        help="Best-of-N: code candidates generated and raced per requirement")
+    parser.add_argument("--perf-check", action="store_true",
+                        help="Time passing code on scaled-up inputs against the PERF_* budgets")
+    args = parser.parse_args()
+
+    requirements = load_requirements(args.input)
+    asyncio.run(run_batch(requirements, args.output, args.concurrency, args.rpm, args.tpm, args.max_retries,
+                          parallel_tests=args.parallel_tests, candidates=args.candidates,
+                          perf_budget=perf_budget_from_env(force=True) if args.perf_check else None))
+
+if __name__ == "__main__":
+    main()
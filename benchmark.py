@@ -0,0 +1,159 @@
+"""Offline end-to-end benchmark of the workflow using the replay LLM
+
+    python benchmark.py                       # run and compare against benchmarks/baseline.json
+    python benchmark.py --latency 0.2 -c 8    # simulate slower LLM calls, 8 runs in flight
+    python benchmark.py --update-baseline     # store this run as the new baseline
+
+Drives ``create_workflow`` over the requirements in the corpus and
+reports throughput, per-node p50/p95/p99 latency, retry-loop counts and
+peak RSS. Exits with status 1 when a metric regresses beyond the
+tolerance.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agents import create_agents, create_candidate_coder, create_spec_tester
+from metrics import MetricsCallbackHandler, track_run
+from replay_llm import ReplayChatModel, load_corpus, load_recordings
+from workflow import create_workflow
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+
+# Metrics compared with the baseline and whether a higher value is better
+COMPARED = {
+    "throughput": True,
+    "run_p95": False,
+    "peak_rss_mb": False,
+    "retry_loops": False,
+}
+
+def percentile(values, p):
+    """Nearest-rank percentile; 0.0 for an empty list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def peak_rss_mb():
+    """Peak resident set size of this process plus its sandbox workers"""
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return (own + children) / divisor
+
+def run_benchmark(corpus, repeat=3, concurrency=4, latency=0.05, jitter=0.0, recordings=None, parallel_tests=False,
+                  candidates=1):
+    llm = ReplayChatModel(corpus=corpus, recordings=recordings or {}, latency=latency, jitter=jitter, seed=0)
+    spec_tester = create_spec_tester(llm) if parallel_tests else None
+    candidate_coder = create_candidate_coder(llm) if candidates > 1 else None
+    app = create_workflow(*create_agents(llm), spec_tester=spec_tester,
+                          candidate_coder=candidate_coder, candidates=candidates)
+    requirements = [entry["requirement"] for entry in corpus] * repeat
+
+    def run_one(requirement):
+        # The response cache would turn every repeat into a hit; measure the real pipeline
+        config = {"recursion_limit": 50, "callbacks": [MetricsCallbackHandler()],
+                  "configurable": {"cache_bypass": True}}
+        start = time.perf_counter()
+        with track_run() as run:
+            state = app.invoke({"requirement": requirement}, config=config)
+        return time.perf_counter() - start, state, run
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(run_one, requirements))
+    elapsed = time.perf_counter() - start
+
+    node_durations = {}
+    for _, _, run in outcomes:
+        for span in run.spans:
+            node_durations.setdefault(span["node"], []).append(span["duration"])
+    run_durations = [duration for duration, _, _ in outcomes]
+    return {
+        "runs": len(outcomes),
+        "concurrency": concurrency,
+        "llm_latency": latency,
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(outcomes) / elapsed, 3),
+        "run_p50": round(percentile(run_durations, 50), 4),
+        "run_p95": round(percentile(run_durations, 95), 4),
+        "run_p99": round(percentile(run_durations, 99), 4),
+        "nodes": {
+            node: {
+                "calls": len(durations),
+                "p50": round(percentile(durations, 50), 4),
+                "p95": round(percentile(durations, 95), 4),
+                "p99": round(percentile(durations, 99), 4),
+            }
+            for node, durations in sorted(node_durations.items())
+        },
+        "retry_loops": sum(state.get("retry_count", 0) for _, state, _ in outcomes),
+        "passed": sum(bool(state.get("success")) for _, state, _ in outcomes),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+def compare(report, baseline, tolerance):
+    """List of human-readable regressions beyond ``tolerance`` (a fraction)"""
+    regressions = []
+    for name, higher_is_better in COMPARED.items():
+        old, new = baseline.get(name), report.get(name)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append(f"{name}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline workflow benchmark with a replayed LLM")
+    parser.add_argument("--corpus", default=os.path.join(BENCH_DIR, "corpus.jsonl"))
+    parser.add_argument("--recordings", help="JSONL of recorded responses written by RecordingHandler")
+    parser.add_argument("--baseline", default=os.path.join(BENCH_DIR, "baseline.json"))
+    parser.add_argument("--repeat", type=int, default=3, help="Times to run each corpus requirement")
+    parser.add_argument("-c", "--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per LLM call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- seconds added to each call")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression as a fraction")
+    parser.add_argument("--parallel-tests", action="store_true", help="Use the parallel programmer/tester topology")
+    parser.add_argument("--candidates", type=int, default=1, help="Best-of-N candidates per requirement")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    # Per-call JSON logs would drown the report
+    logging.getLogger("dev_assistant.metrics").setLevel(logging.WARNING)
+    recordings = load_recordings(args.recordings) if args.recordings else None
+    report = run_benchmark(load_corpus(args.corpus), args.repeat, args.concurrency, args.latency, args.jitter,
+                           recordings, args.parallel_tests, args.candidates)
+    print(json.dumps(report, indent=2))
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against; run with --update-baseline to create one")
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if (baseline.get("concurrency"), baseline.get("llm_latency")) != (args.concurrency, args.latency):
+        print("Warning: baseline was recorded with different --concurrency/--latency settings")
+    regressions = compare(report, baseline, args.tolerance)
+    if regressions:
+        print("Performance regressions against baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("No regressions against baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Best-of-N code generation: sample candidates in parallel, race them on the tests"""
+import contextvars
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from agents import candidate_approach
+from harness import run_test_cases
+
+CANCEL_POLICIES = ("first_pass", "none")
+
+def generate_candidates(candidate_coder, requirement, n):
+    """Ask for ``n`` candidates concurrently; failed generations are dropped"""
+    inputs = [{'requirement': requirement, 'approach': candidate_approach(i)} for i in range(n)]
+    outputs = candidate_coder.batch(inputs, config={"max_concurrency": n}, return_exceptions=True)
+    codes = [output.code for output in outputs if not isinstance(output, Exception)]
+    print(f"Generated {len(codes)} of {n} candidates")
+    return codes
+
+def _cancelled(results):
+    return results is not None and any((r.error or "").startswith("CancelledError") for r in results)
+
+def race_candidates(candidates, inputs, outputs, cancel_policy="first_pass", pool=None):
+    """Run every candidate against the same tests concurrently
+
+    Returns ``(winner, results)`` where ``results`` maps candidate index
+    to its TestCaseResult list (None when no target function was found)
+    and ``winner`` is the index of the accepted candidate or None. With
+    ``first_pass`` the first candidate to pass wins and the others are
+    cancelled: runs still queued for a worker return at once and the
+    workers of runs in progress are killed and replaced, so the pool is
+    free for the next step. Cancelled candidates are left out of
+    ``results``. With ``none`` every candidate runs and the lowest
+    passing index wins.
+    """
+    if cancel_policy not in CANCEL_POLICIES:
+        raise ValueError(f"Unknown cancel policy {cancel_policy!r}, expected one of {CANCEL_POLICIES}")
+    results = {}
+    winner = None
+    cancels = [threading.Event() for _ in candidates]
+    executor = ThreadPoolExecutor(max_workers=len(candidates))
+    # Copy the context per task so metrics still attribute queue time to the executer span
+    futures = {
+        executor.submit(contextvars.copy_context().run, run_test_cases, code, inputs, outputs, pool,
+                        cancel=cancels[index]): index
+        for index, code in enumerate(candidates)
+    }
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    print(f"Candidate {index} could not be run: {e}")
+                    results[index] = None
+                passed = results[index] is not None and all(r.passed for r in results[index])
+                if passed and cancel_policy == "first_pass" and winner is None:
+                    winner = index
+            if winner is not None:
+                break
+        stopped = 0
+        if pending:
+            for future in pending:
+                cancels[futures[future]].set()
+            # Killed workers return straight away; wait so the losers hold no worker when this returns
+            for future in wait(pending).done:
+                index = futures[future]
+                outcome = None if future.exception() else future.result()
+                if _cancelled(outcome):
+                    stopped += 1
+                else:
+                    results[index] = outcome  # finished before the cancel reached it
+            print(f"Candidate {winner} passed first; stopped {stopped} candidates still running")
+    finally:
+        for cancel in cancels:
+            cancel.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    if winner is None:
+        passing = [i for i, r in results.items() if r is not None and all(case.passed for case in r)]
+        winner = min(passing) if passing else None
+    return winner, results
+
+class CandidateStats:
+    """Process-wide win counts so the value of N can be judged"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.solved = 0
+        self.wins_by_index = {}
+
+    def record(self, winner):
+        with self._lock:
+            self.runs += 1
+            if winner is not None:
+                self.solved += 1
+                self.wins_by_index[winner] = self.wins_by_index.get(winner, 0) + 1
+
+    def win_rate(self):
+        """Fraction of best-of-N rounds in which some candidate passed"""
+        with self._lock:
+            return self.solved / self.runs if self.runs else 0.0
+
+    def summary(self):
+        with self._lock:
+            wins = ", ".join(f"#{i}: {n}" for i, n in sorted(self.wins_by_index.items())) or "none"
+            rate = self.solved / self.runs if self.runs else 0.0
+            return f"Best-of-N win rate {rate:.0%} ({self.solved}/{self.runs} rounds); wins by candidate: {wins}"
+
+CANDIDATE_STATS = CandidateStats()
@@ -0,0 +1,78 @@
+"""Durable per-node checkpoints of the AgentCoder state, keyed by run id
+
+The compiled graph saves a checkpoint after every node into a local
+SQLite file. A run id is LangGraph's ``thread_id``: streaming ``None``
+with the same run id resumes an interrupted run from its last completed
+node, and adding a ``checkpoint_id`` branches from an earlier step
+without regenerating anything upstream of it.
+"""
+import os
+import sqlite3
+import threading
+import uuid
+from typing import Optional
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+_saver: Optional[SqliteSaver] = None
+_saver_lock = threading.Lock()
+
+def get_checkpointer():
+    """Return the process-wide SQLite checkpointer (CHECKPOINT_DB)"""
+    global _saver
+    with _saver_lock:
+        if _saver is None:
+            path = os.getenv("CHECKPOINT_DB") or ".cache/checkpoints.sqlite"
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            # SqliteSaver serialises access with its own lock, so one connection can serve every session
+            _saver = SqliteSaver(sqlite3.connect(path, check_same_thread=False))
+        return _saver
+
+def new_run_id():
+    return uuid.uuid4().hex[:12]
+
+def run_config(run_id, checkpoint_id=None, **config):
+    """Graph config addressing a run, or one checkpoint of it"""
+    configurable = {"thread_id": run_id}
+    if checkpoint_id:
+        configurable["checkpoint_id"] = checkpoint_id
+    return {"recursion_limit": 50, **config, "configurable": configurable}
+
+def _state(checkpoint):
+    """Workflow state held by a stored checkpoint, without LangGraph's internal channels"""
+    return {name: value for name, value in checkpoint["channel_values"].items()
+            if ":" not in name and not name.startswith("__")}
+
+def _due_nodes(checkpoint):
+    """Nodes still to run after a stored checkpoint; LangGraph keeps a ``branch:to:<node>`` trigger for each"""
+    return [name[len("branch:to:"):] for name in checkpoint["channel_values"] if name.startswith("branch:to:")]
+
+def run_status(run_id, saver=None):
+    """'new' when nothing is stored, 'interrupted' when nodes are still due, else 'completed'
+
+    Read from the checkpointer alone, so no graph (and no LLM client or
+    sandbox pool) is needed to answer it.
+    """
+    saved = (saver or get_checkpointer()).get_tuple(run_config(run_id))
+    if saved is None or not _state(saved.checkpoint):
+        return "new"
+    return "interrupted" if _due_nodes(saved.checkpoint) else "completed"
+
+def run_history(run_id, saver=None):
+    """Checkpoints of a run, newest first, as plain dicts for display"""
+    history = []
+    for saved in (saver or get_checkpointer()).list(run_config(run_id)):
+        step = (saved.metadata or {}).get("step", -1)
+        if step < 0:
+            continue  # the input checkpoint has no state to branch from
+        values = _state(saved.checkpoint)
+        history.append({
+            "checkpoint_id": saved.config["configurable"]["checkpoint_id"],
+            "step": step,
+            "next": _due_nodes(saved.checkpoint),
+            "created_at": saved.checkpoint["ts"],
+            "retry_count": values.get("retry_count", 0),
+            "success": values.get("success", False),
+        })
+    return history
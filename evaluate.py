@@ -0,0 +1,307 @@
+"""Evaluate the workflow on a benchmark dataset against reference tests
+
+    python evaluate.py HumanEval.jsonl -o runs/baseline.npz -c 8 -n 5 --k 1,5
+    python evaluate.py benchmarks/corpus.jsonl -o /tmp/replay.npz --replay   # offline, with the replay LLM
+    python evaluate.py --compare runs/baseline.npz runs/new-prompts.npz
+
+Datasets are JSONL in one of two forms:
+
+- HumanEval: ``task_id``, ``prompt``, ``test`` (defining ``check(candidate)``)
+  and ``entry_point``
+- test vectors: ``requirement`` and ``tests`` (``{"Input": [...], "Output": [...]}``),
+  optionally ``task_id``
+
+Each task is run through the workflow ``--samples`` times, at most
+``--concurrency`` runs at a time, and the final code is graded in the
+sandbox against the dataset's tests, not the ones the workflow wrote.
+Every graded sample is appended to ``<output>.progress.jsonl`` as it
+finishes; running again with the same output skips the samples already
+there, so an interrupted evaluation resumes where it stopped.
+
+The output is a compressed NumPy ``.npz`` with one column per field and
+one row per sample (task, sample, graded pass, the workflow's own verdict,
+latency, tokens, LLM calls, cost, retries), plus the summary: pass@k,
+tokens and cost per solved sample, latency percentiles and how often the
+workflow's own tests agreed with the reference tests.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from dotenv import load_dotenv
+
+from batch import build_app
+from benchmark import percentile
+from harness import MODULE_NAME, run_test_cases
+from metrics import MetricsCallbackHandler, track_run
+from sandbox import SandboxError, get_sandbox_pool
+
+# Columns of the results file and their NumPy types
+COLUMNS = {
+    "task_id": str,
+    "sample": np.int32,
+    "passed": np.bool_,
+    "workflow_success": np.bool_,
+    "latency": np.float32,
+    "prompt_tokens": np.int32,
+    "completion_tokens": np.int32,
+    "llm_calls": np.int32,
+    "cost": np.float32,
+    "retry_count": np.int32,
+}
+
+_IMPORT = re.compile(r"^(?:import|from) .*$", re.M)
+
+def load_tasks(path):
+    """Tasks of a HumanEval or test-vector JSONL dataset, with a ``requirement`` for the workflow"""
+    tasks = []
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(l for l in f if l.strip()):
+            task = json.loads(line)
+            task.setdefault("task_id", str(i))
+            if "prompt" in task and "test" in task:
+                task["requirement"] = (
+                    f"Complete the following Python function. Keep its name `{task['entry_point']}` "
+                    f"and signature.\n\n{task['prompt']}"
+                )
+            elif "requirement" not in task or "tests" not in task:
+                raise ValueError(f"Task {task['task_id']} has neither prompt/test nor requirement/tests")
+            tasks.append(task)
+    return tasks
+
+def grade(task, code, timeout=None):
+    """Whether ``code`` passes the task's reference tests, and why not"""
+    if not code:
+        return False, "no code was produced"
+    if "test" in task:
+        # The prompt's imports (typing and the like) are part of the task, not of the solution
+        imports = "\n".join(m.group(0) for m in _IMPORT.finditer(task["prompt"]))
+        program = f"{imports}\n{code}\n\n{task['test']}\n\ncheck({task['entry_point']})\n"
+        # Not __main__, so a demo block in the code cannot run ahead of the tests
+        try:
+            result = get_sandbox_pool().run(program, timeout or float(os.getenv("EVAL_GRADE_TIMEOUT") or 10),
+                                            module_name=MODULE_NAME)
+        except SandboxError as e:
+            return False, f"SandboxError: {e}"
+        return result.success, None if result.success else (result.error or "failed")
+    results = run_test_cases(code, task["tests"]["Input"], task["tests"]["Output"])
+    if results is None:
+        return False, "no function in the code matches the test inputs"
+    failed = [r for r in results if not r.passed]
+    return not failed, f"{len(failed)} of {len(results)} reference cases failed" if failed else None
+
+def pass_at_k(n, c, k):
+    """Unbiased estimate of the chance that at least one of ``k`` of ``n`` samples passes, ``c`` of which did"""
+    if n - c < k:
+        return 1.0
+    return 1.0 - math.comb(n - c, k) / math.comb(n, k)
+
+class Progress:
+    """Append-only log of graded samples, read back to resume an evaluation"""
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        self._partial_line = False
+        if os.path.dirname(path):
+            # Also the directory the results are written to
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                line = ""
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a line cut short by the crash
+                    self.records[(record["task_id"], record["sample"])] = record
+                # Start new records on a fresh line after one cut short
+                self._partial_line = bool(line) and not line.endswith("\n")
+
+    def done(self, task_id, sample):
+        return (task_id, sample) in self.records
+
+    def add(self, record):
+        self.records[(record["task_id"], record["sample"])] = record
+        with open(self.path, "a", encoding="utf-8") as f:
+            if self._partial_line:
+                f.write("\n")
+                self._partial_line = False
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+def _run_sample(app, task, sample, recursion_limit):
+    """Run the workflow once on ``task`` and grade its code"""
+    start = time.perf_counter()
+    record = {"task_id": task["task_id"], "sample": sample}
+    # Samples must not be answered from the response cache, or repeats (and earlier sessions) count as passes
+    config = {"recursion_limit": recursion_limit, "callbacks": [MetricsCallbackHandler()],
+              "configurable": {"cache_bypass": True}}
+    state = {}
+    try:
+        with track_run() as run:
+            state = app.invoke({"requirement": task["requirement"]}, config=config)
+        totals = run.totals()
+    except Exception as e:
+        totals = run.totals()
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["latency"] = time.perf_counter() - start
+    passed, reason = grade(task, state.get("code"))
+    record.update({
+        "passed": passed,
+        "workflow_success": bool(state.get("success")),
+        "prompt_tokens": totals["prompt_tokens"],
+        "completion_tokens": totals["completion_tokens"],
+        "llm_calls": totals["llm_calls"],
+        "cost": totals["cost"],
+        "retry_count": state.get("retry_count", 0),
+        "grade_error": reason,
+        "code": state.get("code"),
+    })
+    return record
+
+async def run_evaluation(tasks, output_path, samples=1, concurrency=4, ks=(1,), app=None, recursion_limit=50):
+    """Run every task ``samples`` times, grade the code and write the results file; returns the summary"""
+    app = app or build_app()
+    progress = Progress(output_path + ".progress.jsonl")
+    pending = [(task, s) for task in tasks for s in range(samples) if not progress.done(task["task_id"], s)]
+    if len(pending) < len(tasks) * samples:
+        print(f"Resuming: {len(tasks) * samples - len(pending)} samples already graded in {progress.path}")
+    loop = asyncio.get_running_loop()
+    # The graph and the grader are synchronous: each sample runs on a thread of its own, ``concurrency`` at a time
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        runs = [loop.run_in_executor(executor, _run_sample, app, task, s, recursion_limit) for task, s in pending]
+        for finished, run in enumerate(asyncio.as_completed(runs), 1):
+            record = await run
+            progress.add(record)
+            print(f"[{finished}/{len(runs)}] {record['task_id']} sample {record['sample']}: "
+                  f"{'passed' if record['passed'] else 'failed'} in {record['latency']:.1f}s")
+
+    task_ids = {task["task_id"] for task in tasks}
+    records = [r for r in progress.records.values() if r["task_id"] in task_ids and r["sample"] < samples]
+    summary = summarise(records, ks)
+    write_results(output_path, records, summary)
+    print(json.dumps(summary, indent=2))
+    print(f"Results written to {output_path}")
+    return summary
+
+def summarise(records, ks=(1,)):
+    """pass@k, cost per solved sample, latency percentiles and self-test agreement"""
+    by_task = {}
+    for r in records:
+        by_task.setdefault(r["task_id"], []).append(r["passed"])
+    n_min = min((len(v) for v in by_task.values()), default=0)
+    solved = sum(r["passed"] for r in records)
+    tokens = sum(r["prompt_tokens"] + r["completion_tokens"] for r in records)
+    latencies = [r["latency"] for r in records]
+    false_passes = sum(r["workflow_success"] and not r["passed"] for r in records)
+    return {
+        "tasks": len(by_task),
+        "samples": len(records),
+        "pass_at_k": {
+            f"pass@{k}": round(sum(pass_at_k(len(v), sum(v), k) for v in by_task.values()) / len(by_task), 4)
+            for k in ks if by_task and k <= n_min
+        },
+        "solved_tasks": sum(any(v) for v in by_task.values()),
+        "tokens": tokens,
+        "tokens_per_solve": round(tokens / solved, 1) if solved else None,
+        "cost": round(sum(r["cost"] for r in records), 4),
+        "cost_per_solve": round(sum(r["cost"] for r in records) / solved, 5) if solved else None,
+        "latency": {
+            **{f"p{p}": round(percentile(latencies, p), 3) for p in (50, 90, 95, 99)},
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "max": round(max(latencies, default=0.0), 3),
+        },
+        # The workflow's own tests passed code the reference tests reject
+        "false_pass_rate": round(false_passes / len(records), 4) if records else None,
+        "self_test_agreement": round(sum(r["workflow_success"] == r["passed"] for r in records) / len(records), 4)
+                               if records else None,
+    }
+
+def write_results(path, records, summary):
+    records = sorted(records, key=lambda r: (r["task_id"], r["sample"]))
+    columns = {name: np.array([r[name] for r in records], dtype=dtype) for name, dtype in COLUMNS.items()}
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        np.savez_compressed(f, summary=np.array(json.dumps(summary)), **columns)
+
+def load_results(path):
+    """Columns and summary of a results file"""
+    with np.load(path, allow_pickle=False) as data:
+        columns = {name: data[name] for name in COLUMNS}
+        return columns, json.loads(str(data["summary"]))
+
+def _flatten(summary, prefix=""):
+    flat = {}
+    for key, value in summary.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+def compare_results(before_path, after_path):
+    """Print how the summary metrics and each task's pass rate changed between two results files"""
+    before, before_summary = load_results(before_path)
+    after, after_summary = load_results(after_path)
+    old, new = _flatten(before_summary), _flatten(after_summary)
+    for name in sorted(old.keys() | new.keys()):
+        a, b = old.get(name), new.get(name)
+        change = f" ({b - a:+.4g})" if isinstance(a, (int, float)) and isinstance(b, (int, float)) else ""
+        print(f"{name:28} {a!s:>12} -> {b!s:<12}{change}")
+
+    def pass_rates(columns):
+        rates = {}
+        for task_id in np.unique(columns["task_id"]):
+            rows = columns["task_id"] == task_id
+            rates[str(task_id)] = float(columns["passed"][rows].mean())
+        return rates
+
+    old_rates, new_rates = pass_rates(before), pass_rates(after)
+    changed = [(t, old_rates.get(t), new_rates.get(t)) for t in sorted(old_rates.keys() | new_rates.keys())
+               if old_rates.get(t) != new_rates.get(t)]
+    print(f"{len(changed)} tasks changed pass rate")
+    for task_id, a, b in changed:
+        print(f"  {task_id}: {a} -> {b}")
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Evaluate the workflow on a dataset with reference tests")
+    parser.add_argument("dataset", nargs="?", help="HumanEval or test-vector JSONL")
+    parser.add_argument("-o", "--output", default="eval_results.npz", help="Columnar results file (.npz)")
+    parser.add_argument("-c", "--concurrency", type=int, default=int(os.getenv("EVAL_CONCURRENCY") or 4))
+    parser.add_argument("-n", "--samples", type=int, default=1, help="Workflow runs per task")
+    parser.add_argument("--k", default="1", help="Comma-separated k values for pass@k (each at most --samples)")
+    parser.add_argument("--limit", type=int, help="Only evaluate the first N tasks")
+    parser.add_argument("--rpm", type=int, default=int(os.getenv("AZURE_OPENAI_RPM") or 0) or None)
+    parser.add_argument("--tpm", type=int, default=int(os.getenv("AZURE_OPENAI_TPM") or 0) or None)
+    parser.add_argument("--replay", action="store_true",
+                        help="Answer with the replay LLM from the dataset's canned code and tests (offline smoke run)")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Compare two results files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_results(*args.compare)
+        return
+    if not args.dataset:
+        parser.error("a dataset is required unless --compare is given")
+    tasks = load_tasks(args.dataset)[:args.limit]
+    llm = None
+    if args.replay:
+        from replay_llm import ReplayChatModel, load_corpus
+
+        llm = ReplayChatModel(corpus=load_corpus(args.dataset), latency=0.0)
+    app = build_app(args.rpm, args.tpm, llm=llm)
+    ks = [int(k) for k in args.k.split(",") if k.strip()]
+    asyncio.run(run_evaluation(tasks, args.output, args.samples, args.concurrency, ks, app=app))
+
+if __name__ == "__main__":
+    main()
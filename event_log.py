@@ -0,0 +1,143 @@
+"""Compact, bounded log of workflow events for the UI
+
+Node updates carry the whole state: every code version in full and the
+complete test vectors, repeated by each node that passes them along.
+``EventLog`` keeps a compact form of each update instead: code as a
+unified diff against the previous version, test vectors cut to their
+first few cases, long errors shortened and unchanged fields dropped. Only
+the latest full code and tests are kept, for on-demand expansion. Events
+live in a ring buffer of UI_EVENT_LOG_SIZE entries per session, and the
+log measures the bytes it renders and the memory it holds so servers can
+be sized for concurrent users.
+"""
+import difflib
+import json
+import os
+import sys
+from collections import deque
+
+def max_test_cases():
+    return int(os.getenv("UI_MAX_TEST_CASES") or 5)
+
+def max_text_chars():
+    return int(os.getenv("UI_MAX_TEXT_CHARS") or 2000)
+
+def payload_size(value):
+    """Bytes of ``value`` as JSON, roughly what reaches the browser when it is rendered"""
+    return len(json.dumps(value, default=str))
+
+def deep_size(value, seen=None):
+    """Memory held by ``value`` and everything it references, in bytes"""
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_size(item, seen) for item in value)
+    return size
+
+def shorten(text, limit=None):
+    """``text`` cut to ``limit`` characters, keeping the end where errors put the exception
+
+    Other values are returned as they are unless their JSON is over the
+    limit, in which case the shortened JSON is returned.
+    """
+    limit = limit or max_text_chars()
+    if not isinstance(text, str):
+        if text is None or isinstance(text, (bool, int, float)) or payload_size(text) <= limit:
+            return text
+        text = json.dumps(text, default=str)
+    if len(text) <= limit:
+        return text
+    return f"... [{len(text) - limit} characters trimmed]\n{text[-limit:]}"
+
+def code_diff(before, after):
+    """Unified diff between two code versions, or the code itself when there is no previous one"""
+    if not before:
+        return after
+    return "".join(difflib.unified_diff(
+        before.splitlines(keepends=True), after.splitlines(keepends=True), "before", "after", n=1,
+    ))
+
+def summarise_tests(tests, limit=None):
+    """The first ``limit`` test cases and the number left out"""
+    limit = limit or max_test_cases()
+    inputs, outputs = tests.get("input") or [], tests.get("output") or []
+    summary = {"cases": len(inputs), "input": inputs[:limit], "output": outputs[:limit]}
+    if len(inputs) > limit:
+        summary["hidden"] = len(inputs) - limit
+    return summary
+
+def summarise_results(results, limit=3):
+    """Pass count and the first failing cases of ``test_results``"""
+    failed = [r for r in results if not r.get("passed")]
+    return {
+        "passed": len(results) - len(failed),
+        "failed": len(failed),
+        "failures": [{key: shorten(value, 300) for key, value in r.items()} for r in failed[:limit]],
+    }
+
+class EventLog:
+    """Ring buffer of compact node updates for one session"""
+
+    def __init__(self, max_events=None):
+        self.events = deque(maxlen=max_events or int(os.getenv("UI_EVENT_LOG_SIZE") or 200))
+        self.code = None
+        self.tests = None
+        self.added = 0
+        self.bytes_rendered = 0
+        self.bytes_full = 0
+        self.summary = None
+
+    def compact(self, update):
+        """Compact form of a node update, tracking the latest code and tests"""
+        entry = {}
+        for key, value in (update or {}).items():
+            if key == "code":
+                if value and value != self.code:
+                    entry["code_diff"] = code_diff(self.code, value)
+                    self.code = value
+            elif key in ("tests", "spec_tests"):
+                if value and value != self.tests:
+                    entry[key] = summarise_tests(value)
+                    if key == "tests":
+                        self.tests = value
+            elif key == "test_results":
+                if value:
+                    entry[key] = summarise_results(value)
+            elif key == "candidates":
+                if value:
+                    entry[key] = f"{len(value)} candidates"
+            elif key in ("requirement", "code_hash"):
+                continue
+            else:
+                entry[key] = shorten(value)
+        return entry
+
+    def add(self, node, update):
+        """Record a node update and return its compact entry"""
+        entry = {"node": node, **self.compact(update)}
+        self.events.append(entry)
+        self.added += 1
+        self.bytes_full += payload_size(update)
+        self.bytes_rendered += payload_size(entry)
+        return entry
+
+    @property
+    def dropped(self):
+        return self.added - len(self.events)
+
+    def stats(self):
+        return {
+            "events": len(self.events),
+            "dropped": self.dropped,
+            "bytes_rendered": self.bytes_rendered,
+            "bytes_full": self.bytes_full,
+            "memory_bytes": deep_size(self),
+        }
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + deep_size(self.__dict__)
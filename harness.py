@@ -0,0 +1,369 @@
+import ast
+import hashlib
+import json
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from models import TestCaseResult
+from sandbox import SandboxError, get_sandbox_pool
+
+REL_TOL = 1e-6
+ABS_TOL = 1e-9
+
+def _arity(func: ast.FunctionDef):
+    """(required, maximum) positional arguments; maximum is None for *args"""
+    args = func.args
+    positional = args.posonlyargs + args.args
+    if positional and positional[0].arg in ("self", "cls"):
+        positional = positional[1:]
+    required = len(positional) - len(args.defaults)
+    return required, None if args.vararg else len(positional)
+
+def accepts(func: ast.FunctionDef, n_args):
+    required, maximum = _arity(func)
+    return required <= n_args and (maximum is None or n_args <= maximum)
+
+def find_target_function(code, n_args=None) -> Optional[str]:
+    """Pick the function the tests should call
+
+    Prefers public top-level functions that no other function calls (the
+    entry point rather than a helper) and, when ``n_args`` is given, whose
+    signature accepts a test row either unpacked or as a single argument.
+    The last matching definition wins. Returns None when nothing fits.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    functions = [
+        node for node in tree.body
+        if isinstance(node, ast.FunctionDef) and not node.name.startswith(("_", "test")) and node.name != "main"
+    ]
+    if not functions:
+        return None
+    if n_args is not None:
+        functions = [f for f in functions if accepts(f, n_args) or accepts(f, 1)] or functions
+
+    called = {
+        node.func.id
+        for f in functions
+        for node in ast.walk(f)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id != f.name
+    }
+    roots = [f for f in functions if f.name not in called] or functions
+    return roots[-1].name
+
+def signature_matches(code, inputs):
+    """True when the code has a target function that accepts every test row"""
+    if not inputs or not all(isinstance(row, list) for row in inputs):
+        return False
+    target = find_target_function(code, len(inputs[0]))
+    if target is None:
+        return False
+    func = next(node for node in ast.parse(code).body if isinstance(node, ast.FunctionDef) and node.name == target)
+    return all(accepts(func, len(row)) or accepts(func, 1) for row in inputs)
+
+# Runs inside the sandbox after the generated code and the constants set by
+# build_harness; fills __result__ with one dict per case
+_HARNESS = '''
+import copy as _copy
+import inspect as _inspect
+import json as _json
+import math as _math
+import signal as _signal
+import time as _time
+import tracemalloc as _tracemalloc
+
+def _normalise(value):
+    if isinstance(value, (tuple, list)):
+        return [_normalise(v) for v in value]
+    if isinstance(value, dict):
+        return {str(k): _normalise(v) for k, v in value.items()}
+    return value
+
+def _matches(actual, expected):
+    if isinstance(actual, bool) or isinstance(expected, bool):
+        return actual == expected
+    if isinstance(actual, (int, float)) and isinstance(expected, (int, float)):
+        return _math.isclose(actual, expected, rel_tol=_REL_TOL, abs_tol=_ABS_TOL)
+    if isinstance(actual, list) and isinstance(expected, list):
+        return len(actual) == len(expected) and all(_matches(a, e) for a, e in zip(actual, expected))
+    if isinstance(actual, dict) and isinstance(expected, dict):
+        return actual.keys() == expected.keys() and all(_matches(actual[k], expected[k]) for k in actual)
+    return actual == expected
+
+def _encode(value):
+    try:
+        _json.dumps(value)
+        return value
+    except (TypeError, ValueError):
+        return repr(value)
+
+def _call(func, row):
+    try:
+        _inspect.signature(func).bind(*row)
+    except TypeError:
+        return func(row)
+    except ValueError:  # builtins without a signature
+        pass
+    return func(*row)
+
+class _CaseTimeout(BaseException):
+    """Raised by the alarm; a BaseException so ``except Exception`` in the code cannot swallow it"""
+
+def _on_alarm(signum, frame):
+    raise _CaseTimeout()
+
+# SIGALRM is Unix-only; elsewhere the sandbox's wall-clock limit for the whole run still applies
+_ALARM = _CASE_TIMEOUT > 0 and hasattr(_signal, "setitimer")
+if _ALARM:
+    _previous_handler = _signal.signal(_signal.SIGALRM, _on_alarm)
+if _TRACE_MEMORY:
+    _tracemalloc.start()
+
+_results = []
+try:
+    for _i, _row, _expected in _json.loads(_CASES):
+        _expected = _expected[0] if isinstance(_expected, list) and len(_expected) == 1 else _expected
+        _case = {"index": _i, "input": _row, "expected": _expected, "actual": None, "passed": False, "error": None,
+                 "duration": None, "peak_memory_kb": None, "timed_out": False}
+        if _TRACE_MEMORY:
+            _tracemalloc.reset_peak()
+            _baseline = _tracemalloc.get_traced_memory()[0]
+        _start = _time.perf_counter()
+        try:
+            try:
+                if _ALARM:
+                    _signal.setitimer(_signal.ITIMER_REAL, _CASE_TIMEOUT)
+                _actual = _normalise(_call(_TARGET, _copy.deepcopy(_row)))
+            finally:
+                if _ALARM:
+                    _signal.setitimer(_signal.ITIMER_REAL, 0)
+            _case["actual"] = _encode(_actual)
+            _case["passed"] = _matches(_actual, _normalise(_expected))
+        except _CaseTimeout:
+            _case["timed_out"] = True
+            _case["error"] = f"TimeoutError: test case exceeded {_CASE_TIMEOUT}s"
+        except Exception as _e:
+            _case["error"] = f"{type(_e).__name__}: {_e}"
+        _case["duration"] = round(_time.perf_counter() - _start, 6)
+        if _TRACE_MEMORY:
+            _case["peak_memory_kb"] = round(max(0, _tracemalloc.get_traced_memory()[1] - _baseline) / 1024, 1)
+        _results.append(_case)
+        if _STOP_ON_FAILURE and not _case["passed"]:
+            break
+finally:
+    if _ALARM:
+        _signal.signal(_signal.SIGALRM, _previous_handler)
+    if _TRACE_MEMORY:
+        _tracemalloc.stop()
+__result__ = _results
+'''
+
+# Module name the generated code runs under when it is tested
+MODULE_NAME = "solution"
+
+# Seconds a sandbox run gets on top of its cases' timeouts, to import and define the code
+SHARD_OVERHEAD = 2.0
+
+def case_timeout():
+    """Seconds each test case may run; 0 leaves only the sandbox's limit for the whole run"""
+    return float(os.getenv("TEST_CASE_TIMEOUT") or 2.0)
+
+def trace_memory():
+    """Whether the harness measures each case's peak memory with tracemalloc (slows allocation-heavy code)"""
+    return (os.getenv("TEST_TRACE_MEMORY") or "1") not in ("0", "false", "no")
+
+def build_harness(code, target, inputs, outputs, indices=None, stop_on_failure=False):
+    """Append a harness that calls ``target`` on the selected input rows to ``code``
+
+    Cases run in the order of ``indices`` (all of them by default); with
+    ``stop_on_failure`` the harness stops after the first failing case.
+    """
+    if indices is None:
+        indices = range(len(inputs))
+    cases = [[i, inputs[i], outputs[i]] for i in indices]
+    constants = (
+        f"_TARGET = {target}\n"
+        f"_CASES = {json.dumps(cases)!r}\n"
+        f"_STOP_ON_FAILURE = {bool(stop_on_failure)!r}\n"
+        f"_CASE_TIMEOUT = {case_timeout()!r}\n"
+        f"_TRACE_MEMORY = {trace_memory()!r}\n"
+        f"_REL_TOL = {REL_TOL!r}\n"
+        f"_ABS_TOL = {ABS_TOL!r}\n"
+    )
+    return code + "\n\n" + constants + _HARNESS
+
+def _n_args(inputs):
+    return len(inputs[0]) if inputs and isinstance(inputs[0], list) else None
+
+def _shards(indices, workers):
+    """Split cases round-robin over up to ``workers`` sandbox runs of at least TEST_SHARD_MIN_CASES cases"""
+    min_cases = int(os.getenv("TEST_SHARD_MIN_CASES") or 4)
+    count = max(1, min(workers, len(indices) // max(1, min_cases)))
+    return [indices[i::count] for i in range(count)]
+
+def _parallel(fn, items, workers):
+    if len(items) == 1:
+        return [fn(items[0])]
+    with ThreadPoolExecutor(max_workers=min(len(items), workers)) as executor:
+        return list(executor.map(fn, items))
+
+def shard_limits(pool, cases):
+    """Wall-clock and CPU seconds for a sandbox run of ``cases`` test cases
+
+    Enough for every case to use its full TEST_CASE_TIMEOUT, so the per-case
+    alarm ends a slow case rather than the sandbox ending the whole run;
+    never less than the pool's own limits.
+    """
+    timeout = max(pool.timeout, cases * case_timeout() + SHARD_OVERHEAD)
+    return timeout, max(pool.cpu_seconds, math.ceil(timeout))
+
+def _run_shard(code, target, inputs, outputs, pool, shard, stop_on_failure=False, cancel=None) -> List[TestCaseResult]:
+    timeout, cpu_seconds = shard_limits(pool, len(shard))
+    try:
+        # Not as __main__, so a demo block under `if __name__ == "__main__":` does not run before the tests
+        result = pool.run(build_harness(code, target, inputs, outputs, shard, stop_on_failure), timeout,
+                          module_name=MODULE_NAME, cpu_seconds=cpu_seconds, cancel=cancel)
+    except SandboxError as e:
+        # No worker to run on: isolating the cases would only wait again
+        return [TestCaseResult(index=i, input=inputs[i], expected=outputs[i], passed=False, error=f"SandboxError: {e}")
+                for i in shard]
+    if result.success and isinstance(result.result, list):
+        return [TestCaseResult(**case) for case in result.result]
+    crashed = result.timed_out or (result.error or "").startswith("SandboxError")
+    if crashed and len(shard) > 1:
+        # A case hung beyond the alarm or killed the worker: run each case alone so the others still report
+        print(f"Sandbox run of {len(shard)} test cases failed ({result.error}); isolating each case")
+        run_one = lambda i: _run_shard(code, target, inputs, outputs, pool, [i], cancel=cancel)
+        return [r for part in _parallel(run_one, shard, pool.size) for r in part]
+    # The module itself failed (syntax error, import error), the single case crashed or the run was cancelled:
+    # every case fails with it
+    error = result.error or "Harness produced no results"
+    return [
+        TestCaseResult(index=i, input=inputs[i], expected=outputs[i], passed=False, error=error,
+                       duration=result.duration if len(shard) == 1 else None, timed_out=result.timed_out)
+        for i in shard
+    ]
+
+def run_test_cases(code, inputs, outputs, pool=None, indices=None,
+                   stop_on_failure=False, cancel=None) -> Optional[List[TestCaseResult]]:
+    """Run test cases against the generated code in the sandbox
+
+    Cases are spread over the pool's workers and run in parallel, each
+    under its own TEST_CASE_TIMEOUT with its runtime and peak memory
+    recorded. With ``stop_on_failure`` they run in order in one worker
+    and stop at the first failure. Setting the ``cancel`` event stops
+    the runs still waiting or in progress; their cases fail with a
+    CancelledError. Returns one TestCaseResult per case
+    that ran (every case, or those in ``indices``) in the order given, or
+    None when no function in the code can be matched to the test inputs.
+    """
+    target = find_target_function(code, _n_args(inputs))
+    if target is None:
+        return None
+    if indices is None:
+        indices = list(range(len(inputs)))
+    if not indices:
+        return []
+    pool = pool or get_sandbox_pool()
+    if stop_on_failure:
+        return _run_shard(code, target, inputs, outputs, pool, list(indices), stop_on_failure, cancel)
+    run = lambda shard: _run_shard(code, target, inputs, outputs, pool, shard, cancel=cancel)
+    position = {index: n for n, index in enumerate(indices)}
+    results = [r for part in _parallel(run, _shards(list(indices), pool.size), pool.size) for r in part]
+    return sorted(results, key=lambda r: position[r.index])
+
+def code_hash(code, inputs) -> Optional[str]:
+    """Hash of the AST the tests actually exercise
+
+    Covers the target function, the top-level functions it reaches by
+    name and every top-level statement that is not a function (imports,
+    constants, classes). Formatting, comments and edits to unreachable
+    helpers do not change it. None when the code does not parse or has
+    no target function.
+    """
+    target = find_target_function(code, _n_args(inputs))
+    if target is None:
+        return None
+    tree = ast.parse(code)
+    functions = {node.name: node for node in tree.body if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))}
+    reached, pending = set(), [target]
+    while pending:
+        name = pending.pop()
+        if name in reached or name not in functions:
+            continue
+        reached.add(name)
+        pending.extend(node.id for node in ast.walk(functions[name]) if isinstance(node, ast.Name))
+    parts = [ast.dump(node) for node in tree.body if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))]
+    parts += [ast.dump(functions[name]) for name in sorted(reached)]
+    parts.append(f"target={target}")
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+def revalidate(code, inputs, outputs, previous: List[TestCaseResult],
+               pool=None) -> Optional[List[TestCaseResult]]:
+    """Re-run tests after a fix, starting with the cases that failed before
+
+    The previously failing cases run first and stop at the first failure,
+    which is all the debugger needs for its next attempt. Only when they
+    all pass are the previously passing cases run to catch regressions.
+    Cases that were not run keep their previous result marked ``stale``,
+    so the returned list always has one entry per test case in index order.
+    """
+    failing = [r.index for r in previous if not r.passed]
+    merged = {r.index: r.model_copy(update={"stale": True}) for r in previous}
+    first = run_test_cases(code, inputs, outputs, pool, indices=failing, stop_on_failure=True)
+    if first is None:
+        return None
+    merged.update((r.index, r) for r in first)
+    ran = len(first)
+    if all(r.passed for r in first):
+        passing = [r.index for r in previous if r.passed]
+        rest = run_test_cases(code, inputs, outputs, pool, indices=passing) or []
+        merged.update((r.index, r) for r in rest)
+        ran += len(rest)
+    print(f"Re-validated {ran} of {len(inputs)} test cases ({len(failing)} previously failing ran first)")
+    return [merged[i] for i in sorted(merged)]
+
+def _brief(value, limit=200):
+    text = repr(value)
+    return text if len(text) <= limit else f"{text[:limit]}... ({len(text)} chars)"
+
+def summarise_failures(results: List[TestCaseResult], limit=5):
+    """Aggregated report of a test run for the debugger prompt
+
+    Counts of failing and timed-out cases, each failing case with its
+    input, expected and actual value or error, and the slowest and most
+    memory-hungry cases, so performance problems are visible too. Stale
+    cases, not re-run since an earlier fix, are only counted.
+    """
+    fresh = [r for r in results if not r.stale]
+    failures = [r for r in fresh if not r.passed]
+    timed_out = sum(r.timed_out for r in fresh)
+    header = f"{len(failures)} of {len(fresh)} test cases failed"
+    if timed_out:
+        header += f" ({timed_out} timed out after {case_timeout()}s)"
+    if len(fresh) < len(results):
+        header += f"; {len(results) - len(fresh)} not re-run yet"
+    lines = [header]
+    for r in failures[:limit]:
+        took = f" after {r.duration:.3f}s" if r.duration is not None else ""
+        if r.error:
+            lines.append(f"- case {r.index}: input={_brief(r.input)} raised {r.error}{took}")
+        else:
+            lines.append(f"- case {r.index}: input={_brief(r.input)} expected={_brief(r.expected)} "
+                         f"got={_brief(r.actual)}")
+    if len(failures) > limit:
+        lines.append(f"- ... {len(failures) - limit} more")
+    timed = [r for r in fresh if r.duration is not None]
+    if timed:
+        slowest = max(timed, key=lambda r: r.duration)
+        lines.append(f"Slowest case {slowest.index}: {slowest.duration:.3f}s; "
+                     f"all cases {sum(r.duration for r in timed):.3f}s")
+    measured = [r for r in fresh if r.peak_memory_kb is not None]
+    if measured:
+        largest = max(measured, key=lambda r: r.peak_memory_kb)
+        lines.append(f"Peak memory: {largest.peak_memory_kb:.0f} KB in case {largest.index}")
+    return "\n".join(lines)
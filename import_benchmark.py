@@ -0,0 +1,109 @@
+"""Import-time benchmark of the Streamlit entry point
+
+    python import_benchmark.py                   # profile `import app` and check the budget
+    python import_benchmark.py --module batch    # profile another entry point
+    python import_benchmark.py --update-profile  # store this run in benchmarks/import_profile.json
+
+Imports the module in fresh interpreters with ``-X importtime`` and
+reports the median wall time, peak RSS and the slowest imports made
+by the module. Exits with status 1 when the median exceeds ``--budget``
+seconds, so heavy imports creeping back onto the start-up path are
+caught.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+
+# Runs in the child interpreter; reports wall time and peak RSS of the import alone
+_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+print(json.dumps({{"seconds": elapsed, "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor}}))
+"""
+
+def parse_importtime(stderr, module):
+    """Imports made directly by ``module`` as {package: cumulative seconds}
+
+    ``-X importtime`` indents each name by two spaces per nesting level and
+    prints a module after everything it imports, so ``module``'s own
+    imports are the depth 1 entries just before its depth 0 line. Depth 1
+    entries under other top-level imports (interpreter start-up, the
+    probe's own imports) are not counted. Cumulative times include
+    everything an import pulls in.
+    """
+    pending = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == module:
+                return pending
+            pending = {}
+        elif depth == 1:
+            pending[name.strip()] = int(cumulative) / 1e6
+    return {}
+
+def profile_import(module, cwd):
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module)],
+        cwd=cwd, capture_output=True, text=True, check=True,
+    )
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    report["modules"] = parse_importtime(completed.stderr, module)
+    return report
+
+def run_profile(module="app", runs=5, top=10, cwd=None):
+    """Median wall time and RSS over ``runs`` cold imports, plus the slowest imports of the last one"""
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+    reports = [profile_import(module, cwd) for _ in range(runs)]
+    slowest = sorted(reports[-1]["modules"].items(), key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "module": module,
+        "runs": runs,
+        "seconds_p50": round(statistics.median(r["seconds"] for r in reports), 4),
+        "seconds_max": round(max(r["seconds"] for r in reports), 4),
+        "rss_mb": round(statistics.median(r["rss_mb"] for r in reports), 1),
+        "slowest_imports": {name: round(seconds, 4) for name, seconds in slowest},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold import time and memory of an entry point")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest direct imports to list")
+    parser.add_argument("--budget", type=float, default=1.0, help="Maximum median import time in seconds")
+    parser.add_argument("--profile", default=os.path.join(BENCH_DIR, "import_profile.json"))
+    parser.add_argument("--update-profile", action="store_true")
+    args = parser.parse_args()
+
+    report = run_profile(args.module, args.runs, args.top)
+    print(json.dumps(report, indent=2))
+
+    if args.update_profile:
+        with open(args.profile, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"Profile written to {args.profile}")
+    elif os.path.exists(args.profile):
+        with open(args.profile, encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored.get("module") == args.module:
+            print(f"Stored profile: {stored['seconds_p50']}s, {stored['rss_mb']} MB")
+
+    if report["seconds_p50"] > args.budget:
+        print(f"Import of {args.module} takes {report['seconds_p50']}s, over the {args.budget}s budget")
+        sys.exit(1)
+    print(f"Import of {args.module} is within the {args.budget}s budget")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""Route LLM calls across several Azure OpenAI deployments
+
+Deployments come from LLM_DEPLOYMENTS (a JSON list) or the JSON file
+named by LLM_DEPLOYMENTS_FILE::
+
+    [{"name": "east-gpt4", "model": "gpt-4", "endpoint": "https://east.openai.azure.com",
+      "deployment": "gpt-4-1106-preview", "tpm": 80000, "rpm": 480},
+     {"name": "east-gpt35", "model": "gpt-35", "deployment": "gpt-35-turbo", "tpm": 240000}]
+
+``endpoint``, ``api_key`` and ``api_version`` default to the
+AZURE_OPENAI_* variables and ``model`` to the deployment name.
+LLM_ROLE_MODELS maps agent roles (coder, tester, execution, refine) to
+models, e.g. ``{"tester": "gpt-35", "default": "gpt-4"}``; a role with
+no entry uses ``default``, or every deployment when that is unset too.
+
+Each call goes to the healthy deployment of its model with the least
+load under LLM_ROUTER_POLICY: ``tokens`` (outstanding tokens against the
+deployment's TPM quota, the default) or ``latency`` (moving average of
+recent calls). A 429, 5xx or connection error puts the deployment in a
+cool-down and the call moves on to the next one. Deployments on the
+same endpoint share one keep-alive HTTP client.
+"""
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+
+from metrics import add_queue_time
+from rate_limit import RateLimiter, is_rate_limit_error, retry_after
+from token_budget import count_tokens
+
+POLICIES = ("tokens", "latency")
+
+# Capacity assumed for deployments configured without a TPM quota
+DEFAULT_TPM = 100000
+
+_clients: Dict[str, httpx.Client] = {}
+_clients_lock = threading.Lock()
+
+def shared_http_client(endpoint):
+    """One pooled keep-alive client per endpoint, shared by all its deployments"""
+    with _clients_lock:
+        if endpoint not in _clients:
+            connections = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS") or 20)
+            _clients[endpoint] = httpx.Client(
+                limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections),
+                timeout=httpx.Timeout(float(os.getenv("LLM_HTTP_TIMEOUT") or 120), connect=10.0),
+            )
+        return _clients[endpoint]
+
+def should_fail_over(error):
+    """429s, server errors and connection failures are worth another deployment"""
+    status = getattr(error, "status_code", None)
+    if is_rate_limit_error(error) or (status is not None and status >= 500):
+        return True
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout")
+
+class Backend:
+    """One deployment with its quota, load and health"""
+
+    def __init__(self, name, model, llm, limiter: RateLimiter):
+        self.name = name
+        self.model = model
+        self.llm = llm
+        self.limiter = limiter
+        self.outstanding = 0
+        self.latency: Optional[float] = None
+        self.calls = 0
+        self.errors = 0
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self._lock = threading.Lock()
+
+    def healthy(self, now):
+        return now >= self.cooldown_until
+
+    def load(self, tokens):
+        """Outstanding tokens, including this call, as a fraction of the TPM quota"""
+        return (self.outstanding + tokens) / (self.limiter.tpm or DEFAULT_TPM)
+
+    def start(self, tokens):
+        with self._lock:
+            self.outstanding += tokens
+            self.calls += 1
+
+    def finish(self, tokens, seconds=None, error=None):
+        with self._lock:
+            self.outstanding -= tokens
+            if error is None:
+                self.failures = 0
+                if seconds is not None:
+                    # Exponential moving average so one slow call does not dominate
+                    self.latency = seconds if self.latency is None else 0.8 * self.latency + 0.2 * seconds
+                return
+            self.errors += 1
+            self.failures += 1
+            cooldown = retry_after(error) or min(60.0, 2.0 ** self.failures)
+            self.cooldown_until = time.monotonic() + cooldown
+
+    def stats(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "model": self.model,
+                "outstanding_tokens": self.outstanding,
+                "latency": self.latency,
+                "calls": self.calls,
+                "errors": self.errors,
+                "cooling_down": not self.healthy(time.monotonic()),
+            }
+
+class RouterChatModel(BaseChatModel):
+    """Chat model that spreads calls over deployments and fails over between them
+
+    ``for_role`` returns a view restricted to the model mapped to an agent
+    role; views share the same backends, so load and health are global.
+    """
+
+    backends: List[Any]
+    role_models: Dict[str, str] = {}
+    role: Optional[str] = None
+    policy: str = "tokens"
+    temperature: float = 0.0
+    max_tokens: int = 4096
+
+    @property
+    def _llm_type(self) -> str:
+        return "azure-openai-router"
+
+    @property
+    def model_name(self):
+        """The model this view routes to; part of the response cache key"""
+        return self.role_models.get(self.role) or self.role_models.get("default") or "router"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"role": self.role, "model": self.model_name, "backends": [b.name for b in self.backends]}
+
+    def for_role(self, role):
+        return self.model_copy(update={"role": role})
+
+    def _pool(self):
+        model = self.role_models.get(self.role) or self.role_models.get("default")
+        pool = [b for b in self.backends if model is None or b.model == model]
+        if not pool:
+            raise ValueError(f"No deployment serves model {model!r} for role {self.role!r}")
+        return pool
+
+    def _ranked(self, tokens):
+        """Healthy deployments, best first; if all are cooling down, the one that recovers first"""
+        now = time.monotonic()
+        pool = self._pool()
+        healthy = [b for b in pool if b.healthy(now)]
+        if not healthy:
+            return sorted(pool, key=lambda b: b.cooldown_until)[:1]
+        if self.policy == "latency":
+            # Unmeasured deployments go first so every one gets a latency sample
+            key = lambda b: (b.limiter.wait_time(tokens) > 0, b.latency or 0.0, b.load(tokens))
+        else:
+            key = lambda b: (b.limiter.wait_time(tokens) > 0, b.load(tokens), b.latency or 0.0)
+        return sorted(healthy, key=key)
+
+    def _estimate(self, messages, kwargs):
+        prompt = "\n".join(str(m.content) for m in messages)
+        return count_tokens(prompt) + (kwargs.get("max_tokens") or self.max_tokens)
+
+    def _acquire(self, backend, tokens):
+        handle, waited = backend.limiter.acquire(tokens)
+        add_queue_time(waited)
+        backend.start(tokens)
+        return handle, time.perf_counter()
+
+    def _failed(self, backend, tokens, error):
+        if not should_fail_over(error):
+            # The request was bad, not the deployment
+            backend.finish(tokens)
+            raise error
+        backend.finish(tokens, error=error)
+        status = getattr(error, "status_code", None)
+        print(f"Deployment {backend.name} failed ({type(error).__name__}{f' {status}' if status else ''}); failing over")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        tokens = self._estimate(messages, kwargs)
+        error = None
+        for backend in self._ranked(tokens):
+            handle, start = self._acquire(backend, tokens)
+            try:
+                result = backend.llm._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                self._failed(backend, tokens, e)
+                error = e
+                continue
+            backend.finish(tokens, time.perf_counter() - start)
+            usage = (result.llm_output or {}).get("token_usage") or {}
+            if usage.get("total_tokens"):
+                backend.limiter.adjust(handle, usage["total_tokens"])
+            return result
+        raise error
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        tokens = self._estimate(messages, kwargs)
+        error = None
+        for backend in self._ranked(tokens):
+            _, start = self._acquire(backend, tokens)
+            chunks = backend.llm._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            try:
+                # Connection and status errors surface on the first chunk; after that we are committed
+                first = next(chunks)
+            except StopIteration:
+                backend.finish(tokens, time.perf_counter() - start)
+                return
+            except Exception as e:
+                self._failed(backend, tokens, e)
+                error = e
+                continue
+            failed = None
+            try:
+                yield first
+                yield from chunks
+            except Exception as e:
+                failed = e
+                raise
+            finally:
+                cool_down = failed is not None and should_fail_over(failed)
+                backend.finish(tokens, None if failed else time.perf_counter() - start, error=failed if cool_down else None)
+            return
+        raise error
+
+    def stats(self):
+        return [backend.stats() for backend in self.backends]
+
+def load_deployments():
+    """Deployment dicts from LLM_DEPLOYMENTS or LLM_DEPLOYMENTS_FILE; empty when neither is set"""
+    path = os.getenv("LLM_DEPLOYMENTS_FILE")
+    if path:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return json.loads(os.getenv("LLM_DEPLOYMENTS") or "[]")
+
+def create_router(deployments=None, temperature=0.0, max_tokens=4096):
+    """Build a RouterChatModel from deployment dicts (see the module docstring)"""
+    from langchain_openai import AzureChatOpenAI
+
+    backends = []
+    for entry in deployments if deployments is not None else load_deployments():
+        deployment = entry["deployment"]
+        endpoint = entry.get("endpoint") or os.getenv("AZURE_OPENAI_ENDPOINT")
+        llm = AzureChatOpenAI(
+            azure_endpoint=endpoint,
+            api_key=entry.get("api_key") or os.getenv("AZURE_OPENAI_API_KEY"),
+            openai_api_version=entry.get("api_version") or os.getenv("AZURE_OPENAI_API_VERSION", "2023-07-01-preview"),
+            azure_deployment=deployment,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            # The router fails over instead of retrying the same deployment
+            max_retries=0,
+            http_client=shared_http_client(endpoint),
+        )
+        limiter = RateLimiter(requests_per_minute=entry.get("rpm"), tokens_per_minute=entry.get("tpm"))
+        backends.append(Backend(entry.get("name") or deployment, entry.get("model") or deployment, llm, limiter))
+    policy = os.getenv("LLM_ROUTER_POLICY") or "tokens"
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown LLM_ROUTER_POLICY {policy!r}, expected one of {POLICIES}")
+    return RouterChatModel(
+        backends=backends,
+        role_models=json.loads(os.getenv("LLM_ROLE_MODELS") or "{}"),
+        policy=policy,
+        temperature=temperature,
+        max_tokens=max_tokens,
+    )
@@ -0,0 +1,355 @@
+"""Per-node and per-LLM-call instrumentation for workflow runs
+
+A run is tracked with ``track_run()``; inside it every instrumented node
+records a span (wall time, queue time, retry_count) and every LLM call
+records tokens, estimated cost and whether it was served from cache.
+Finished runs are emitted as JSON log lines and folded into process-wide
+counters that can be read in Prometheus text format.
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger("dev_assistant.metrics")
+
+def _configure_logger():
+    """Emit one JSON object per line to METRICS_LOG_FILE, or stderr when unset"""
+    if logger.handlers:
+        return
+    path = os.getenv("METRICS_LOG_FILE")
+    handler = logging.FileHandler(path) if path else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_configure_logger()
+
+# Upper bounds of the node latency histogram, in seconds
+LATENCY_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+def _price(name, default):
+    return float(os.getenv(name) or default)
+
+def estimate_cost(prompt_tokens, completion_tokens):
+    """Cost in USD from the per-1K token prices in the environment"""
+    return (prompt_tokens * _price("LLM_PROMPT_COST_PER_1K", 0.01)
+            + completion_tokens * _price("LLM_COMPLETION_COST_PER_1K", 0.03)) / 1000
+
+class RunMetrics:
+    """Spans and LLM calls recorded for one workflow run"""
+
+    def __init__(self, run_id=None):
+        self.run_id = run_id or uuid.uuid4().hex
+        self.started = time.time()
+        self.spans: List[Dict[str, Any]] = []
+        self.llm_calls: List[Dict[str, Any]] = []
+        self._last_end = time.perf_counter()
+        self._origin = self._last_end
+        self._lock = threading.Lock()
+
+    def offset(self, t):
+        return t - self._origin
+
+    def add_span(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def add_llm_call(self, call):
+        with self._lock:
+            self.llm_calls.append(call)
+
+    def totals(self):
+        calls = [c for c in self.llm_calls if not c["cache_hit"]]
+        return {
+            "wall_time": sum(s["duration"] for s in self.spans),
+            "llm_calls": len(calls),
+            "cache_hits": len(self.llm_calls) - len(calls),
+            "prompt_tokens": sum(c["prompt_tokens"] for c in calls),
+            "completion_tokens": sum(c["completion_tokens"] for c in calls),
+            "cost": sum(c["cost"] for c in calls),
+            "retry_count": max((s["retry_count"] or 0 for s in self.spans), default=0),
+        }
+
+    def timeline(self):
+        """One row per node span with its LLM usage, ordered by start time"""
+        rows = []
+        for span in sorted(self.spans, key=lambda s: s["start"]):
+            calls = [c for c in self.llm_calls if c["span_id"] == span["span_id"]]
+            rows.append({
+                "node": span["node"],
+                "start": round(span["start"], 3),
+                "end": round(span["start"] + span["duration"], 3),
+                "duration": round(span["duration"], 3),
+                "queue_time": round(span["queue_time"], 3),
+                "retry_count": span["retry_count"],
+                "prompt_tokens": sum(c["prompt_tokens"] for c in calls),
+                "completion_tokens": sum(c["completion_tokens"] for c in calls),
+                "cost": round(sum(c["cost"] for c in calls), 5),
+                "cache_hits": sum(c["cache_hit"] for c in calls),
+            })
+        return rows
+
+_current_run: contextvars.ContextVar[Optional[RunMetrics]] = contextvars.ContextVar("current_run", default=None)
+_current_span: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("current_span", default=None)
+
+def current_run() -> Optional[RunMetrics]:
+    return _current_run.get()
+
+@contextlib.contextmanager
+def track_run(run_id=None):
+    """Record metrics for the workflow run executed inside the block"""
+    run = RunMetrics(run_id)
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+        REGISTRY.observe_run(run)
+        logger.info(json.dumps({"event": "run", "run_id": run.run_id, **run.totals()}))
+
+def instrument_node(name, fn):
+    """Wrap a graph node so each call records a span on the current run"""
+    @functools.wraps(fn)
+    def wrapper(state, *args, **kwargs):
+        run = current_run()
+        if run is None:
+            return fn(state, *args, **kwargs)
+        start = time.perf_counter()
+        span = {
+            "span_id": uuid.uuid4().hex,
+            "node": name,
+            "start": run.offset(start),
+            # Time since the previous node finished: scheduling and state hand-off
+            "queue_time": max(0.0, start - run._last_end),
+            "duration": 0.0,
+            "retry_count": state.get("retry_count", 0),
+        }
+        token = _current_span.set(span)
+        try:
+            result = fn(state, *args, **kwargs)
+        finally:
+            _current_span.reset(token)
+            end = time.perf_counter()
+            span["duration"] = end - start
+            run._last_end = end
+            run.add_span(span)
+            logger.info(json.dumps({"event": "node", "run_id": run.run_id, **span}))
+        if isinstance(result, dict) and "retry_count" in result:
+            span["retry_count"] = result["retry_count"]
+        return result
+    return wrapper
+
+def add_queue_time(seconds):
+    """Charge time spent waiting on a shared resource (rate limiter, sandbox worker) to the current node"""
+    span = _current_span.get()
+    if span is not None:
+        span["queue_time"] += seconds
+
+def _record_llm_call(node, duration, prompt_tokens, completion_tokens, cache_hit, estimated=False, agent=None):
+    run = current_run()
+    if run is None:
+        return
+    span = _current_span.get()
+    call = {
+        "node": node or (span["node"] if span else None),
+        "agent": agent,
+        "span_id": span["span_id"] if span else None,
+        "duration": duration,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost": 0.0 if cache_hit else estimate_cost(prompt_tokens, completion_tokens),
+        "cache_hit": cache_hit,
+        "tokens_estimated": estimated,
+        "retry_count": span["retry_count"] if span else 0,
+    }
+    run.add_llm_call(call)
+    logger.info(json.dumps({"event": "llm_call", "run_id": run.run_id, **call}))
+
+def record_cache_hit(agent):
+    """Called by the response cache when it answers without an LLM call"""
+    _record_llm_call(None, 0.0, 0, 0, cache_hit=True, agent=agent)
+
+def _usage(response):
+    """Token usage from an LLMResult, or None when the API did not report it"""
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage["input_tokens"], usage["output_tokens"]
+    usage = (response.llm_output or {}).get("token_usage")
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    return None
+
+def _generated_text(response):
+    parts = []
+    for generations in response.generations:
+        for generation in generations:
+            parts.append(generation.text or "")
+            message = getattr(generation, "message", None)
+            call = (getattr(message, "additional_kwargs", None) or {}).get("function_call") or {}
+            parts.append(call.get("arguments") or "")
+    return "".join(parts)
+
+def _finish_reason(response):
+    for generations in response.generations:
+        for generation in generations:
+            reason = (generation.generation_info or {}).get("finish_reason")
+            if reason:
+                return reason
+    return None
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Records latency and token usage of every LLM call on the current run"""
+
+    def __init__(self):
+        self._started: Dict[Any, tuple] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        prompt_chars = sum(len(str(m.content)) for batch in messages for m in batch)
+        self._started[run_id] = ((metadata or {}).get("langgraph_node"), time.perf_counter(), prompt_chars)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        node, start, prompt_chars = self._started.pop(run_id, (None, time.perf_counter(), 0))
+        if _finish_reason(response) == "length":
+            print(f"Warning: LLM response in {node or 'unknown node'} stopped at max_tokens and is truncated")
+        usage = _usage(response)
+        if usage:
+            _record_llm_call(node, time.perf_counter() - start, usage[0], usage[1], cache_hit=False)
+        else:
+            # Streaming responses often omit usage; fall back to ~4 characters per token
+            _record_llm_call(node, time.perf_counter() - start, prompt_chars // 4,
+                             len(_generated_text(response)) // 4, cache_hit=False, estimated=True)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+
+class MetricsRegistry:
+    """Process-wide counters and latency histograms across finished runs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.node_calls: Dict[str, int] = {}
+        self.node_seconds: Dict[str, float] = {}
+        self.node_queue_seconds: Dict[str, float] = {}
+        self.node_buckets: Dict[str, List[int]] = {}
+        self.llm_calls: Dict[str, int] = {}
+        self.cache_hits: Dict[str, int] = {}
+        self.prompt_tokens: Dict[str, int] = {}
+        self.completion_tokens: Dict[str, int] = {}
+        self.cost: Dict[str, float] = {}
+        self.retries = 0
+
+    def observe_run(self, run: RunMetrics):
+        with self._lock:
+            self.runs += 1
+            self.retries += run.totals()["retry_count"]
+            for span in run.spans:
+                node = span["node"]
+                self.node_calls[node] = self.node_calls.get(node, 0) + 1
+                self.node_seconds[node] = self.node_seconds.get(node, 0.0) + span["duration"]
+                self.node_queue_seconds[node] = self.node_queue_seconds.get(node, 0.0) + span["queue_time"]
+                buckets = self.node_buckets.setdefault(node, [0] * len(LATENCY_BUCKETS))
+                for i, bound in enumerate(LATENCY_BUCKETS):
+                    if span["duration"] <= bound:
+                        buckets[i] += 1
+            for call in run.llm_calls:
+                node = call["node"] or "unknown"
+                if call["cache_hit"]:
+                    self.cache_hits[node] = self.cache_hits.get(node, 0) + 1
+                    continue
+                self.llm_calls[node] = self.llm_calls.get(node, 0) + 1
+                self.prompt_tokens[node] = self.prompt_tokens.get(node, 0) + call["prompt_tokens"]
+                self.completion_tokens[node] = self.completion_tokens.get(node, 0) + call["completion_tokens"]
+                self.cost[node] = self.cost.get(node, 0.0) + call["cost"]
+        path = os.getenv("METRICS_PROM_FILE")
+        if path:
+            self.write_prometheus(path)
+
+    def prometheus_text(self):
+        """Counters and histograms in the Prometheus text exposition format"""
+        lines = []
+
+        def family(name, kind, help_text, values, label="node"):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(values.items()):
+                lines.append(f'{name}{{{label}="{key}"}} {value}')
+
+        with self._lock:
+            lines.append("# HELP workflow_runs_total Finished workflow runs")
+            lines.append("# TYPE workflow_runs_total counter")
+            lines.append(f"workflow_runs_total {self.runs}")
+            lines.append("# HELP workflow_retries_total Debugger retries across all runs")
+            lines.append("# TYPE workflow_retries_total counter")
+            lines.append(f"workflow_retries_total {self.retries}")
+            family("workflow_node_queue_seconds_total", "counter", "Time nodes spent waiting", self.node_queue_seconds)
+            lines.append("# HELP workflow_node_seconds Node wall time")
+            lines.append("# TYPE workflow_node_seconds histogram")
+            for node in sorted(self.node_calls):
+                for bound, count in zip(LATENCY_BUCKETS, self.node_buckets[node]):
+                    lines.append(f'workflow_node_seconds_bucket{{node="{node}",le="{bound}"}} {count}')
+                lines.append(f'workflow_node_seconds_bucket{{node="{node}",le="+Inf"}} {self.node_calls[node]}')
+                lines.append(f'workflow_node_seconds_sum{{node="{node}"}} {self.node_seconds[node]}')
+                lines.append(f'workflow_node_seconds_count{{node="{node}"}} {self.node_calls[node]}')
+            family("llm_calls_total", "counter", "LLM calls sent to the API", self.llm_calls)
+            family("llm_cache_hits_total", "counter", "LLM calls answered from the response cache", self.cache_hits)
+            family("llm_prompt_tokens_total", "counter", "Prompt tokens sent", self.prompt_tokens)
+            family("llm_completion_tokens_total", "counter", "Completion tokens received", self.completion_tokens)
+            family("llm_cost_usd_total", "counter", "Estimated LLM cost in USD", self.cost)
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Write the metrics for the node_exporter textfile collector, replacing the file atomically"""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, path)
+
+REGISTRY = MetricsRegistry()
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port=None, host=None):
+    """Serve /metrics on ``port`` (or METRICS_PORT) from a daemon thread, once per process
+
+    Binds to METRICS_HOST, localhost by default; set it to 0.0.0.0 to let
+    a scraper on another machine reach the endpoint.
+    """
+    global _server
+    port = port or int(os.getenv("METRICS_PORT") or 0)
+    host = host or os.getenv("METRICS_HOST") or "127.0.0.1"
+    with _server_lock:
+        if _server is None and port:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+            print(f"Serving Prometheus metrics on {host}:{port}/metrics")
+    return _server
@@ -0,0 +1,169 @@
+"""Local OpenAI-compatible chat completions server for exercising llm_router
+
+    python mock_openai_server.py --port 8001                                  # always answers
+    python mock_openai_server.py --port 8002 --fail-status 429                # always rate limited
+    python mock_openai_server.py --port 8003 --fail-rate 0.5 --fail-status 503 --latency 0.2
+
+Serves the Azure path (``/openai/deployments/<name>/chat/completions``)
+and ``/v1/chat/completions``, with and without ``stream``. When the
+request carries ``functions`` it answers with a call to the first one
+whose arguments fill its JSON schema with placeholder values, so the
+structured-output agents parse the reply. Point a deployment's
+``endpoint`` at ``http://127.0.0.1:<port>`` to route to it.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PLACEHOLDER_CODE = "def solve(value):\n    return value\n"
+
+def placeholder(schema, definitions=None, name=""):
+    """A value matching a (pydantic-generated) JSON schema"""
+    definitions = definitions or schema.get("definitions") or schema.get("$defs") or {}
+    if "$ref" in schema:
+        return placeholder(definitions[schema["$ref"].split("/")[-1]], definitions, name)
+    kind = schema.get("type")
+    if kind == "object":
+        return {key: placeholder(value, definitions, key) for key, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [placeholder(schema.get("items") or {}, definitions, name)]
+    if kind == "string":
+        return PLACEHOLDER_CODE if name == "code" else "placeholder"
+    if kind == "boolean":
+        return False
+    return 1
+
+class MockOpenAIServer:
+    """Threaded mock server; ``fail_status`` is returned for a ``fail_rate`` share of requests"""
+
+    def __init__(self, port=0, latency=0.0, fail_status=None, fail_rate=1.0, retry_after=None, seed=None):
+        self.latency = latency
+        self.fail_status = fail_status
+        self.fail_rate = fail_rate
+        self.retry_after = retry_after
+        self.requests = 0
+        self.failures = 0
+        self.deployments = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _should_fail(self, deployment):
+        with self._lock:
+            self.requests += 1
+            self.deployments[deployment] = self.deployments.get(deployment, 0) + 1
+            fail = self.fail_status is not None and self._random.random() < self.fail_rate
+            self.failures += fail
+            return fail
+
+    def _answer(self, body):
+        functions = body.get("functions") or []
+        if functions:
+            arguments = json.dumps(placeholder(functions[0].get("parameters") or {}))
+            return {"role": "assistant", "content": None,
+                    "function_call": {"name": functions[0]["name"], "arguments": arguments}}, arguments
+        return {"role": "assistant", "content": "placeholder"}, "placeholder"
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                path = self.path.split("?")[0]
+                if not path.endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": f"Unknown path {path}"}})
+                    return
+                parts = path.split("/")
+                deployment = parts[parts.index("deployments") + 1] if "deployments" in parts else "default"
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                if mock.latency:
+                    time.sleep(mock.latency)
+                if mock._should_fail(deployment):
+                    headers = {"Retry-After": str(mock.retry_after)} if mock.retry_after is not None else {}
+                    self._send_json(mock.fail_status, {"error": {"code": str(mock.fail_status),
+                                                                 "message": "Mock failure"}}, headers)
+                    return
+                message, text = mock._answer(body)
+                prompt_tokens = sum(len(str(m.get("content") or "")) for m in body.get("messages", [])) // 4
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(text) // 4,
+                         "total_tokens": prompt_tokens + len(text) // 4}
+                common = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()), "model": deployment}
+                if body.get("stream"):
+                    self._stream(common, message, usage)
+                    return
+                self._send_json(200, {**common, "object": "chat.completion", "usage": usage,
+                                      "choices": [{"index": 0, "message": message, "finish_reason": "stop"}]})
+
+            def _stream(self, common, message, usage):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                call = message.get("function_call")
+                text = call["arguments"] if call else message["content"]
+                for i in range(0, len(text), 16):
+                    if call:
+                        delta = {"function_call": {"arguments": text[i:i + 16]}}
+                        if i == 0:
+                            delta = {"role": "assistant", "content": None,
+                                     "function_call": {"name": call["name"], "arguments": text[i:i + 16]}}
+                    else:
+                        delta = {"content": text[i:i + 16]}
+                    chunk = {**common, "object": "chat.completion.chunk",
+                             "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                final = {**common, "object": "chat.completion.chunk", "usage": usage,
+                         "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+                self.wfile.flush()
+
+        return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible chat completions server")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--fail-status", type=int, help="HTTP status returned for failing requests, e.g. 429 or 503")
+    parser.add_argument("--fail-rate", type=float, default=1.0, help="Share of requests that fail")
+    parser.add_argument("--retry-after", type=float, help="Retry-After header sent with failures")
+    args = parser.parse_args()
+    server = MockOpenAIServer(args.port, args.latency, args.fail_status, args.fail_rate, args.retry_after)
+    print(f"Mock OpenAI server listening on {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -46,9 +46,61 @@ class RefineCode(BaseModel):
         json_schema_serialization_defaults=True
     )
 
+class ExecutionResult(BaseModel):
+    """Outcome of running code in the sandbox"""
+    success: bool
+    stdout: str = ""
+    stderr: str = ""
+    error: Optional[str] = None
+    traceback: Optional[str] = None
+    result: Any = None
+    duration: float = 0.0
+    timed_out: bool = False
+    cancelled: bool = False
+
+class TestCaseResult(BaseModel):
+    """Result of one test case run by the local harness"""
+    index: int
+    input: Any = None
+    expected: Any = None
+    actual: Any = None
+    passed: bool = False
+    error: Optional[str] = None
+    duration: Optional[float] = None
+    peak_memory_kb: Optional[float] = None
+    timed_out: bool = False
+    # Carried over from an earlier run because re-validation stopped before reaching the case
+    stale: bool = False
+
+class StaticReport(BaseModel):
+    """Outcome of the static checks run before generated code is executed"""
+    code: str
+    passed: bool
+    diagnostics: List[str] = []
+    fixes: List[str] = []
+    warnings: List[str] = []
+
+class PerformanceReport(BaseModel):
+    """Timings of generated code on scaled-up inputs and the budgets they break"""
+    sizes: List[int] = []
+    seconds: List[float] = []
+    exponent: Optional[float] = None
+    peak_memory_mb: Optional[float] = None
+    breaches: List[str] = []
+    skipped: Optional[str] = None
+
 class AgentCoder(TypedDict):
     requirement: str
     code: str
     tests: Dict[str, Any]
     errors: Optional[str]
-    retry_count: int 
\ No newline at end of file
+    retry_count: int
+    success: bool
+    test_results: List[Dict[str, Any]]
+    code_hash: Optional[str]
+    spec_tests: Dict[str, Any]
+    candidates: List[str] 
+    reused_from: Optional[Dict[str, Any]]
+    performance: Optional[Dict[str, Any]]
+    started_at: Optional[float]
+    retry_history: List[Dict[str, Any]]
\ No newline at end of file
@@ -0,0 +1,190 @@
+"""Performance check of generated code on inputs of growing size
+
+After the tests pass, the largest test input is scaled up: every list
+and string argument is grown to each of the PERF_SIZES lengths with
+values drawn like the test's own, while scalar arguments stay as they
+are. The target function is timed on each size in the sandbox and the
+slope of log(time) against log(size) gives the empirical complexity
+exponent (1 for linear, 2 for quadratic). Peak memory is measured at the
+largest size that ran. Code over a budget goes back to the debugger with
+the measurements.
+"""
+import math
+import os
+from typing import List, NamedTuple, Optional
+
+from harness import MODULE_NAME, _n_args, find_target_function
+from models import PerformanceReport
+from sandbox import SandboxError, get_sandbox_pool
+
+# Runs inside the sandbox after the generated code and the constants set by
+# build_perf_harness; fills __result__ with the measurements
+_PERF_HARNESS = '''
+import copy as _copy
+import inspect as _inspect
+import random as _random
+import time as _time
+import tracemalloc as _tracemalloc
+
+def _scale(value, n, rng):
+    if isinstance(value, str):
+        alphabet = value or "ab"
+        return "".join(rng.choice(alphabet) for _ in range(n))
+    if isinstance(value, list):
+        sample = value or [0]
+        if all(isinstance(v, int) and not isinstance(v, bool) for v in sample):
+            low, high = min(sample), max(sample)
+            # Spread values over a range that grows with n so sizes are not dominated by duplicates
+            return [rng.randint(low, low + max(high - low, n)) for _ in range(n)]
+        return [_copy.deepcopy(rng.choice(sample)) for _ in range(n)]
+    return value
+
+def _call(func, row):
+    try:
+        _inspect.signature(func).bind(*row)
+    except TypeError:
+        return func(row)
+    except ValueError:
+        pass
+    return func(*row)
+
+def _measure(row):
+    best = None
+    for _ in range(3):
+        args = _copy.deepcopy(row)
+        start = _time.perf_counter()
+        _call(_TARGET, args)
+        elapsed = _time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        # Repeat only fast calls, where timer noise matters
+        if elapsed > 0.05:
+            break
+    return best
+
+_rng = _random.Random(0)
+_points = []
+_error = None
+_largest = None
+for _n in _SIZES:
+    _row = [_scale(v, _n, _rng) for v in _SAMPLE]
+    try:
+        _points.append([_n, _measure(_row)])
+    except Exception as _e:
+        _error = f"{type(_e).__name__}: {_e}"
+        break
+    _largest = _row
+    if _points[-1][1] > _MAX_SECONDS:
+        break
+
+_peak = None
+if _largest is not None:
+    _args = _copy.deepcopy(_largest)
+    _tracemalloc.start()
+    try:
+        _call(_TARGET, _args)
+        _peak = _tracemalloc.get_traced_memory()[1]
+    except Exception:
+        pass
+    finally:
+        _tracemalloc.stop()
+__result__ = {"points": _points, "peak_memory": _peak, "error": _error}
+'''
+
+class PerfBudget(NamedTuple):
+    sizes: List[int]
+    max_exponent: float = 1.5
+    max_seconds: float = 1.0
+    max_memory_mb: float = 256.0
+    timeout: float = 30.0
+
+def perf_budget_from_env(force=False) -> Optional[PerfBudget]:
+    """Budget from the PERF_* variables, or None unless WORKFLOW_PERF_CHECK is set (or ``force``)"""
+    if not force and os.getenv("WORKFLOW_PERF_CHECK", "").lower() not in ("1", "true", "yes"):
+        return None
+    sizes = [int(s) for s in (os.getenv("PERF_SIZES") or "1000,2000,4000,8000,16000").split(",") if s.strip()]
+    return PerfBudget(
+        sizes=sorted(sizes),
+        max_exponent=float(os.getenv("PERF_MAX_EXPONENT") or 1.5),
+        max_seconds=float(os.getenv("PERF_MAX_SECONDS") or 1.0),
+        max_memory_mb=float(os.getenv("PERF_MAX_MEMORY_MB") or 256),
+        timeout=float(os.getenv("PERF_TIMEOUT") or 30),
+    )
+
+def _sample_row(inputs):
+    """The test row with the largest scalable arguments; None when no argument is a list or string"""
+    rows = [row for row in inputs if isinstance(row, list) and any(isinstance(v, (list, str)) for v in row)]
+    if not rows:
+        return None
+    return max(rows, key=lambda row: sum(len(v) for v in row if isinstance(v, (list, str))))
+
+def build_perf_harness(code, target, sample, budget: PerfBudget):
+    constants = (
+        f"_TARGET = {target}\n"
+        f"_SAMPLE = {sample!r}\n"
+        f"_SIZES = {list(budget.sizes)!r}\n"
+        f"_MAX_SECONDS = {budget.max_seconds!r}\n"
+    )
+    return code + "\n\n" + constants + _PERF_HARNESS
+
+def complexity_exponent(points, min_seconds=1e-4):
+    """Least-squares slope of log(seconds) against log(size); None with fewer than 3 usable points"""
+    usable = [(math.log(n), math.log(t)) for n, t in points if t >= min_seconds]
+    if len(usable) < 3:
+        return None
+    mean_x = sum(x for x, _ in usable) / len(usable)
+    mean_y = sum(y for _, y in usable) / len(usable)
+    spread = sum((x - mean_x) ** 2 for x, _ in usable)
+    return sum((x - mean_x) * (y - mean_y) for x, y in usable) / spread if spread else None
+
+def check_performance(code, inputs, budget: PerfBudget, pool=None) -> PerformanceReport:
+    """Time ``code`` on scaled-up test inputs and compare the result with ``budget``"""
+    sample = _sample_row(inputs or [])
+    target = find_target_function(code, _n_args(inputs)) if sample is not None else None
+    if target is None:
+        return PerformanceReport(skipped="no list or string argument to scale")
+    try:
+        result = (pool or get_sandbox_pool()).run(build_perf_harness(code, target, sample, budget), budget.timeout,
+                                                  module_name=MODULE_NAME)
+    except SandboxError as e:
+        return PerformanceReport(skipped=str(e))
+    if result.timed_out or "CPU time limit" in (result.error or ""):
+        return PerformanceReport(breaches=[f"scaled inputs up to {budget.sizes[-1]} elements hit the sandbox "
+                                           f"limits ({result.error})"])
+    if not result.success or not isinstance(result.result, dict):
+        return PerformanceReport(skipped=f"scaled run failed: {result.error}")
+    points = [(n, t) for n, t in result.result["points"]]
+    error = result.result["error"] or ""
+    if error.startswith("MemoryError"):
+        size = budget.sizes[len(points)]
+        return PerformanceReport(sizes=[n for n, _ in points], seconds=[round(t, 6) for _, t in points],
+                                 breaches=[f"ran out of memory at size {size}"])
+    if not points:
+        # Synthesised inputs may break preconditions the tests respect; that is not a performance problem
+        return PerformanceReport(skipped=f"scaled inputs were rejected: {result.result['error']}")
+    peak = result.result["peak_memory"]
+    report = PerformanceReport(
+        sizes=[n for n, _ in points],
+        seconds=[round(t, 6) for _, t in points],
+        exponent=complexity_exponent(points),
+        peak_memory_mb=round(peak / 2 ** 20, 2) if peak is not None else None,
+    )
+    if report.exponent is not None and report.exponent > budget.max_exponent:
+        report.breaches.append(f"time grows like n^{report.exponent:.2f}, over the n^{budget.max_exponent} budget")
+    if points[-1][1] > budget.max_seconds:
+        report.breaches.append(f"{points[-1][1]:.2f}s at size {points[-1][0]}, over the {budget.max_seconds}s budget")
+    if report.peak_memory_mb is not None and report.peak_memory_mb > budget.max_memory_mb:
+        report.breaches.append(f"peak memory {report.peak_memory_mb:.0f} MB at size {points[-1][0]}, "
+                               f"over the {budget.max_memory_mb:.0f} MB budget")
+    return report
+
+def format_report(report: PerformanceReport):
+    """Measurements and budget breaches for the debugger prompt"""
+    lines = ["Performance budget exceeded (the tests pass, but the code is too slow or too large):"]
+    lines += [f"- {breach}" for breach in report.breaches]
+    if report.sizes:
+        timings = ", ".join(f"n={n}: {t:.4f}s" for n, t in zip(report.sizes, report.seconds))
+        lines.append(f"Timings on scaled inputs: {timings}")
+    if report.peak_memory_mb is not None:
+        lines.append(f"Peak memory at n={report.sizes[-1]}: {report.peak_memory_mb} MB")
+    lines.append("Use a more efficient algorithm or data structure; keep the same function signature.")
+    return "\n".join(lines)
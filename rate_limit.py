@@ -0,0 +1,155 @@
+import itertools
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from metrics import add_queue_time
+from token_budget import count_tokens
+
+class RateLimiter:
+    """Rolling one-minute request and token budget shared by every thread
+
+    ``acquire`` blocks until the call fits in both budgets and returns a
+    handle for ``adjust``. Pass ``None`` for a limit to leave it unbounded.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, window=60.0):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self.window = window
+        self._calls = deque()  # [handle, timestamp, tokens]
+        self._tokens = 0
+        self._handles = itertools.count()
+        self._cond = threading.Condition()
+
+    def _expire(self, now):
+        while self._calls and now - self._calls[0][1] >= self.window:
+            self._tokens -= self._calls.popleft()[2]
+
+    def _wait_time(self, tokens, now):
+        waits = [0.0]
+        if self.rpm and len(self._calls) >= self.rpm:
+            waits.append(self._calls[0][1] + self.window - now)
+        if self.tpm and self._calls and self._tokens + tokens > self.tpm:
+            # Wait until enough of the oldest calls have left the window
+            freed = 0
+            for _, ts, used in self._calls:
+                freed += used
+                if self._tokens - freed + tokens <= self.tpm:
+                    waits.append(ts + self.window - now)
+                    break
+            else:
+                waits.append(self._calls[-1][1] + self.window - now)
+        return max(waits)
+
+    def acquire(self, tokens=0):
+        """Block until a call of ``tokens`` fits, then record it; returns (handle, time waited)"""
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._expire(now)
+                wait = self._wait_time(tokens, now)
+                if wait <= 0:
+                    handle = next(self._handles)
+                    self._calls.append([handle, now, tokens])
+                    self._tokens += tokens
+                    return handle, now - start
+                self._cond.wait(wait)
+
+    def wait_time(self, tokens=0):
+        """Seconds a call of ``tokens`` would wait right now, without recording it"""
+        with self._cond:
+            now = time.monotonic()
+            self._expire(now)
+            return max(0.0, self._wait_time(tokens, now))
+
+    def adjust(self, handle, actual):
+        """Replace the estimated token count of the call ``acquire`` returned ``handle`` for
+
+        A call that has already left the window no longer counts, so it is
+        left alone.
+        """
+        with self._cond:
+            for call in reversed(self._calls):
+                if call[0] == handle:
+                    self._tokens += actual - call[2]
+                    call[2] = actual
+                    break
+                if call[0] < handle:
+                    break
+            self._cond.notify_all()
+
+def is_rate_limit_error(error):
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+def retry_after(error):
+    """Seconds the server asked us to wait, if it said"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def estimate_tokens(input, max_tokens):
+    """Prompt size plus the completion budget"""
+    text = input.to_string() if hasattr(input, "to_string") else str(input)
+    return count_tokens(text) + (max_tokens or 0)
+
+class RateLimitedChatModel(Runnable):
+    """Chat model wrapper that waits for the rate limiter and retries 429s
+
+    Retries use exponential backoff with jitter, or the server's
+    Retry-After header when it sends one. Attribute access falls through
+    to the wrapped model so callers can still read deployment settings.
+    """
+
+    def __init__(self, llm, limiter: RateLimiter, max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.llm = llm
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def __getattr__(self, name):
+        llm = self.__dict__.get("llm")
+        if llm is None:
+            raise AttributeError(name)
+        return getattr(llm, name)
+
+    def for_role(self, role):
+        """The wrapped model's view for ``role`` behind the same limiter (see llm_router)"""
+        return RateLimitedChatModel(self.llm.for_role(role), self.limiter, self.max_retries,
+                                    self.base_delay, self.max_delay)
+
+    def _backoff(self, attempt, error):
+        delay = retry_after(error) or min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _record_usage(self, handle, result):
+        usage = getattr(result, "usage_metadata", None)
+        if usage and usage.get("total_tokens"):
+            self.limiter.adjust(handle, usage["total_tokens"])
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        # Agents bind a per-call max_tokens; fall back to the client's ceiling
+        estimated = estimate_tokens(input, kwargs.get("max_tokens") or getattr(self.llm, "max_tokens", None))
+        for attempt in range(self.max_retries + 1):
+            handle, waited = self.limiter.acquire(estimated)
+            add_queue_time(waited)
+            try:
+                result = self.llm.invoke(input, config, **kwargs)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                print(f"Rate limited (429), retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+                continue
+            self._record_usage(handle, result)
+            return result
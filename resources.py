@@ -0,0 +1,133 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Any, NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+from agents import setup_environment, create_agents, create_candidate_coder, create_spec_tester
+from checkpoints import get_checkpointer
+from perf_check import perf_budget_from_env
+from retry_policy import retry_policy_from_env
+from sandbox import get_sandbox_pool
+from solution_index import get_solution_index
+from workflow import create_workflow
+
+ENV_FILE = os.getenv("DEV_ASSISTANT_ENV_FILE", ".env")
+
+# Settings that change the LLM client; a change to any of them forces a rebuild
+FINGERPRINT_VARS = (
+    "AZURE_OPENAI_DEPLOYMENT",
+    "AZURE_OPENAI_API_VERSION",
+    "AZURE_OPENAI_ENDPOINT",
+    "AZURE_OPENAI_API_KEY",
+    "LLM_TEMPERATURE",
+    "LLM_MAX_TOKENS",
+    "LLM_DEPLOYMENTS",
+    "LLM_DEPLOYMENTS_FILE",
+    "LLM_ROLE_MODELS",
+    "LLM_ROUTER_POLICY",
+    "WORKFLOW_PARALLEL_TESTS",
+    "WORKFLOW_CANDIDATES",
+    "WORKFLOW_CANDIDATE_TEMPERATURE",
+    "WORKFLOW_CANCEL_POLICY",
+    "CHECKPOINT_DB",
+    "SOLUTION_INDEX_DISABLED",
+    "SOLUTION_INDEX_PATH",
+    "SOLUTION_INDEX_MAX_ENTRIES",
+    "SOLUTION_INDEX_THRESHOLD",
+    "WORKFLOW_PERF_CHECK",
+    "PERF_SIZES",
+    "PERF_MAX_EXPONENT",
+    "PERF_MAX_SECONDS",
+    "PERF_MAX_MEMORY_MB",
+    "PERF_TIMEOUT",
+    "RETRY_TIME_BUDGET",
+    "RETRY_TOKEN_BUDGET",
+    "RETRY_MIN_FIX_RATE",
+    "RETRY_MAX_ATTEMPTS",
+)
+
+class Resources(NamedTuple):
+    """LLM client, agents and compiled graph shared by every session"""
+    llm: Any
+    coder: Any
+    tester_agent: Any
+    execution: Any
+    refine_code: Any
+    app: Any
+    fingerprint: str
+    build_seconds: float
+
+_lock = threading.Lock()
+_current: Optional[Resources] = None
+_env_mtime: Optional[float] = None
+
+def env_flag(name):
+    return os.getenv(name, "").lower() in ("1", "true", "yes")
+
+def _reload_env_if_changed():
+    """Re-read the .env file when its modification time changes"""
+    global _env_mtime
+    try:
+        mtime = os.path.getmtime(ENV_FILE)
+    except OSError:
+        mtime = None
+    if mtime != _env_mtime:
+        # override=True so edited values replace the ones loaded earlier
+        load_dotenv(ENV_FILE, override=True)
+        _env_mtime = mtime
+
+def config_fingerprint():
+    """Hash of the settings the LLM client is built from"""
+    values = "\n".join(f"{name}={os.getenv(name, '')}" for name in FINGERPRINT_VARS)
+    return hashlib.sha256(values.encode()).hexdigest()[:16]
+
+def _build(fingerprint):
+    start = time.perf_counter()
+    llm = setup_environment()
+    coder, tester_agent, execution, refine_code = create_agents(llm)
+    spec_tester = create_spec_tester(llm) if env_flag("WORKFLOW_PARALLEL_TESTS") else None
+    candidates = int(os.getenv("WORKFLOW_CANDIDATES") or 1)
+    candidate_coder = None
+    if candidates > 1:
+        candidate_coder = create_candidate_coder(llm, float(os.getenv("WORKFLOW_CANDIDATE_TEMPERATURE") or 0.8))
+    app = create_workflow(
+        coder, tester_agent, execution, refine_code,
+        spec_tester=spec_tester,
+        candidate_coder=candidate_coder,
+        candidates=candidates,
+        cancel_policy=os.getenv("WORKFLOW_CANCEL_POLICY") or "first_pass",
+        checkpointer=get_checkpointer(),
+        solution_index=None if env_flag("SOLUTION_INDEX_DISABLED") else get_solution_index(),
+        perf_budget=perf_budget_from_env(),
+        retry_policy=retry_policy_from_env(),
+    )
+    # Start the sandbox workers now so the first run does not wait for them
+    get_sandbox_pool()
+    elapsed = time.perf_counter() - start
+    print(f"Resources cold start: built LLM client, agents and graph in {elapsed:.3f}s (config {fingerprint})")
+    return Resources(llm, coder, tester_agent, execution, refine_code, app, fingerprint, elapsed)
+
+def get_resources():
+    """Return the shared resources, building them once per config fingerprint"""
+    global _current
+    start = time.perf_counter()
+    with _lock:
+        _reload_env_if_changed()
+        fingerprint = config_fingerprint()
+        if _current is None or _current.fingerprint != fingerprint:
+            _current = _build(fingerprint)
+            return _current
+        resources = _current
+    elapsed = time.perf_counter() - start
+    print(f"Resources warm start: reused cached graph in {elapsed * 1000:.2f}ms (config {fingerprint})")
+    return resources
+
+def clear_resources():
+    """Drop the cached resources so the next call rebuilds them"""
+    global _current, _env_mtime
+    with _lock:
+        _current = None
+        _env_mtime = None
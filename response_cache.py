@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import ensure_config
+
+from metrics import record_cache_hit
+
+def cache_disabled():
+    """Bypass switch, read on every call so it can be flipped while debugging"""
+    return os.getenv("RESPONSE_CACHE_DISABLED", "").lower() in ("1", "true", "yes")
+
+def llm_params(llm):
+    """Model parameters that change the response and therefore belong in the key"""
+    return {
+        "deployment": getattr(llm, "deployment_name", None) or getattr(llm, "model_name", None),
+        "api_version": getattr(llm, "openai_api_version", None),
+        "temperature": getattr(llm, "temperature", None),
+        "max_tokens": getattr(llm, "max_tokens", None),
+    }
+
+class ResponseCache:
+    """Two-tier response cache: an in-memory LRU in front of a SQLite table
+
+    Entries expire after ``ttl`` seconds. The memory tier holds at most
+    ``memory_entries`` items and the SQLite tier at most ``max_bytes`` of
+    payload, evicting least recently used rows first.
+    """
+
+    def __init__(self, path, ttl=7 * 24 * 3600, memory_entries=256, max_bytes=100 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, "
+            "last_access REAL NOT NULL, size INTEGER NOT NULL)"
+        )
+        self._db.commit()
+
+    @staticmethod
+    def make_key(prompt_text, schema_name, params):
+        payload = json.dumps({"prompt": prompt_text, "schema": schema_name, "params": params}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits_memory += 1
+                    return value
+                del self._memory[key]
+
+            row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                value, created = row
+                if now - created <= self.ttl:
+                    self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, value, created)
+                    self.hits_disk += 1
+                    return value
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, last_access, size) VALUES (?, ?, ?, ?, ?)",
+                (key, value, now, now, len(value)),
+            )
+            self._evict_disk(now)
+            self._db.commit()
+
+    def _remember(self, key, value, created):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, now):
+        self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute("SELECT key, size FROM responses ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits_memory + self.hits_disk + self.misses
+            return {
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+class CachedRunnable(Runnable):
+    """Wrap a structured-output runnable so identical prompts skip the LLM
+
+    The key is the rendered prompt plus the schema name and model
+    parameters; the value is the pydantic result serialised to JSON.
+    """
+
+    def __init__(self, runnable, prompt, schema, llm, cache):
+        self.runnable = runnable
+        self.prompt = prompt
+        self.schema = schema
+        self.params = llm_params(llm)
+        self.cache = cache
+
+    def _key(self, input):
+        return self.cache.make_key(self.prompt.format(**input), self.schema.__name__, self.params)
+
+    def _bypass(self, config):
+        # Sampling at temperature > 0 is not deterministic, so never serve it from cache
+        bypass = cache_disabled() or bool(self.params.get("temperature"))
+        if config.get("configurable", {}).get("cache_bypass"):
+            bypass = True
+        if bypass:
+            self.cache.bypassed += 1
+        return bypass
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        # Workflow nodes call invoke() without a config; the run's own config comes from the context
+        config = ensure_config(config)
+        if self._bypass(config):
+            return self.runnable.invoke(input, config, **kwargs)
+        key = self._key(input)
+        cached = self.cache.get(key)
+        if cached is not None:
+            record_cache_hit(self.schema.__name__)
+            return self.schema.model_validate_json(cached)
+        result = self.runnable.invoke(input, config, **kwargs)
+        self.cache.set(key, result.model_dump_json())
+        return result
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        config = ensure_config(config)
+        if self._bypass(config):
+            return await self.runnable.ainvoke(input, config, **kwargs)
+        key = self._key(input)
+        cached = self.cache.get(key)
+        if cached is not None:
+            record_cache_hit(self.schema.__name__)
+            return self.schema.model_validate_json(cached)
+        result = await self.runnable.ainvoke(input, config, **kwargs)
+        self.cache.set(key, result.model_dump_json())
+        return result
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Return the process-wide response cache configured from the environment"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(
+                os.getenv("RESPONSE_CACHE_PATH", ".cache/responses.sqlite"),
+                ttl=float(os.getenv("RESPONSE_CACHE_TTL") or 7 * 24 * 3600),
+                memory_entries=int(os.getenv("RESPONSE_CACHE_MEMORY_ENTRIES") or 256),
+                max_bytes=int(float(os.getenv("RESPONSE_CACHE_MAX_MB") or 100) * 1024 * 1024),
+            )
+        return _cache
@@ -0,0 +1,242 @@
+"""Adaptive retry policy for the debug loop
+
+Every failed attempt is classified (syntax, static, exception, timeout,
+mismatch, bad_test, performance) and the next step is chosen from the
+actions that can help with that class: refine the code, regenerate the
+tests, or stop. Each action's fix rate for each class is learned across
+runs in a small SQLite table, starting from priors, and decays within a
+run while the same action keeps failing on the same class. A run stops
+when the best remaining fix rate is below RETRY_MIN_FIX_RATE or the next
+attempt would not fit in the RETRY_TIME_BUDGET / RETRY_TOKEN_BUDGET left,
+rather than after a fixed number of iterations.
+
+A mismatch is suspected to be a bad test when the code changed but the
+same cases still fail with the same actual values: the code and the
+tester disagree, and refining the code again rarely settles it.
+"""
+import os
+import sqlite3
+import threading
+from collections import Counter
+from typing import NamedTuple, Optional
+
+from harness import _brief
+
+REFINE = "refine"
+REGENERATE_TESTS = "regenerate_tests"
+STOP = "stop"
+
+# Actions worth trying for each error class, most promising first
+ACTIONS = {
+    "syntax": (REFINE,),
+    "static": (REFINE,),
+    "exception": (REFINE, REGENERATE_TESTS),
+    "timeout": (REFINE,),
+    "mismatch": (REFINE, REGENERATE_TESTS),
+    "bad_test": (REGENERATE_TESTS, REFINE),
+    "performance": (REFINE,),
+}
+
+# Fix rates assumed before any history is recorded
+PRIORS = {
+    ("syntax", REFINE): 0.9,
+    ("static", REFINE): 0.8,
+    ("exception", REFINE): 0.6,
+    ("exception", REGENERATE_TESTS): 0.2,
+    ("timeout", REFINE): 0.4,
+    ("mismatch", REFINE): 0.5,
+    ("mismatch", REGENERATE_TESTS): 0.3,
+    ("bad_test", REGENERATE_TESTS): 0.6,
+    ("bad_test", REFINE): 0.2,
+    ("performance", REFINE): 0.4,
+}
+
+# Weight of the prior, in attempts, against recorded outcomes
+PRIOR_WEIGHT = 4
+
+def _current_failures(test_results):
+    """Failing cases of the latest run, without stale ones carried over from an earlier run"""
+    return [r for r in test_results or [] if not r.get("passed") and not r.get("stale")]
+
+def failure_signature(test_results):
+    """Failing cases with what they returned, to tell whether a fix changed anything"""
+    return [[r["index"], repr(r.get("actual"))[:200], r.get("error")] for r in _current_failures(test_results)]
+
+def failing_cases(state):
+    """Number of failing test cases, or None when the tests did not run or report per-case results"""
+    errors = state.get("errors") or ""
+    if state.get("success") or errors.startswith("Performance budget exceeded"):
+        return 0
+    if errors.startswith("Static check failed") or not state.get("test_results"):
+        return None
+    # Stale failures count: they were failing and have not been shown to pass since
+    return sum(not r.get("passed") for r in state["test_results"])
+
+def disputed_tests(test_results, limit=5):
+    """Note for the tester listing the cases the code disagrees with, to be checked against the requirement"""
+    failures = [r for r in _current_failures(test_results) if r.get("error") is None]
+    if not failures:
+        return ""
+    lines = ["", "", "Some previous test cases were disputed: the code returned a different value. "
+             "Check each expected output below against the requirement and correct it if it is wrong:"]
+    for r in failures[:limit]:
+        lines.append(f"- input {_brief(r.get('input'))}: expected {_brief(r.get('expected'))}, "
+                     f"the code returned {_brief(r.get('actual'))}")
+    return "\n".join(lines)
+
+def classify_error(errors, test_results=None, history=None, code_hash=None):
+    """Error class and a short detail for the current failure"""
+    errors = errors or ""
+    if errors.startswith("Static check failed"):
+        return ("syntax", "SyntaxError") if "Error at line" in errors else ("static", "diagnostics")
+    if errors.startswith("Performance budget exceeded"):
+        return "performance", "budget"
+    failures = _current_failures(test_results)
+    if not failures:
+        # The LLM-written harness only reports a traceback
+        for marker, error_class in (("Timeout", "timeout"), ("AssertionError", "mismatch"),
+                                    ("SyntaxError", "syntax"), ("IndentationError", "syntax")):
+            if marker in errors:
+                return error_class, marker
+        return "exception", "harness"
+    if any(r.get("timed_out") for r in failures):
+        return "timeout", f"{sum(bool(r.get('timed_out')) for r in failures)} cases"
+    raised = [r["error"].split(":")[0] for r in failures if r.get("error")]
+    if len(raised) == len(failures):
+        return "exception", Counter(raised).most_common(1)[0][0]
+    previous = (history or [])[-1:]
+    if previous and previous[0]["class"] in ("mismatch", "bad_test") and previous[0]["action"] == REFINE \
+            and previous[0].get("code_hash") != code_hash \
+            and previous[0].get("signature") == failure_signature(test_results):
+        return "bad_test", f"{len(failures)} failing cases unchanged after a fix"
+    return "mismatch", f"{len(failures)} of {sum(not r.get('stale') for r in test_results)} cases"
+
+class RetryStore:
+    """Attempts and fixes per (error class, action), kept across runs"""
+
+    def __init__(self, path=":memory:"):
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fix_rates (error_class TEXT NOT NULL, action TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, fixed INTEGER NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (error_class, action))"
+        )
+        self._db.commit()
+
+    def record(self, error_class, action, fixed):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO fix_rates (error_class, action, attempts, fixed) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT(error_class, action) DO UPDATE SET attempts = attempts + 1, fixed = fixed + excluded.fixed",
+                (error_class, action, int(fixed)),
+            )
+            self._db.commit()
+
+    def counts(self, error_class, action):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT attempts, fixed FROM fix_rates WHERE error_class = ? AND action = ?", (error_class, action)
+            ).fetchone()
+        return row or (0, 0)
+
+    def fix_rate(self, error_class, action):
+        """Recorded fix rate smoothed towards the prior"""
+        attempts, fixed = self.counts(error_class, action)
+        prior = PRIORS.get((error_class, action), 0.3)
+        return (fixed + prior * PRIOR_WEIGHT) / (attempts + PRIOR_WEIGHT)
+
+    def table(self):
+        with self._lock:
+            rows = self._db.execute("SELECT error_class, action, attempts, fixed FROM fix_rates ORDER BY 1, 2")
+            return [{"class": c, "action": a, "attempts": n, "fixed": f} for c, a, n, f in rows.fetchall()]
+
+class Decision(NamedTuple):
+    action: str
+    error_class: str
+    detail: str
+    fix_rate: float
+    reason: str
+
+class RetryPolicy:
+    """Chooses refine, regenerate_tests or stop for a failed attempt"""
+
+    def __init__(self, store: Optional[RetryStore] = None, time_budget=300.0, token_budget=60000,
+                 min_fix_rate=0.1, max_attempts=6):
+        self.store = store or RetryStore()
+        self.time_budget = time_budget
+        self.token_budget = token_budget
+        self.min_fix_rate = min_fix_rate
+        self.max_attempts = max_attempts
+
+    def settle(self, entry, success, failing):
+        """Record whether the action in ``entry`` improved on the failure it was taken for"""
+        if success:
+            fixed = True
+        elif entry["failing"] is None:
+            fixed = failing is not None  # the code runs now, even if some cases still fail
+        else:
+            fixed = failing is not None and failing < entry["failing"]
+        self.store.record(entry["class"], entry["action"], fixed)
+        return fixed
+
+    def _rate(self, error_class, action, history):
+        rate = self.store.fix_rate(error_class, action)
+        # Halve the rate for every attempt in a row that this action already failed on this class
+        for entry in reversed(history):
+            if entry["class"] != error_class or entry["action"] != action or entry.get("fixed"):
+                break
+            rate *= 0.5
+        return rate
+
+    def _over_budget(self, history, elapsed, tokens):
+        """Reason to stop when the next attempt would not fit in the time or token budget"""
+        if len(history) >= self.max_attempts:
+            return f"{len(history)} attempts made, the maximum is {self.max_attempts}"
+        attempts = max(1, len(history))
+        if elapsed + elapsed / (attempts + 1) > self.time_budget:
+            return f"{elapsed:.0f}s spent; another attempt would exceed the {self.time_budget:.0f}s budget"
+        if tokens is not None and tokens + tokens / (attempts + 1) > self.token_budget:
+            return f"{tokens} tokens spent; another attempt would exceed the {self.token_budget} token budget"
+        return None
+
+    def decide(self, error_class, detail, history, elapsed, tokens=None) -> Decision:
+        over = self._over_budget(history, elapsed, tokens)
+        rates = {action: self._rate(error_class, action, history) for action in ACTIONS.get(error_class, (REFINE,))}
+        action, rate = max(rates.items(), key=lambda item: item[1])
+        if over:
+            return Decision(STOP, error_class, detail, rate, over)
+        if rate < self.min_fix_rate:
+            return Decision(STOP, error_class, detail, rate,
+                            f"best fix rate for {error_class} is {rate:.2f}, below {self.min_fix_rate}")
+        return Decision(action, error_class, detail, rate, f"{action} fixes {error_class} {rate:.0%} of the time")
+
+    def summary(self):
+        rows = self.store.table()
+        if not rows:
+            return "Retry policy: no outcomes recorded yet"
+        return "Retry policy fix rates: " + ", ".join(
+            f"{r['class']}/{r['action']} {r['fixed']}/{r['attempts']}" for r in rows)
+
+_store: Optional[RetryStore] = None
+_store_lock = threading.Lock()
+
+def get_retry_store():
+    """Return the process-wide fix-rate store kept in RETRY_STATS_PATH"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = RetryStore(os.getenv("RETRY_STATS_PATH") or ".cache/retry_stats.sqlite")
+        return _store
+
+def retry_policy_from_env():
+    """Policy with the RETRY_* budgets over the shared store"""
+    return RetryPolicy(
+        get_retry_store(),
+        time_budget=float(os.getenv("RETRY_TIME_BUDGET") or 300),
+        token_budget=int(os.getenv("RETRY_TOKEN_BUDGET") or 60000),
+        min_fix_rate=float(os.getenv("RETRY_MIN_FIX_RATE") or 0.1),
+        max_attempts=int(os.getenv("RETRY_MAX_ATTEMPTS") or 6),
+    )
@@ -0,0 +1,244 @@
+import atexit
+import json
+import os
+import queue
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from metrics import add_queue_time
+from models import ExecutionResult
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+
+# Seconds between checks of a cancel event while waiting for a worker or its result
+CANCEL_POLL = 0.02
+
+# The only server variables generated code gets to see; API keys and the rest stay out of the sandbox
+SANDBOX_ENV_VARS = ("PATH", "PYTHONPATH", "LANG", "LC_ALL", "LC_CTYPE", "SYSTEMROOT")
+
+class SandboxError(RuntimeError):
+    """The pool could not run the code at all"""
+
+def cancelled_result(start):
+    return ExecutionResult(success=False, cancelled=True, error="CancelledError: the run was cancelled",
+                           duration=time.perf_counter() - start)
+
+def _wait(source, timeout, cancel):
+    """``source.get()`` within ``timeout`` seconds; raises queue.Empty on timeout, returns ``cancel`` once it is set"""
+    if cancel is None:
+        return source.get(timeout=timeout)
+    deadline = time.monotonic() + timeout
+    while not cancel.is_set():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise queue.Empty
+        try:
+            return source.get(timeout=min(remaining, CANCEL_POLL))
+        except queue.Empty:
+            pass
+    return cancel
+
+def sandbox_env(workdir):
+    """Minimal environment for a worker process"""
+    env = {name: os.environ[name] for name in SANDBOX_ENV_VARS if name in os.environ}
+    env.update(
+        HOME=workdir,
+        TMPDIR=workdir,
+        PYTHONDONTWRITEBYTECODE="1",
+        OPENBLAS_NUM_THREADS="1",
+        OMP_NUM_THREADS="1",
+        MKL_NUM_THREADS="1",
+        NUMEXPR_NUM_THREADS="1",
+    )
+    return env
+
+class SandboxWorker:
+    """One pre-warmed worker process running sandbox_worker.py"""
+
+    def __init__(self, memory_mb=0, startup_timeout=30):
+        self.runs = 0
+        self.workdir = tempfile.mkdtemp(prefix="sandbox-")
+        self.proc = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT, str(memory_mb)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=self.workdir,
+            env=sandbox_env(self.workdir),
+            text=True,
+            encoding="utf-8",
+        )
+        # A reader thread keeps the wall-clock timeout portable (select() does not work on Windows pipes)
+        self._lines = queue.Queue()
+        threading.Thread(target=self._read_lines, daemon=True).start()
+        ready = self._next_line(startup_timeout)
+        if ready is None:
+            self.kill()
+            raise RuntimeError("Sandbox worker failed to start")
+
+    def _read_lines(self):
+        for line in self.proc.stdout:
+            self._lines.put(line)
+        self._lines.put(None)
+
+    def _next_line(self, timeout):
+        try:
+            return self._lines.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def in_sync(self):
+        """False when the worker wrote more lines than it was asked for, e.g. from generated code"""
+        return self._lines.empty()
+
+    def _protocol_error(self, start):
+        self.kill()
+        return ExecutionResult(success=False, error="SandboxError: worker output did not match the job "
+                               "(the code wrote to the protocol pipe)", duration=time.perf_counter() - start)
+
+    def run(self, code, timeout, cpu_seconds=0, module_name=None, cancel=None) -> ExecutionResult:
+        """Run one job; setting the ``cancel`` event kills the worker and returns a cancelled result"""
+        self.runs += 1
+        start = time.perf_counter()
+        if not self.in_sync():
+            return self._protocol_error(start)
+        nonce = secrets.token_hex(16)
+        try:
+            job = {"code": code, "cpu_seconds": cpu_seconds, "module_name": module_name, "nonce": nonce}
+            self.proc.stdin.write(json.dumps(job) + "\n")
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError):
+            self.kill()
+            return ExecutionResult(success=False, error="Sandbox worker is not running")
+
+        try:
+            line = _wait(self._lines, timeout, cancel)
+        except queue.Empty:
+            self.kill()
+            return ExecutionResult(
+                success=False,
+                timed_out=True,
+                error=f"TimeoutError: execution exceeded {timeout}s wall-clock limit",
+                duration=time.perf_counter() - start,
+            )
+
+        if cancel is not None and line is cancel:
+            self.kill()
+            return cancelled_result(start)
+        if line is None:
+            # The worker died mid-run: killed by RLIMIT_CPU (SIGXCPU), the OOM killer or a hard crash
+            returncode = self.proc.wait()
+            reason = "CPU time limit exceeded" if returncode == -24 else f"worker exited with code {returncode}"
+            return ExecutionResult(success=False, error=f"SandboxError: {reason}", duration=time.perf_counter() - start)
+        try:
+            response = json.loads(line)
+        except ValueError:
+            response = None
+        if not isinstance(response, dict) or response.pop("nonce", None) != nonce:
+            return self._protocol_error(start)
+        return ExecutionResult(**response)
+
+    def kill(self):
+        if self.alive():
+            self.proc.kill()
+            self.proc.wait()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+class SandboxPool:
+    """Pool of pre-warmed worker processes that run untrusted code
+
+    Each run gets a wall-clock timeout, a CPU-time cap and the memory cap
+    set on the worker via RLIMIT_AS. Workers are replaced after
+    ``max_runs`` runs or as soon as one times out, dies or breaks the
+    protocol.
+    """
+
+    def __init__(self, size=2, timeout=10.0, memory_mb=1024, cpu_seconds=10, max_runs=20, acquire_timeout=60.0):
+        self.size = size
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.cpu_seconds = cpu_seconds
+        self.max_runs = max_runs
+        self.acquire_timeout = acquire_timeout
+        self._idle = queue.Queue()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(SandboxWorker(memory_mb))
+
+    def _spawn(self):
+        if self._closed:
+            return
+        try:
+            self._idle.put(SandboxWorker(self.memory_mb))
+        except Exception as e:
+            print(f"Failed to start replacement sandbox worker: {e}")
+
+    def _release(self, worker):
+        if self._closed:
+            worker.kill()
+        elif worker.alive() and worker.in_sync() and worker.runs < self.max_runs:
+            self._idle.put(worker)
+        else:
+            worker.kill()
+            # Replace off the request path so the pool stays pre-warmed
+            threading.Thread(target=self._spawn, daemon=True).start()
+
+    def run(self, code, timeout: Optional[float] = None, module_name=None,
+            cpu_seconds: Optional[int] = None, cancel: Optional[threading.Event] = None) -> ExecutionResult:
+        """Run ``code`` in an idle worker, blocking until one is free
+
+        ``timeout`` and ``cpu_seconds`` default to the pool's limits. The
+        code runs as ``__main__`` unless ``module_name`` is given.
+        Setting ``cancel`` stops the run: a run still waiting for a worker
+        returns at once, a running one has its worker killed and replaced.
+        Raises SandboxError when no worker comes free within
+        ``acquire_timeout`` seconds, e.g. because replacements fail to start.
+        """
+        waited = time.perf_counter()
+        try:
+            worker = _wait(self._idle, self.acquire_timeout, cancel)
+        except queue.Empty:
+            raise SandboxError(f"no sandbox worker became free within {self.acquire_timeout}s") from None
+        add_queue_time(time.perf_counter() - waited)
+        if cancel is not None and worker is cancel:
+            return cancelled_result(waited)
+        try:
+            return worker.run(code, timeout or self.timeout, cpu_seconds or self.cpu_seconds, module_name, cancel)
+        finally:
+            self._release(worker)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                break
+
+_pool: Optional[SandboxPool] = None
+_pool_lock = threading.Lock()
+
+def get_sandbox_pool():
+    """Return the process-wide sandbox pool configured from the environment"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool(
+                size=int(os.getenv("SANDBOX_WORKERS") or 2),
+                timeout=float(os.getenv("SANDBOX_TIMEOUT") or 10),
+                memory_mb=int(os.getenv("SANDBOX_MEMORY_MB") or 1024),
+                cpu_seconds=int(os.getenv("SANDBOX_CPU_SECONDS") or 10),
+                max_runs=int(os.getenv("SANDBOX_MAX_RUNS") or 20),
+                acquire_timeout=float(os.getenv("SANDBOX_ACQUIRE_TIMEOUT") or 60),
+            )
+            atexit.register(_pool.close)
+        return _pool
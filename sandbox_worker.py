@@ -0,0 +1,111 @@
+"""Sandbox worker process, started and driven by sandbox.SandboxPool
+
+Reads one JSON job per line from the protocol input, runs the code in a
+fresh namespace with stdout/stderr captured and writes one JSON result
+per line back, echoing the job's nonce. Only the standard library is
+imported so workers stay small and start quickly.
+
+File descriptors 0-2 point at /dev/null, so print() and input() never
+reach the protocol, but the protocol pipes stay open in this process and
+generated code can still write to them. The pool therefore only accepts
+a response carrying the nonce of the job it sent, and discards the
+worker on any other line. That catches stray and forged writes; it does
+not stop code that searches the worker's memory for the nonce, so treat
+results as no more trustworthy than the generated code itself.
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import traceback
+
+try:
+    import resource
+except ImportError:  # Windows: no RLIMIT support, wall-clock timeout still applies
+    resource = None
+
+# Imported up front so generated code does not pay for them on every run
+import collections, functools, heapq, itertools, math, re, typing  # noqa: E401,F401
+
+def _set_memory_limit(memory_mb):
+    if resource is None or memory_mb <= 0:
+        return
+    limit = memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def _set_cpu_limit(cpu_seconds):
+    """Allow ``cpu_seconds`` more CPU time; RLIMIT_CPU counts the whole process lifetime"""
+    if resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if cpu_seconds <= 0:
+        soft = hard
+    else:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime + cpu_seconds) + 1
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+def _jsonable(value):
+    try:
+        json.dumps(value)
+        return value
+    except (TypeError, ValueError):
+        return repr(value)
+
+def run_job(job):
+    stdout, stderr = io.StringIO(), io.StringIO()
+    namespace = {"__name__": job.get("module_name") or "__main__", "__builtins__": __builtins__}
+    response = {"success": True, "error": None, "traceback": None, "result": None}
+    _set_cpu_limit(job.get("cpu_seconds", 0))
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            exec(compile(job["code"], "<generated>", "exec"), namespace)
+    except BaseException as e:  # SystemExit and KeyboardInterrupt from user code count as failures too
+        response["success"] = False
+        response["error"] = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+        # Skip this module's frame so the traceback starts in the generated code
+        response["traceback"] = "".join(traceback.format_exception(type(e), e, e.__traceback__.tb_next))
+    finally:
+        _set_cpu_limit(0)
+    response["duration"] = time.perf_counter() - start
+    response["stdout"] = stdout.getvalue()
+    response["stderr"] = stderr.getvalue()
+    if "__result__" in namespace:
+        response["result"] = _jsonable(namespace["__result__"])
+    return response
+
+def main():
+    memory_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+
+    # Keep private copies of the protocol pipes, then point fds 0-2 at /dev/null
+    # so output and input of generated code do not go through the protocol
+    proto_in = os.fdopen(os.dup(0), "r", encoding="utf-8")
+    proto_out = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    sys.stdin = io.StringIO("")
+
+    _set_memory_limit(memory_mb)
+    proto_out.write(json.dumps({"ready": True}) + "\n")
+    proto_out.flush()
+
+    for line in proto_in:
+        job = json.loads(line)
+        nonce = job.pop("nonce", None)
+        try:
+            response = run_job(job)
+        except MemoryError:
+            response = {"success": False, "error": "MemoryError: memory limit exceeded", "traceback": None,
+                        "result": None, "stdout": "", "stderr": "", "duration": 0.0}
+        response["nonce"] = nonce
+        proto_out.write(json.dumps(response) + "\n")
+        proto_out.flush()
+
+if __name__ == "__main__":
+    main()
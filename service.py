@@ -0,0 +1,412 @@
+"""Headless HTTP service that runs the workflow in a pool of worker processes
+
+    python service.py --port 8000 --workers 4
+
+    POST /jobs                {"requirement": ...}            -> 202 {"job_id", "run_id"}
+    POST /jobs                {"run_id": ..., "checkpoint_id": ...}  resume or branch a run
+    GET  /jobs/{job_id}       status, and the final state once finished
+    GET  /jobs/{job_id}/events  server-sent events: started, partial, update, done or error
+    GET  /runs/{run_id}       checkpoint status and history of a run
+    GET  /healthz
+
+Jobs go onto a local queue drained by SERVICE_WORKERS processes, each
+with its own compiled graph and sandbox pool. The events a worker
+produces are kept on the job, so an SSE client that connects late or
+reconnects with Last-Event-ID gets the events it missed; a run of
+partial outputs keeps only the latest (each repeats the ones before),
+and a finished job nobody is following keeps only its final event. A new
+requirement identical to one queued or running (see single_flight.py)
+attaches to that job instead of starting another; when every SSE client
+of a job disconnects for SINGLE_FLIGHT_GRACE seconds the job is
+cancelled after its current step. Jobs nobody follows over SSE always
+run to the end. Run more
+service instances behind a load balancer to scale out; they share
+checkpoints through CHECKPOINT_DB.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+FINAL_EVENTS = ("done", "error", "cancelled")
+
+def _jsonable(value):
+    return json.loads(json.dumps(value, default=str))
+
+def _cancel_requested(cancels, job_id, seen):
+    while True:
+        try:
+            seen.add(cancels.get_nowait())
+        except queue.Empty:
+            return job_id in seen
+
+def _worker(jobs, events, cancels):
+    """Worker process: build the graph once, then run jobs until a None arrives"""
+    from resources import get_resources
+    from streaming import run_events
+
+    app = get_resources().app
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        job_id = job["job_id"]
+        events.put((job_id, "started", None, {"worker": os.getpid()}))
+        inputs = {"requirement": job["requirement"]} if job.get("requirement") else None
+        stream = run_events(app, inputs, job["run_id"], job.get("checkpoint_id"))
+        seen = set()
+        try:
+            for kind, node, payload in stream:
+                if _cancel_requested(cancels, job_id, seen):
+                    # Stops after the step that just finished; its checkpoint is kept for a resume
+                    stream.close()
+                    events.put((job_id, "cancelled", None, {"error": "Cancelled: every subscriber left"}))
+                    break
+                events.put((job_id, kind, node, _jsonable(payload)))
+        except Exception as e:
+            events.put((job_id, "error", None, {"error": f"{type(e).__name__}: {e}"}))
+
+class Job:
+    def __init__(self, job_id, run_id, request, key=None):
+        self.job_id = job_id
+        self.run_id = run_id
+        self.request = request
+        self.key = key
+        self.subscribers = 0
+        self.cancel_requested = False
+        self.status = "queued"
+        self.worker: Optional[int] = None
+        self.events: List[Dict[str, Any]] = []
+        self.next_id = 0
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.waiters = set()
+
+    @property
+    def done(self):
+        return self.status in ("completed", "failed", "cancelled")
+
+    def add_event(self, kind, node, data):
+        event = {"id": self.next_id, "kind": kind, "node": node, "data": data}
+        self.next_id += 1
+        last = self.events[-1] if self.events else None
+        if kind == "partial" and last is not None and last["kind"] == "partial" and last["node"] == node:
+            # Partial outputs repeat everything streamed so far; keep only the latest of a run of them
+            self.events[-1] = event
+        else:
+            self.events.append(event)
+
+    def compact(self):
+        """Drop everything but the final event once the job is finished and nobody is following it"""
+        if self.done and self.subscribers == 0:
+            self.events = self.events[-1:]
+
+    def events_after(self, after):
+        """Events with an id above ``after``; ids only grow, so scan back from the newest"""
+        start = len(self.events)
+        while start > 0 and self.events[start - 1]["id"] > after:
+            start -= 1
+        return self.events[start:]
+
+    def summary(self):
+        result = {
+            "job_id": self.job_id,
+            "run_id": self.run_id,
+            "status": self.status,
+            "created": self.created,
+            "finished": self.finished,
+            "events": self.next_id,
+        }
+        if self.events and self.events[-1]["kind"] in FINAL_EVENTS:
+            result["result"] = self.events[-1]["data"]
+        return result
+
+class JobManager:
+    """Queue of jobs, the worker processes draining it and the events they send back"""
+
+    def __init__(self, workers=2, max_jobs=1000, grace=5.0, coalesce=True):
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.grace = grace
+        self.coalesce = coalesce
+        self.jobs: Dict[str, Job] = {}
+        # Unfinished jobs by coalescing key, and each worker's queue of jobs to cancel
+        self.in_flight: Dict[str, Job] = {}
+        self._cancels: Dict[int, Any] = {}
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._context = multiprocessing.get_context("spawn")
+        self._jobs = self._context.Queue()
+        self._events = self._context.Queue()
+        self._processes = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._running = False
+
+    def start(self, loop):
+        self._loop = loop
+        self._running = True
+        self._processes = [self._spawn() for _ in range(self.workers)]
+        threading.Thread(target=self._read_events, daemon=True).start()
+        print(f"Service started {self.workers} workers")
+
+    def stop(self):
+        self._running = False
+        for _ in self._processes:
+            self._jobs.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+
+    def _spawn(self):
+        cancels = self._context.Queue()
+        process = self._context.Process(target=_worker, args=(self._jobs, self._events, cancels), daemon=True)
+        process.start()
+        self._cancels[process.pid] = cancels
+        return process
+
+    def submit(self, requirement=None, run_id=None, checkpoint_id=None):
+        """Queue a job, or return the unfinished job for the same requirement and config"""
+        from checkpoints import new_run_id
+        from resources import config_fingerprint
+        from single_flight import coalesce_key
+
+        # Resumes and branches continue a particular run, so only new runs are coalesced
+        key = coalesce_key(requirement, config_fingerprint()) if self.coalesce and requirement else None
+        with self._lock:
+            existing = self.in_flight.get(key) if key else None
+            if existing is not None:
+                self.coalesced += 1
+                print(f"Job {existing.job_id} is already running this requirement; attaching the request to it")
+                return existing
+            job = Job(uuid.uuid4().hex[:12], run_id or new_run_id(),
+                      {"requirement": requirement, "checkpoint_id": checkpoint_id}, key)
+            self.jobs[job.job_id] = job
+            if key:
+                self.in_flight[key] = job
+            self._evict()
+        self._jobs.put({"job_id": job.job_id, "run_id": job.run_id, **job.request})
+        return job
+
+    def subscribe(self, job):
+        with self._lock:
+            job.subscribers += 1
+
+    def unsubscribe(self, job):
+        """Drop an SSE client; the job is cancelled if none is back within the grace period"""
+        with self._lock:
+            job.subscribers -= 1
+            if job.subscribers > 0:
+                return
+            if job.done:
+                job.compact()
+                return
+        self._loop.call_later(self.grace, self._cancel_if_abandoned, job)
+
+    def _cancel_if_abandoned(self, job):
+        with self._lock:
+            if job.subscribers > 0 or job.done or job.cancel_requested:
+                return
+            job.cancel_requested = True
+            # Later identical requests start a new job instead of joining one that is stopping
+            if job.key and self.in_flight.get(job.key) is job:
+                del self.in_flight[job.key]
+            worker = job.worker
+        print(f"Cancelling job {job.job_id}: every subscriber left")
+        if worker is not None:
+            self._cancels[worker].put(job.job_id)
+
+    def _evict(self):
+        finished = sorted((j for j in self.jobs.values() if j.done), key=lambda j: j.finished)
+        for job in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[job.job_id]
+
+    def _read_events(self):
+        while self._running:
+            try:
+                job_id, kind, node, data = self._events.get(timeout=1.0)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            self._record(job_id, kind, node, data)
+
+    def _record(self, job_id, kind, node, data):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            job.add_event(kind, node, data)
+            if kind == "started":
+                job.status, job.worker = "running", data["worker"]
+                if job.cancel_requested:
+                    # Abandoned while it was still queued
+                    self._cancels[job.worker].put(job_id)
+            elif kind in FINAL_EVENTS:
+                job.status = {"done": "completed", "error": "failed", "cancelled": "cancelled"}[kind]
+                job.finished = time.time()
+                if job.key and self.in_flight.get(job.key) is job:
+                    del self.in_flight[job.key]
+                job.compact()
+        self._loop.call_soon_threadsafe(self._wake, job)
+
+    @staticmethod
+    def _wake(job):
+        for waiter in job.waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        job.waiters.clear()
+
+    def _check_workers(self):
+        """Replace dead worker processes and fail the jobs they were running"""
+        for i, process in enumerate(self._processes):
+            if process.is_alive() or not self._running:
+                continue
+            print(f"Worker {process.pid} exited with {process.exitcode}; starting a replacement")
+            with self._lock:
+                lost = [j for j in self.jobs.values() if j.worker == process.pid and not j.done]
+            for job in lost:
+                self._record(job.job_id, "error", None, {"error": f"Worker exited with code {process.exitcode}"})
+            self._cancels.pop(process.pid, None)
+            self._processes[i] = self._spawn()
+
+    async def events(self, job, after=-1, heartbeat=15.0):
+        """Yield the job's events after id ``after``, waiting for new ones until it finishes
+
+        A partial output that replaced one already sent is sent again under its new id.
+        """
+        while True:
+            # Read before the events: a job marked done already holds its final event
+            done = job.done
+            for event in job.events_after(after):
+                yield event
+                after = event["id"]
+            if done:
+                return
+            waiter = self._loop.create_future()
+            job.waiters.add(waiter)
+            if job.events_after(after) or job.done:
+                continue
+            try:
+                await asyncio.wait_for(waiter, heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+
+def _sse(event):
+    if event is None:
+        return ": keep-alive\n\n"  # comment line so proxies keep the connection open
+    payload = json.dumps({"node": event["node"], "data": event["data"]})
+    return f"id: {event['id']}\nevent: {event['kind']}\ndata: {payload}\n\n"
+
+def create_app(workers=None):
+    from resources import env_flag
+
+    manager = JobManager(
+        workers=workers or int(os.getenv("SERVICE_WORKERS") or 2),
+        max_jobs=int(os.getenv("SERVICE_MAX_JOBS") or 1000),
+        grace=float(os.getenv("SINGLE_FLIGHT_GRACE") or 5),
+        coalesce=not env_flag("SINGLE_FLIGHT_DISABLED"),
+    )
+
+    def get_job(request):
+        return manager.jobs.get(request.path_params["job_id"])
+
+    async def submit(request: Request):
+        body = await request.json()
+        if not body.get("requirement") and not body.get("run_id"):
+            return JSONResponse({"error": "Send a requirement, or a run_id to resume"}, status_code=400)
+        job = await run_in_threadpool(manager.submit, body.get("requirement"), body.get("run_id"),
+                                      body.get("checkpoint_id"))
+        return JSONResponse({"job_id": job.job_id, "run_id": job.run_id, "status": job.status}, status_code=202)
+
+    async def job_status(request: Request):
+        job = get_job(request)
+        if job is None:
+            return JSONResponse({"error": "Unknown job"}, status_code=404)
+        return JSONResponse(job.summary())
+
+    async def job_events(request: Request):
+        job = get_job(request)
+        if job is None:
+            return JSONResponse({"error": "Unknown job"}, status_code=404)
+        after = int(request.headers.get("last-event-id") or request.query_params.get("after") or -1)
+
+        async def stream():
+            manager.subscribe(job)
+            try:
+                async for event in manager.events(job, after):
+                    yield _sse(event)
+            finally:
+                manager.unsubscribe(job)
+
+        return StreamingResponse(stream(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    async def run_info(request: Request):
+        from checkpoints import run_history, run_status
+
+        run_id = request.path_params["run_id"]
+
+        def lookup():
+            # Straight from the checkpointer: the HTTP process never builds a graph or a sandbox pool
+            return {"run_id": run_id, "status": run_status(run_id), "history": run_history(run_id)}
+
+        return JSONResponse(_jsonable(await run_in_threadpool(lookup)))
+
+    async def health(request: Request):
+        with manager._lock:
+            counts = {}
+            for job in manager.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        alive = sum(p.is_alive() for p in manager._processes)
+        return JSONResponse({"workers": manager.workers, "workers_alive": alive, "jobs": counts,
+                             "in_flight": len(manager.in_flight), "coalesced": manager.coalesced})
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        manager.start(asyncio.get_running_loop())
+        try:
+            yield
+        finally:
+            manager.stop()
+
+    app = Starlette(
+        routes=[
+            Route("/jobs", submit, methods=["POST"]),
+            Route("/jobs/{job_id}", job_status),
+            Route("/jobs/{job_id}/events", job_events),
+            Route("/runs/{run_id}", run_info),
+            Route("/healthz", health),
+        ],
+        lifespan=lifespan,
+    )
+    app.state.manager = manager
+    return app
+
+def main():
+    import uvicorn
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Headless workflow service")
+    parser.add_argument("--host", default=os.getenv("SERVICE_HOST") or "127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVICE_PORT") or 8000))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVICE_WORKERS") or 2),
+                        help="Worker processes running workflows")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.workers), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
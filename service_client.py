@@ -0,0 +1,117 @@
+"""Client for service.py, used by the Streamlit page when SERVICE_URL is set"""
+import json
+import os
+import threading
+from typing import Optional
+
+import httpx
+
+class ServiceError(RuntimeError):
+    pass
+
+class RunEvents:
+    """Events of a submitted run; ``run_id`` differs from the one asked for when the
+    service attached the request to an identical run already in progress"""
+
+    def __init__(self, client, job):
+        self.job_id = job["job_id"]
+        self.run_id = job["run_id"]
+        self._iterator = client._run_events(self.job_id)
+
+    def __iter__(self):
+        return self._iterator
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self):
+        # Ends the SSE stream; the service cancels the run when no one else follows it
+        self._iterator.close()
+
+class ServiceClient:
+    def __init__(self, base_url, timeout=30.0):
+        self.base_url = base_url.rstrip("/")
+        self._http = httpx.Client(base_url=self.base_url, timeout=httpx.Timeout(timeout, read=None))
+
+    def submit(self, requirement=None, run_id=None, checkpoint_id=None):
+        """Queue a run; returns ``{"job_id", "run_id"}``"""
+        response = self._http.post("/jobs", json={"requirement": requirement, "run_id": run_id,
+                                                  "checkpoint_id": checkpoint_id})
+        response.raise_for_status()
+        return response.json()
+
+    def job(self, job_id):
+        response = self._http.get(f"/jobs/{job_id}")
+        response.raise_for_status()
+        return response.json()
+
+    def events(self, job_id, after=-1):
+        """Parsed server-sent events of a job as ``(id, kind, node, data)``, reconnecting if the stream drops"""
+        while True:
+            headers = {"Last-Event-ID": str(after)} if after >= 0 else {}
+            try:
+                with self._http.stream("GET", f"/jobs/{job_id}/events", headers=headers) as response:
+                    response.raise_for_status()
+                    event = {}
+                    for line in response.iter_lines():
+                        if line.startswith(":"):
+                            continue  # heartbeat
+                        if line:
+                            field, _, value = line.partition(": ")
+                            event[field] = value
+                            continue
+                        if "event" not in event:
+                            continue
+                        after = int(event["id"])
+                        payload = json.loads(event["data"])
+                        yield after, event["event"], payload["node"], payload["data"]
+                        if event["event"] in ("done", "error", "cancelled"):
+                            return
+                        event = {}
+                return
+            except (httpx.RemoteProtocolError, httpx.ReadError) as e:
+                print(f"Event stream for job {job_id} dropped ({type(e).__name__}); reconnecting after {after}")
+
+    def run_events(self, inputs, run_id, checkpoint_id=None):
+        """Same events as ``streaming.run_events``, produced by a service worker"""
+        return RunEvents(self, self.submit((inputs or {}).get("requirement"), run_id, checkpoint_id))
+
+    def _run_events(self, job_id):
+        events = self.events(job_id)
+        try:
+            for _, kind, node, data in events:
+                if kind == "started":
+                    continue
+                if kind in ("error", "cancelled"):
+                    raise ServiceError(data["error"])
+                yield kind, node, data
+        finally:
+            events.close()
+
+    def run_info(self, run_id):
+        response = self._http.get(f"/runs/{run_id}")
+        response.raise_for_status()
+        return response.json()
+
+    def run_status(self, run_id):
+        return self.run_info(run_id)["status"]
+
+    def run_history(self, run_id):
+        return self.run_info(run_id)["history"]
+
+_client: Optional[ServiceClient] = None
+_client_lock = threading.Lock()
+
+def get_service_client():
+    """Process-wide client for SERVICE_URL, or None to run the workflow in-process"""
+    global _client
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    url = os.getenv("SERVICE_URL")
+    if not url:
+        return None
+    with _client_lock:
+        if _client is None or _client.base_url != url.rstrip("/"):
+            _client = ServiceClient(url)
+        return _client
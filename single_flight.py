@@ -0,0 +1,190 @@
+"""Coalescing of identical in-flight workflow runs
+
+Concurrent runs of the same requirement under the same configuration,
+from different sessions or from a double-clicked button, attach to one
+run instead of each starting the full pipeline. The first caller starts
+the run in a background thread; every subscriber, including the first,
+gets all of its events from the beginning, then new ones as they arrive.
+Subscribers are reference counted per key; when the last one leaves and
+no new one arrives within SINGLE_FLIGHT_GRACE seconds the run is
+cancelled after its current step (its checkpoints are kept, so it can be
+resumed). Set SINGLE_FLIGHT_DISABLED=1 to run every request on its own.
+"""
+import hashlib
+import os
+import threading
+import unicodedata
+from typing import Callable, Dict, Iterator, List, Optional
+
+def normalise_requirement(requirement):
+    """``requirement`` with Unicode, line endings and runs of whitespace normalised"""
+    return " ".join(unicodedata.normalize("NFC", requirement or "").split())
+
+def coalesce_key(requirement, *config):
+    """Key shared by runs that would do the same work: the normalised requirement and the config"""
+    text = "\n".join([normalise_requirement(requirement), *map(str, config)])
+    return hashlib.sha256(text.encode()).hexdigest()
+
+class Flight:
+    """One in-progress run, its events so far and the subscribers following it"""
+
+    def __init__(self, key, run_id):
+        self.key = key
+        self.run_id = run_id
+        self.events: List[tuple] = []
+        self.subscribers = 0
+        self.done = False
+        self.cancelled = False
+        self.error: Optional[BaseException] = None
+        self.cond = threading.Condition()
+
+    def publish(self, event):
+        with self.cond:
+            last = self.events[-1] if self.events else None
+            if event[0] == "partial" and last is not None and last[0] == "partial" and last[1] == event[1]:
+                # Partial outputs repeat everything streamed so far; keep only the latest of a run of them
+                self.events[-1] = event
+            else:
+                self.events.append(event)
+            self.cond.notify_all()
+
+    def finish(self, error=None):
+        with self.cond:
+            self.done = True
+            self.error = error
+            self.cond.notify_all()
+
+class Subscription:
+    """Events of a flight for one subscriber; iterate it, and close it (or let it go) when done"""
+
+    def __init__(self, group, flight, shared):
+        self._group = group
+        self.flight = flight
+        self.run_id = flight.run_id
+        self.shared = shared
+        self._released = False
+        self._iterator = self._follow()
+
+    def _follow(self):
+        flight, sent = self.flight, 0
+        try:
+            while True:
+                with flight.cond:
+                    while sent >= len(flight.events) and not flight.done:
+                        flight.cond.wait()
+                    pending = flight.events[sent:]
+                    sent = len(flight.events)
+                    finished, error = flight.done, flight.error
+                yield from pending
+                if finished and sent >= len(flight.events):
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            self._leave()
+
+    def _leave(self):
+        if not self._released:
+            self._released = True
+            self._group._release(self.flight)
+
+    def __iter__(self) -> Iterator[tuple]:
+        return self._iterator
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self):
+        self._iterator.close()
+        # A subscription that was never iterated has no generator frame to run the cleanup
+        self._leave()
+
+    def __del__(self):
+        self._leave()
+
+class SingleFlight:
+    """Runs keyed by ``coalesce_key``; subscribing to a key in flight attaches to its run"""
+
+    def __init__(self, grace=5.0):
+        self.grace = grace
+        self._flights: Dict[str, Flight] = {}
+        # Re-entrant: a subscription collected by the GC releases itself from whatever thread runs the collection
+        self._lock = threading.RLock()
+        self.started = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def subscribe(self, key, run_id, start: Callable[[], Iterator[tuple]]) -> Subscription:
+        """Follow the run in flight for ``key``, or start one with ``start()`` under ``run_id``"""
+        with self._lock:
+            flight = self._flights.get(key)
+            shared = flight is not None
+            if shared:
+                self.coalesced += 1
+                print(f"Attaching to run {flight.run_id} already in progress for the same requirement "
+                      f"({flight.subscribers} other subscribers)")
+            else:
+                flight = self._flights[key] = Flight(key, run_id)
+                self.started += 1
+            flight.subscribers += 1
+        if not shared:
+            threading.Thread(target=self._produce, args=(flight, start), daemon=True).start()
+        return Subscription(self, flight, shared)
+
+    def _produce(self, flight, start):
+        error = None
+        events = None
+        try:
+            events = start()
+            for event in events:
+                if flight.cancelled:
+                    break
+                flight.publish(event)
+        except Exception as e:
+            error = e
+        finally:
+            if events is not None and hasattr(events, "close"):
+                events.close()
+            with self._lock:
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+            flight.finish(error)
+
+    def _release(self, flight):
+        with self._lock:
+            flight.subscribers -= 1
+            if flight.subscribers > 0 or flight.done:
+                return
+        timer = threading.Timer(self.grace, self._cancel_if_abandoned, args=(flight,))
+        timer.daemon = True
+        timer.start()
+
+    def _cancel_if_abandoned(self, flight):
+        with self._lock:
+            if flight.subscribers > 0 or flight.done or flight.cancelled:
+                return
+            flight.cancelled = True
+            self.cancelled += 1
+            # New requests for the same key start afresh rather than join a run that is stopping
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        print(f"Cancelling run {flight.run_id}: every subscriber left")
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
+
+    def summary(self):
+        return (f"Single flight: {self.started} runs started, {self.coalesced} requests attached to a run "
+                f"in progress, {self.cancelled} abandoned runs cancelled")
+
+_single_flight: Optional[SingleFlight] = None
+_single_flight_lock = threading.Lock()
+
+def get_single_flight():
+    """Return the process-wide single-flight group"""
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight(grace=float(os.getenv("SINGLE_FLIGHT_GRACE") or 5))
+        return _single_flight
@@ -0,0 +1,287 @@
+"""Near-duplicate index of solved requirements
+
+Requirements are normalised (lower case, stop words and punctuation
+removed, common suffixes stripped, a few synonyms folded together) and
+embedded as hashed TF-IDF vectors of words and unordered word pairs, so
+paraphrases such as "reverse a string", "reverse the given strings" and
+"return the string backwards" land close together while "reverse a
+list" or "minimum" against "maximum" do not. Term frequencies are stored
+and weighted with the current IDF at lookup time, so scores do not drift
+as the index grows. A lookup is one matrix-vector product over a NumPy
+array held in memory; the solutions live in a SQLite table so the index
+survives restarts. A hit is only reused when the stored code defines the
+functions the requirement names, with an argument count that fits.
+Only passing solutions are recorded. The index keeps at most
+``max_entries`` of them and evicts the least recently used.
+"""
+import ast
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Any, NamedTuple, Optional
+
+import numpy as np
+
+from harness import accepts
+
+DIMENSIONS = 2 ** 12
+
+STOP_WORDS = frozenset(
+    "a an the of to in on for and or with that this which is are be it its as by from given "
+    "write create implement make function program python code return returns should will can "
+    "please me i we you find get check determine whether if compute calculate element item valu".split()
+)
+_WORD = re.compile(r"[a-z0-9]+")
+_SUFFIXES = ("ing", "ed", "ly")
+
+# Stemmed words folded into one term, so common paraphrases share their features
+SYNONYMS = {
+    "backward": "revers", "invert": "revers", "flip": "revers",
+    "maximum": "max", "largest": "max", "biggest": "max", "greatest": "max", "highest": "max",
+    "minimum": "min", "smallest": "min", "lowest": "min", "least": "min",
+    "total": "sum",
+    "duplicat": "uniqu", "distinct": "uniqu",
+    "array": "list",
+    "text": "str",
+}
+
+# Calls such as ``reverse_string(s)``, names in backticks and snake_case identifiers
+_CALL = re.compile(r"\b([A-Za-z_]\w*)\(([^()]*)\)")
+_NAMED = re.compile(r"`([A-Za-z_]\w*)`|\b([a-z][a-z0-9]*(?:_[a-z0-9]+)+)\b")
+
+def _stem(word):
+    """Crude suffix stripping: "reverses", "reversed" and "reversing" all become revers"""
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        word = word[:-1]
+    for suffix in _SUFFIXES:
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            word = word[:-len(suffix)]
+            break
+    if len(word) > 3 and word.endswith("e"):
+        word = word[:-1]
+    return word
+
+def normalise(text):
+    """Lower-cased, stemmed content words with synonyms folded, joined by single spaces"""
+    # Argument lists are checked by fits(), not compared as words
+    text = _CALL.sub(r"\1", text)
+    words = (_stem(word) for word in _WORD.findall(text.lower()) if word not in STOP_WORDS)
+    return " ".join(SYNONYMS.get(word, word) for word in words if word not in STOP_WORDS)
+
+def feature_counts(normalised):
+    """Hashed bucket counts of words and adjacent word pairs, in either order"""
+    words = normalised.split()
+    features = words + [" ".join(sorted(pair)) for pair in zip(words, words[1:])]
+    # crc32 rather than hash() so buckets are stable across processes
+    return Counter(zlib.crc32(feature.encode()) % DIMENSIONS for feature in features)
+
+def named_functions(requirement):
+    """Functions a requirement names, with the argument count of a call written out (None if unknown)"""
+    names = {}
+    for name, args in _CALL.findall(requirement):
+        names[name] = len([arg for arg in args.split(",") if arg.strip()])
+    for quoted, snake in _NAMED.findall(requirement):
+        names.setdefault(quoted or snake, None)
+    return names
+
+def fits(requirement, code):
+    """Whether ``code`` defines every function ``requirement`` names, accepting the arguments it shows"""
+    names = named_functions(requirement)
+    if not names:
+        return True
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return False
+    functions = {node.name: node for node in ast.walk(tree) if isinstance(node, ast.FunctionDef)}
+    return all(name in functions and (n_args is None or accepts(functions[name], n_args))
+               for name, n_args in names.items())
+
+class Match(NamedTuple):
+    requirement: str
+    code: str
+    tests: Any
+    similarity: float
+
+class SolutionIndex:
+    """Bounded in-memory vector index over a SQLite table of solutions"""
+
+    def __init__(self, path, max_entries=1000, threshold=0.8):
+        self.path = path
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        # Term frequencies, one column per entry, so a lookup only reads the rows of the query's buckets
+        self._matrix = np.zeros((DIMENSIONS, max_entries), dtype=np.float32)
+        # Length of each entry's vector under the current IDF; recomputed after the corpus changes
+        self._norms: Optional[np.ndarray] = None
+        self._last_used = np.zeros(max_entries)
+        self._counts = [None] * max_entries
+        self._keys = [None] * max_entries
+        self._slots = {}
+        self._pending_hits = {}
+        self._df = np.zeros(DIMENSIONS)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS solutions ("
+            "key TEXT PRIMARY KEY, requirement TEXT NOT NULL, code TEXT NOT NULL, tests TEXT NOT NULL, "
+            "created REAL NOT NULL, last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.commit()
+        self._load()
+
+    def _load(self):
+        rows = self._db.execute(
+            "SELECT key, last_used FROM solutions ORDER BY last_used DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        for slot, (key, last_used) in enumerate(rows):
+            self._place(slot, key, last_used)
+
+    def _idf(self):
+        return (np.log((1 + len(self._slots)) / (1 + self._df)) + 1).astype(np.float32)
+
+    @staticmethod
+    def _tf(counts):
+        """Sublinear term frequencies of ``counts``, not yet weighted"""
+        vector = np.zeros(DIMENSIONS, dtype=np.float32)
+        if counts:
+            buckets = np.fromiter(counts.keys(), dtype=np.int64)
+            vector[buckets] = 1 + np.log(np.fromiter(counts.values(), dtype=np.float32))
+        return vector
+
+    def _place(self, slot, key, last_used):
+        counts = feature_counts(key)
+        self._counts[slot] = counts
+        self._keys[slot] = key
+        self._slots[key] = slot
+        self._last_used[slot] = last_used
+        self._matrix[:, slot] = self._tf(counts)
+        for bucket in counts:
+            self._df[bucket] += 1
+        self._norms = None
+
+    def _evict(self, slot):
+        key = self._keys[slot]
+        for bucket in self._counts[slot]:
+            self._df[bucket] -= 1
+        del self._slots[key]
+        self._pending_hits.pop(key, None)
+        self._keys[slot] = self._counts[slot] = None
+        self._matrix[:, slot] = 0
+        self._last_used[slot] = 0
+        self._norms = None
+        self._db.execute("DELETE FROM solutions WHERE key = ?", (key,))
+
+    def similarities(self, requirement):
+        """Cosine similarity of ``requirement`` to every slot under the current IDF (0 for empty slots)"""
+        idf = self._idf()
+        if self._norms is None:
+            self._norms = np.sqrt((idf ** 2) @ (self._matrix ** 2))
+        query = self._tf(feature_counts(normalise(requirement))) * idf
+        buckets = np.flatnonzero(query)
+        norm = np.linalg.norm(query)
+        if not norm:
+            return np.zeros(self.max_entries)
+        dots = (query[buckets] * idf[buckets]) @ self._matrix[buckets]
+        return np.divide(dots, norm * self._norms, out=np.zeros(self.max_entries), where=self._norms > 0)
+
+    def lookup(self, requirement, threshold=None) -> Optional[Match]:
+        """Closest stored solution that reaches the threshold and defines the functions the requirement names"""
+        threshold = self.threshold if threshold is None else threshold
+        with self._lock:
+            if not self._slots or not normalise(requirement):
+                self.misses += 1
+                return None
+            similarities = self.similarities(requirement)
+            for slot in np.argsort(-similarities):
+                similarity = float(similarities[slot])
+                if similarity < threshold:
+                    break
+                stored, code, tests = self._db.execute(
+                    "SELECT requirement, code, tests FROM solutions WHERE key = ?", (self._keys[slot],)
+                ).fetchone()
+                if not fits(requirement, code):
+                    self.rejected += 1
+                    continue
+                self._last_used[slot] = time.time()
+                # Recency is written with the next record() rather than committing on every hit
+                self._pending_hits[self._keys[slot]] = self._pending_hits.get(self._keys[slot], 0) + 1
+                self.hits += 1
+                return Match(stored, code, json.loads(tests), round(similarity, 4))
+            self.misses += 1
+            return None
+
+    def record(self, requirement, code, tests):
+        """Store a solution that passed its tests, replacing one for the same normalised text"""
+        key = normalise(requirement)
+        if not key:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO solutions (key, requirement, code, tests, created, last_used) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET requirement = excluded.requirement, code = excluded.code, "
+                "tests = excluded.tests, last_used = excluded.last_used",
+                (key, requirement, code, json.dumps(tests), now, now),
+            )
+            slot = self._slots.get(key)
+            if slot is None:
+                if len(self._slots) >= self.max_entries:
+                    slot = int(np.argmin(self._last_used))
+                    self._evict(slot)
+                else:
+                    slot = self._keys.index(None)
+                self._place(slot, key, now)
+            else:
+                self._last_used[slot] = now
+            self._flush_hits()
+            self._db.commit()
+
+    def _flush_hits(self):
+        for key, hits in self._pending_hits.items():
+            slot = self._slots.get(key)
+            if slot is not None:
+                self._db.execute(
+                    "UPDATE solutions SET last_used = ?, hits = hits + ? WHERE key = ?",
+                    (self._last_used[slot], hits, key),
+                )
+        self._pending_hits.clear()
+
+    def __len__(self):
+        return len(self._slots)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._slots),
+                "hits": self.hits,
+                "misses": self.misses,
+                "rejected": self.rejected,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+_index: Optional[SolutionIndex] = None
+_index_lock = threading.Lock()
+
+def get_solution_index():
+    """Return the process-wide solution index configured from the environment"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SolutionIndex(
+                os.getenv("SOLUTION_INDEX_PATH") or ".cache/solutions.sqlite",
+                max_entries=int(os.getenv("SOLUTION_INDEX_MAX_ENTRIES") or 1000),
+                threshold=float(os.getenv("SOLUTION_INDEX_THRESHOLD") or 0.8),
+            )
+        return _index
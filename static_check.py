@@ -0,0 +1,224 @@
+"""Static checks on generated code before it is executed
+
+Runs in a few milliseconds in the server process: strips markdown fences
+and stray indentation, parses the code, adds missing standard-library
+imports for names the code uses, rejects forbidden imports and modules
+that are not installed, checks that a function the tests can call exists
+with a fitting arity, and compiles the result. Problems that cannot be
+fixed locally go straight to the debugger as precise diagnostics instead
+of costing a sandbox run and an execution-agent call first.
+"""
+import ast
+import builtins
+import importlib.util
+import os
+import re
+import sys
+import textwrap
+import threading
+
+from harness import _arity, accepts, find_target_function
+from models import StaticReport
+
+# Modules generated code has no business importing in the sandbox
+DEFAULT_FORBIDDEN = "subprocess,socket,ctypes,multiprocessing,signal,shutil,requests,urllib,http,ftplib,smtplib"
+
+# Names commonly used without their import, and the import that provides them
+FROM_IMPORTS = {
+    "typing": ("Any", "Callable", "Dict", "Iterable", "Iterator", "List", "Optional", "Set", "Tuple", "Union"),
+    "collections": ("Counter", "OrderedDict", "defaultdict", "deque", "namedtuple"),
+    "functools": ("cache", "lru_cache", "reduce"),
+    "itertools": ("accumulate", "chain", "combinations", "permutations", "product"),
+    "heapq": ("heapify", "heappop", "heappush"),
+    "math": ("ceil", "floor", "gcd", "inf", "sqrt"),
+    "fractions": ("Fraction",),
+    "decimal": ("Decimal",),
+}
+_FROM_IMPORT = {name: module for module, names in FROM_IMPORTS.items() for name in names}
+
+_FENCE = re.compile(r"```[a-zA-Z0-9_+-]*\n(.*?)(?:```|\Z)", re.S)
+
+def forbidden_imports():
+    return {m.strip() for m in (os.getenv("STATIC_FORBIDDEN_IMPORTS") or DEFAULT_FORBIDDEN).split(",") if m.strip()}
+
+def _strip_fences(code):
+    match = _FENCE.search(code)
+    return match.group(1) if match else code
+
+def _parses(code):
+    try:
+        ast.parse(code)
+        return True
+    except SyntaxError:
+        return False
+
+def _parse(code, fixes):
+    """Parse ``code``, trying whitespace repairs on indentation and tab errors"""
+    try:
+        return code, ast.parse(code)
+    except SyntaxError as error:
+        for repair, note in ((textwrap.dedent, "removed common indentation"),
+                             (lambda c: c.expandtabs(4), "replaced tabs with spaces")):
+            repaired = repair(code)
+            if repaired == code:
+                continue
+            try:
+                tree = ast.parse(repaired)
+            except SyntaxError:
+                continue
+            fixes.append(note)
+            return repaired, tree
+        raise error
+
+def _syntax_diagnostic(error):
+    where = f"line {error.lineno}" + (f", column {error.offset}" if error.offset else "")
+    text = f"\n    {error.text.rstrip()}" if error.text else ""
+    return f"{type(error).__name__} at {where}: {error.msg}{text}"
+
+def _bound_names(tree):
+    names = set(dir(builtins))
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            names.update(node.names)
+        elif isinstance(node, ast.MatchAs) and node.name:
+            names.add(node.name)
+    return names
+
+def _undefined_names(tree):
+    """Names loaded somewhere but bound nowhere, in order of first use"""
+    if any(isinstance(n, ast.ImportFrom) and any(a.name == "*" for a in n.names) for n in ast.walk(tree)):
+        return []
+    bound = _bound_names(tree)
+    seen = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in bound and node.id not in seen:
+            seen.append(node.id)
+    return seen
+
+def _add_imports(code, tree, fixes, warnings):
+    """Import standard-library names and modules the code uses without importing"""
+    modules, names = [], {}
+    for name in _undefined_names(tree):
+        if name in _FROM_IMPORT:
+            names.setdefault(_FROM_IMPORT[name], []).append(name)
+        elif name in sys.stdlib_module_names and not name.startswith("_"):
+            modules.append(name)
+        else:
+            warnings.append(f"name {name!r} is used but never defined")
+    lines = [f"import {m}" for m in modules]
+    lines += [f"from {m} import {', '.join(sorted(n))}" for m, n in names.items()]
+    if not lines:
+        return code, tree
+    fixes.append("added " + "; ".join(lines))
+    # After a module docstring and __future__ imports, which must come first
+    body = tree.body
+    insert_at = 0
+    while insert_at < len(body) and (
+        (insert_at == 0 and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant)
+         and isinstance(body[0].value.value, str))
+        or (isinstance(body[insert_at], ast.ImportFrom) and body[insert_at].module == "__future__")
+    ):
+        insert_at += 1
+    split = body[insert_at - 1].end_lineno if insert_at else 0
+    source = code.splitlines(keepends=True)
+    code = "".join(source[:split]) + "\n".join(lines) + "\n" + "".join(source[split:])
+    return code, ast.parse(code)
+
+def _import_diagnostics(tree):
+    forbidden = forbidden_imports()
+    diagnostics = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            modules = [node.module]
+        else:
+            continue
+        for module in modules:
+            top = module.split(".")[0]
+            if top in forbidden:
+                diagnostics.append(f"line {node.lineno}: import of {module!r} is not allowed; "
+                                   f"solve the task without {top}")
+            elif top not in sys.stdlib_module_names and importlib.util.find_spec(top) is None:
+                diagnostics.append(f"line {node.lineno}: module {top!r} is not installed; "
+                                   f"use the standard library instead")
+    return diagnostics
+
+def _describe_arity(func):
+    required, maximum = _arity(func)
+    if maximum is None:
+        return f"at least {required}"
+    return str(required) if required == maximum else f"{required} to {maximum}"
+
+def _target_diagnostics(code, tree, inputs):
+    functions = [n for n in tree.body if isinstance(n, ast.FunctionDef) and not n.name.startswith("_")]
+    if not functions:
+        if any(isinstance(n, ast.ClassDef) for n in tree.body):
+            return []  # A class-based API is left to the execution agent's harness
+        return ["the code defines no top-level function for the tests to call"]
+    if not inputs or not all(isinstance(row, list) for row in inputs):
+        return []
+    sizes = sorted({len(row) for row in inputs})
+    target = find_target_function(code, sizes[0])
+    func = next((f for f in functions if f.name == target), None)
+    if func is None or all(accepts(func, n) or accepts(func, 1) for n in sizes):
+        return []
+    values = " or ".join(map(str, sizes))
+    return [f"line {func.lineno}: {func.name}() takes {_describe_arity(func)} positional arguments, "
+            f"but each test case passes {values}"]
+
+def check_code(code, inputs=None) -> StaticReport:
+    """Check (and where possible fix) ``code`` against test ``inputs``; see the module docstring"""
+    fixes, warnings = [], []
+    fixed = code
+    if "```" in code and not _parses(code):
+        fixed = _strip_fences(code)
+        fixes.append("removed markdown fences")
+    try:
+        fixed, tree = _parse(fixed, fixes)
+    except SyntaxError as error:
+        return StaticReport(code=fixed, passed=False, diagnostics=[_syntax_diagnostic(error)], fixes=fixes)
+    fixed, tree = _add_imports(fixed, tree, fixes, warnings)
+    diagnostics = _import_diagnostics(tree) + _target_diagnostics(fixed, tree, inputs)
+    if not diagnostics:
+        try:
+            compile(fixed, "<generated>", "exec")
+        except (SyntaxError, ValueError) as error:
+            # e.g. 'return' outside function or a misplaced nonlocal, which ast.parse accepts
+            diagnostics.append(_syntax_diagnostic(error) if isinstance(error, SyntaxError) else str(error))
+    return StaticReport(code=fixed, passed=not diagnostics, diagnostics=diagnostics, fixes=fixes, warnings=warnings)
+
+def format_diagnostics(report: StaticReport):
+    return "Static check failed (the code was not run):\n" + "\n".join(f"- {d}" for d in report.diagnostics)
+
+class StaticStats:
+    """Process-wide counts of static checks, so saved executions can be judged"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.failed = 0
+        self.fixed = 0
+
+    def record(self, report: StaticReport):
+        with self._lock:
+            self.checks += 1
+            self.failed += not report.passed
+            self.fixed += bool(report.fixes) and report.passed
+
+    def summary(self):
+        with self._lock:
+            return (f"Static checks: {self.checks} run, {self.failed} sent to the debugger without executing, "
+                    f"{self.fixed} fixed locally")
+
+STATIC_STATS = StaticStats()
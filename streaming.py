@@ -0,0 +1,79 @@
+import time
+from typing import Any, Dict
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.utils.json import parse_partial_json
+
+class TimeToFirstTokenHandler(BaseCallbackHandler):
+    """Log how long each LLM call takes to produce its first streamed chunk"""
+
+    def __init__(self):
+        self.started: Dict[UUID, tuple] = {}
+        self.ttft: Dict[str, list] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node", "llm")
+        self.started[run_id] = (node, time.perf_counter())
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        entry = self.started.pop(run_id, None)
+        if entry is None:
+            return
+        node, start = entry
+        elapsed = time.perf_counter() - start
+        self.ttft.setdefault(node, []).append(elapsed)
+        print(f"Time to first token in {node}: {elapsed * 1000:.0f}ms")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self.started.pop(run_id, None)
+
+def _function_arguments(chunk):
+    call = chunk.additional_kwargs.get("function_call") or {}
+    if call.get("arguments"):
+        return call["arguments"]
+    # Tool-calling models stream the same JSON through tool_call_chunks
+    return "".join(c.get("args") or "" for c in getattr(chunk, "tool_call_chunks", None) or [])
+
+def stream_run(app, inputs, config=None):
+    """Run the graph and yield UI events as they happen
+
+    Yields ``("partial", node, output)`` while an agent's structured
+    output is still streaming, with ``output`` parsed from the incomplete
+    JSON so far, and ``("update", node, state)`` when a node finishes.
+    """
+    config = dict(config or {})
+    ttft = TimeToFirstTokenHandler()
+    config["callbacks"] = list(config.get("callbacks") or []) + [ttft]
+
+    buffers: Dict[Any, str] = {}
+    for mode, payload in app.stream(inputs, config=config, stream_mode=["updates", "messages"]):
+        if mode == "messages":
+            chunk, metadata = payload
+            arguments = _function_arguments(chunk)
+            if not arguments:
+                continue
+            node = metadata.get("langgraph_node")
+            buffers[chunk.id] = buffers.get(chunk.id, "") + arguments
+            parsed = parse_partial_json(buffers[chunk.id])
+            if isinstance(parsed, dict) and isinstance(parsed.get("output"), dict):
+                yield "partial", node, parsed["output"]
+        else:
+            for node, state in payload.items():
+                yield "update", node, state
+
+def run_events(app, inputs, run_id, checkpoint_id=None):
+    """``stream_run`` for a checkpointed run, ending with ``("done", None, summary)``
+
+    ``summary`` holds the final state and the run's metrics timeline and
+    totals. With ``inputs`` of None the run is resumed, or branched from
+    ``checkpoint_id``. Shared by the Streamlit page and the service workers.
+    """
+    from checkpoints import run_config
+    from metrics import MetricsCallbackHandler, track_run
+
+    config = run_config(run_id, checkpoint_id, callbacks=[MetricsCallbackHandler()])
+    with track_run(run_id) as run:
+        yield from stream_run(app, inputs, config=config)
+    state = app.get_state(run_config(run_id)).values
+    yield "done", None, {"state": dict(state), "timeline": run.timeline(), "totals": run.totals()}
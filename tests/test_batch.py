@@ -0,0 +1,39 @@
+import asyncio
+import json
+import threading
+import time
+
+from batch import run_batch
+
+class SlowApp:
+    """Stands in for a compiled graph: records how many runs overlap"""
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, state, config=None):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(0.05)
+        with self._lock:
+            self.running -= 1
+        if state["requirement"] == "boom":
+            raise ValueError("bad requirement")
+        return {"success": True, "code": state["requirement"]}
+
+def test_runs_are_bounded_and_the_pool_is_released(tmp_path):
+    app = SlowApp()
+    output = tmp_path / "results.jsonl"
+    before = threading.active_count()
+    results = asyncio.run(run_batch(["a", "b", "boom", "c", "d"], str(output), concurrency=2, app=app))
+    assert app.peak == 2
+    assert [r["index"] for r in results] == [0, 1, 2, 3, 4]
+    assert [r["success"] for r in results] == [True, True, False, True, True]
+    assert results[2]["exception"] == "ValueError: bad requirement"
+    assert len(output.read_text().splitlines()) == 5
+    assert json.loads(output.read_text().splitlines()[0])["requirement"] in "abcd"
+    # The executor is shut down with the batch rather than left on the event loop
+    assert threading.active_count() == before
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from candidates import race_candidates
+from harness import run_test_cases
+from sandbox import SandboxPool
+
+FAST = "def f(x):\n    return x * 2\n"
+WRONG = "def f(x):\n    return x\n"
+SLOW = "import time\n\ndef f(x):\n    time.sleep(30)\n    return x * 2\n"
+INPUTS, OUTPUTS = [[1], [2]], [2, 4]
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setenv("TEST_CASE_TIMEOUT", "60")
+    pool = SandboxPool(size=2, timeout=60, memory_mb=0, cpu_seconds=60)
+    yield pool
+    pool.close()
+
+def wait_for_idle(pool, count, timeout=10):
+    deadline = time.monotonic() + timeout
+    while pool._idle.qsize() < count and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return pool._idle.qsize()
+
+def test_losers_are_stopped_and_their_workers_released(pool, capsys):
+    workers = list(pool._idle.queue)
+    start = time.perf_counter()
+    winner, results = race_candidates([SLOW, FAST], INPUTS, OUTPUTS, pool=pool)
+    assert time.perf_counter() - start < 10
+    assert winner == 1
+    assert set(results) == {1}
+    assert "stopped 1 candidates still running" in capsys.readouterr().out
+    # The worker that ran the losing candidate was killed, and the pool is back to full strength
+    assert sum(not worker.alive() for worker in workers) == 1
+    assert wait_for_idle(pool, pool.size) == pool.size
+    assert all(r.passed for r in run_test_cases(FAST, INPUTS, OUTPUTS, pool))
+
+def test_without_cancellation_every_candidate_runs(pool):
+    winner, results = race_candidates([WRONG, FAST, FAST], INPUTS, OUTPUTS, cancel_policy="none", pool=pool)
+    assert winner == 1
+    assert set(results) == {0, 1, 2}
+    assert not all(r.passed for r in results[0])
+
+def test_no_winner_keeps_every_result(pool):
+    winner, results = race_candidates([WRONG, WRONG], INPUTS, OUTPUTS, pool=pool)
+    assert winner is None
+    assert set(results) == {0, 1}
+
+def test_cancel_event_stops_a_running_test(pool):
+    cancel = threading.Event()
+    threading.Timer(0.5, cancel.set).start()
+    start = time.perf_counter()
+    results = run_test_cases(SLOW, INPUTS, OUTPUTS, pool, cancel=cancel)
+    assert time.perf_counter() - start < 5
+    assert all(r.error.startswith("CancelledError") for r in results)
+
+def test_cancel_event_stops_a_run_waiting_for_a_worker(pool):
+    held = [pool._idle.get() for _ in range(pool.size)]
+    cancel = threading.Event()
+    threading.Timer(0.3, cancel.set).start()
+    try:
+        results = run_test_cases(FAST, INPUTS, OUTPUTS, pool, cancel=cancel)
+    finally:
+        for worker in held:
+            pool._idle.put(worker)
+    assert all(r.error.startswith("CancelledError") for r in results)
+    assert all(worker.alive() for worker in held)
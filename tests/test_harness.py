@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from harness import revalidate, run_test_cases, shard_limits
+from sandbox import SandboxPool
+
+CODE = '''
+def f(x):
+    if x < 0:
+        while True:
+            pass
+    if x == 99:
+        import os
+        os._exit(1)
+    return x * 2
+'''
+
+@pytest.fixture
+def pool():
+    pool = SandboxPool(size=2, timeout=1.0, memory_mb=0, cpu_seconds=1)
+    yield pool
+    pool.close()
+
+@pytest.fixture
+def counted(pool, monkeypatch):
+    calls = []
+    run = pool.run
+    monkeypatch.setattr(pool, "run", lambda code, *args, **kwargs: calls.append(kwargs) or run(code, *args, **kwargs))
+    return calls
+
+def test_cases_pass_and_fail_individually(pool):
+    results = run_test_cases(CODE, [[1], [2], [3]], [2, 5, 6], pool)
+    assert [r.passed for r in results] == [True, False, True]
+    assert results[1].actual == 4
+
+def test_shard_limits_scale_with_case_count(pool, monkeypatch):
+    monkeypatch.setenv("TEST_CASE_TIMEOUT", "0.5")
+    assert shard_limits(pool, 1) == (pool.timeout + 1.5, 3)
+    timeout, cpu_seconds = shard_limits(pool, 10)
+    assert timeout >= 10 * 0.5
+    assert cpu_seconds >= timeout
+
+def test_slow_cases_are_ended_by_their_own_timeout(pool, counted, monkeypatch):
+    # Four hanging cases need more than the pool's 1s limit together, but each stops after 0.3s
+    monkeypatch.setenv("TEST_CASE_TIMEOUT", "0.3")
+    monkeypatch.setenv("TEST_SHARD_MIN_CASES", "10")
+    inputs = [[-1], [1], [-2], [-3], [2], [-4]]
+    start = time.perf_counter()
+    results = run_test_cases(CODE, inputs, [0, 2, 0, 0, 4, 0], pool)
+    elapsed = time.perf_counter() - start
+    assert len(counted) == 1  # one sandbox run, no fallback to isolating each case
+    assert [r.timed_out for r in results] == [True, False, True, True, False, True]
+    assert [r.passed for r in results] == [False, True, False, False, True, False]
+    assert elapsed < 4 * 0.3 + 1.5
+
+def test_crashing_case_is_isolated_from_the_rest(pool, counted, monkeypatch):
+    monkeypatch.setenv("TEST_SHARD_MIN_CASES", "10")
+    results = run_test_cases(CODE, [[1], [99], [3]], [2, 0, 6], pool)
+    assert len(counted) == 1 + 3  # the shard, then each case on its own
+    assert [r.passed for r in results] == [True, False, True]
+    assert results[1].error.startswith("SandboxError")
+
+def test_revalidate_marks_cases_not_rerun_as_stale(pool):
+    previous = run_test_cases("def f(x):\n    return 0\n", [[1], [2], [3]], [2, 4, 6], pool)
+    results = revalidate(CODE.replace("x * 2", "x * 3"), [[1], [2], [3]], [2, 4, 6], previous, pool)
+    assert [(r.passed, r.stale) for r in results] == [(False, False), (False, True), (False, True)]
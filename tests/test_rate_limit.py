@@ -0,0 +1,41 @@
+import threading
+import time
+
+from rate_limit import RateLimiter
+
+def test_adjust_updates_the_call_it_was_given():
+    limiter = RateLimiter(tokens_per_minute=1000)
+    first, _ = limiter.acquire(100)
+    second, _ = limiter.acquire(100)
+    limiter.adjust(first, 400)
+    assert [call[2] for call in limiter._calls] == [400, 100]
+    limiter.adjust(second, 10)
+    assert [call[2] for call in limiter._calls] == [400, 10]
+    assert limiter._tokens == 410
+
+def test_adjust_after_the_call_left_the_window_is_ignored():
+    limiter = RateLimiter(tokens_per_minute=1000, window=0.05)
+    handle, _ = limiter.acquire(100)
+    time.sleep(0.06)
+    limiter.acquire(50)
+    limiter.adjust(handle, 900)
+    assert limiter._tokens == 50
+
+def test_lower_usage_frees_budget_for_waiters():
+    limiter = RateLimiter(tokens_per_minute=100, window=30)
+    handle, _ = limiter.acquire(90)
+    waited = []
+    thread = threading.Thread(target=lambda: waited.append(limiter.acquire(50)[1]))
+    thread.start()
+    time.sleep(0.05)
+    limiter.adjust(handle, 20)
+    thread.join(2)
+    assert waited and waited[0] < 1
+
+def test_request_limit_blocks_until_the_window_moves():
+    limiter = RateLimiter(requests_per_minute=2, window=0.1)
+    limiter.acquire()
+    limiter.acquire()
+    assert limiter.wait_time() > 0
+    _, waited = limiter.acquire()
+    assert 0.05 < waited < 0.5
@@ -0,0 +1,92 @@
+import asyncio
+from types import SimpleNamespace
+from typing import TypedDict
+
+import pytest
+from langchain_core.prompts import PromptTemplate
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import END, START, StateGraph
+from pydantic import BaseModel
+
+from response_cache import CachedRunnable, ResponseCache
+
+class Answer(BaseModel):
+    text: str
+
+class State(TypedDict):
+    question: str
+    answer: str
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / "responses.sqlite"))
+
+@pytest.fixture
+def calls():
+    return []
+
+@pytest.fixture
+def cached(cache, calls):
+    def answer(input):
+        calls.append(input["question"])
+        return Answer(text=f"answer {len(calls)}")
+    return CachedRunnable(RunnableLambda(answer), PromptTemplate.from_template("{question}"), Answer,
+                          SimpleNamespace(temperature=0), cache)
+
+def test_identical_prompt_is_served_from_cache(cached, cache, calls):
+    assert cached.invoke({"question": "q"}).text == "answer 1"
+    assert cached.invoke({"question": "q"}).text == "answer 1"
+    assert cached.invoke({"question": "other"}).text == "answer 2"
+    assert calls == ["q", "other"]
+    assert cache.stats()["hits_memory"] == 1
+    assert cache.stats()["misses"] == 2
+
+def test_disk_tier_survives_a_new_cache(cached, cache, calls, tmp_path):
+    cached.invoke({"question": "q"})
+    reopened = ResponseCache(cache.path)
+    assert Answer.model_validate_json(reopened.get(cache.make_key("q", "Answer", cached.params))).text == "answer 1"
+    assert reopened.stats()["hits_disk"] == 1
+
+def test_expired_entries_miss(cache):
+    cache.ttl = -1
+    cache.set("key", "value")
+    assert cache.get("key") is None
+
+def test_env_var_bypasses_the_cache(cached, calls, monkeypatch):
+    monkeypatch.setenv("RESPONSE_CACHE_DISABLED", "1")
+    cached.invoke({"question": "q"})
+    cached.invoke({"question": "q"})
+    assert len(calls) == 2
+
+def test_sampling_temperature_bypasses_the_cache(cached, calls):
+    cached.params["temperature"] = 0.8
+    cached.invoke({"question": "q"})
+    cached.invoke({"question": "q"})
+    assert len(calls) == 2
+
+def test_run_config_bypass_reaches_nodes_that_invoke_without_config(cached, cache, calls):
+    graph = StateGraph(State)
+    # Like the workflow nodes: the agent is invoked with the input only
+    graph.add_node("agent", lambda state: {"answer": cached.invoke({"question": state["question"]}).text})
+    graph.add_edge(START, "agent")
+    graph.add_edge("agent", END)
+    app = graph.compile()
+
+    app.invoke({"question": "q"})
+    assert app.invoke({"question": "q"})["answer"] == "answer 1"
+    assert len(calls) == 1
+    assert app.invoke({"question": "q"}, {"configurable": {"cache_bypass": True}})["answer"] == "answer 2"
+    assert len(calls) == 2
+    assert cache.stats()["bypassed"] == 1
+
+def test_run_config_bypass_reaches_async_nodes(cached, calls):
+    async def node(state):
+        return {"answer": (await cached.ainvoke({"question": state["question"]})).text}
+    graph = StateGraph(State)
+    graph.add_node("agent", node)
+    graph.add_edge(START, "agent")
+    graph.add_edge("agent", END)
+    app = graph.compile()
+    asyncio.run(app.ainvoke({"question": "q"}))
+    asyncio.run(app.ainvoke({"question": "q"}, {"configurable": {"cache_bypass": True}}))
+    assert len(calls) == 2
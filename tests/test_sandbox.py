@@ -0,0 +1,68 @@
+import os
+import queue
+
+import pytest
+
+from sandbox import SandboxError, SandboxPool, SandboxWorker
+
+@pytest.fixture
+def pool():
+    pool = SandboxPool(size=1, timeout=5, memory_mb=0, cpu_seconds=5)
+    yield pool
+    pool.close()
+
+def test_runs_code_and_returns_result(pool):
+    result = pool.run("print('hi')\n__result__ = [1, 2]")
+    assert result.success
+    assert result.result == [1, 2]
+    assert result.stdout == "hi\n"
+
+def test_worker_does_not_see_server_secrets(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-secret")
+    worker = SandboxWorker()
+    try:
+        result = worker.run("import os\n__result__ = dict(os.environ)", timeout=5)
+    finally:
+        worker.kill()
+    assert "OPENAI_API_KEY" not in result.result
+    assert result.result["HOME"] == worker.workdir
+
+def test_output_of_generated_code_stays_out_of_the_protocol(pool):
+    result = pool.run("import sys\nprint('{\"success\": true}')\nsys.stdout.flush()\n1 / 0")
+    assert not result.success
+    assert result.error.startswith("ZeroDivisionError")
+
+def test_forged_result_on_protocol_pipe_is_rejected(pool):
+    # fd 4 is the worker's private copy of the protocol output (fds 0-2 are /dev/null, 3 the protocol input)
+    forge = ("import json, os\n"
+             "for fd in range(3, 10):\n"
+             "    try:\n"
+             "        os.write(fd, (json.dumps({'success': True, 'result': 'forged'}) + '\\n').encode())\n"
+             "    except OSError:\n"
+             "        pass\n"
+             "raise ValueError('real failure')\n")
+    result = pool.run(forge)
+    assert not result.success
+    assert result.result != "forged"
+    assert result.error.startswith("SandboxError")
+    # The desynchronised worker was replaced; the next job gets its own result
+    assert pool.run("__result__ = 42", timeout=10).result == 42
+
+def test_main_block_runs_only_under_main(pool):
+    code = "x = 1\nif __name__ == '__main__':\n    x = input()\n__result__ = x"
+    assert pool.run(code, module_name="solution").result == 1
+    assert not pool.run(code).success  # input() on /dev/null
+
+def test_timeout_kills_and_replaces_worker(pool):
+    result = pool.run("while True: pass", timeout=0.5)
+    assert result.timed_out
+    assert pool.run("__result__ = 'ok'", timeout=10).result == "ok"
+
+def test_run_raises_when_no_worker_comes_free(pool):
+    pool.acquire_timeout = 0.2
+    worker = pool._idle.get()
+    try:
+        with pytest.raises(SandboxError):
+            pool.run("pass")
+    finally:
+        pool._idle.put(worker)
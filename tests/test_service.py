@@ -0,0 +1,165 @@
+import asyncio
+import queue
+import sqlite3
+from typing import TypedDict
+
+import pytest
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.graph import END, START, StateGraph
+from starlette.testclient import TestClient
+
+import checkpoints
+import resources
+from service import JobManager, create_app
+
+@pytest.fixture
+def manager():
+    # No worker processes: events are fed to the manager as a worker would send them
+    manager = JobManager(workers=0, grace=0.05)
+    manager._loop = asyncio.new_event_loop()
+    yield manager
+    manager._loop.close()
+
+def collect(manager, job, after=-1):
+    async def run():
+        return [event async for event in manager.events(job, after)]
+    return manager._loop.run_until_complete(run())
+
+def collect_until(manager, job, count, after=-1):
+    async def run():
+        events = []
+        async for event in manager.events(job, after):
+            events.append(event)
+            if len(events) == count:
+                return events
+    return manager._loop.run_until_complete(run())
+
+def feed(manager, job, events):
+    for kind, node, data in events:
+        manager._record(job.job_id, kind, node, data)
+
+RUN = [
+    ("started", None, {"worker": 1}),
+    ("partial", "programmer", "def f"),
+    ("partial", "programmer", "def f(x):"),
+    ("partial", "programmer", "def f(x): return x"),
+    ("update", "programmer", {"code": "def f(x): return x"}),
+    ("partial", "tester", "[1]"),
+    ("done", None, {"state": {"success": True}}),
+]
+
+def test_runs_of_partials_keep_only_the_latest(manager):
+    job = manager.submit("echo")
+    manager.subscribe(job)
+    feed(manager, job, RUN)
+    events = collect(manager, job)
+    assert [(e["kind"], e["node"]) for e in events] == [
+        ("started", None), ("partial", "programmer"), ("update", "programmer"), ("partial", "tester"), ("done", None)]
+    assert events[1]["data"] == "def f(x): return x"
+    assert [e["id"] for e in events] == [0, 3, 4, 5, 6]
+
+def test_resume_sends_only_events_after_last_event_id(manager):
+    job = manager.submit("echo")
+    manager.subscribe(job)
+    feed(manager, job, RUN)
+    assert [e["kind"] for e in collect(manager, job, after=4)] == ["partial", "done"]
+
+def test_partial_that_replaced_a_sent_one_is_sent_again(manager):
+    job = manager.submit("echo")
+    manager.subscribe(job)
+    feed(manager, job, RUN[:2])
+    sent = collect_until(manager, job, 2)
+    feed(manager, job, RUN[2:3])
+    assert collect_until(manager, job, 1, after=sent[-1]["id"])[0]["data"] == "def f(x):"
+
+def test_finished_job_nobody_follows_keeps_only_its_final_event(manager):
+    job = manager.submit("echo")
+    feed(manager, job, RUN)
+    assert [e["kind"] for e in job.events] == ["done"]
+    summary = job.summary()
+    assert summary["status"] == "completed"
+    assert summary["events"] == len(RUN)
+    assert summary["result"] == {"state": {"success": True}}
+    assert [e["kind"] for e in collect(manager, job)] == ["done"]
+
+def test_finished_job_is_compacted_when_its_last_follower_leaves(manager):
+    job = manager.submit("echo")
+    manager.subscribe(job)
+    feed(manager, job, RUN)
+    assert len(job.events) == 5
+    manager.unsubscribe(job)
+    assert [e["kind"] for e in job.events] == ["done"]
+
+def test_identical_requirements_share_a_job_until_it_finishes(manager):
+    job = manager.submit("reverse a string")
+    assert manager.submit("  reverse   a string\n") is job
+    assert manager.submit("reverse a list") is not job
+    assert manager.coalesced == 1
+    feed(manager, job, RUN)
+    assert manager.submit("reverse a string") is not job
+
+def test_resumes_and_disabled_coalescing_get_their_own_job(manager):
+    job = manager.submit("echo")
+    assert manager.submit(run_id=job.run_id) is not job
+    manager.coalesce = False
+    assert manager.submit("echo") is not job
+
+def test_job_is_cancelled_when_every_follower_leaves(manager):
+    cancels = manager._cancels[1] = queue.Queue()
+    job = manager.submit("echo")
+    feed(manager, job, RUN[:2])
+    manager.subscribe(job)
+    manager.unsubscribe(job)
+    manager._loop.run_until_complete(asyncio.sleep(0.2))
+    assert job.cancel_requested
+    assert cancels.get_nowait() == job.job_id
+    assert manager.submit("echo") is not job
+
+def test_job_is_kept_when_a_follower_returns_within_the_grace_period(manager):
+    manager._cancels[1] = queue.Queue()
+    job = manager.submit("echo")
+    feed(manager, job, RUN[:2])
+    manager.subscribe(job)
+    manager.unsubscribe(job)
+    manager.subscribe(job)
+    manager._loop.run_until_complete(asyncio.sleep(0.2))
+    assert not job.cancel_requested
+
+class State(TypedDict):
+    value: int
+
+@pytest.fixture
+def saver(tmp_path, monkeypatch):
+    saver = SqliteSaver(sqlite3.connect(str(tmp_path / "checkpoints.sqlite"), check_same_thread=False))
+    monkeypatch.setattr(checkpoints, "_saver", saver)
+    return saver
+
+def test_run_info_reads_checkpoints_without_building_the_graph(saver, monkeypatch):
+    failures = [RuntimeError("interrupted")]
+
+    def second(state):
+        if failures:
+            raise failures.pop()
+        return {"value": state["value"] + 1}
+    graph = StateGraph(State)
+    graph.add_node("first", lambda state: {"value": state["value"] + 1})
+    graph.add_node("second", second)
+    graph.add_edge(START, "first")
+    graph.add_edge("first", "second")
+    graph.add_edge("second", END)
+    app = graph.compile(checkpointer=saver)
+    with pytest.raises(RuntimeError):
+        app.invoke({"value": 0}, checkpoints.run_config("r1"))
+
+    monkeypatch.setattr(resources, "get_resources", lambda: pytest.fail("the HTTP process built the graph"))
+    client = TestClient(create_app(workers=1))
+    info = client.get("/runs/r1").json()
+    assert info["status"] == "interrupted" == checkpoints.run_status("r1")
+    assert info["history"][0]["next"] == ["second"] == list(app.get_state(checkpoints.run_config("r1")).next)
+
+    app.invoke(None, checkpoints.run_config("r1"))
+    info = client.get("/runs/r1").json()
+    assert info["status"] == "completed"
+    assert [h["step"] for h in info["history"]] == [2, 1, 0]
+    assert info["history"][0]["next"] == []
+    assert client.get("/runs/unknown").json()["status"] == "new"
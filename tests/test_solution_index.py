@@ -0,0 +1,95 @@
+import pytest
+
+from solution_index import SolutionIndex, fits, named_functions, normalise
+
+CORPUS = [
+    "reverse a string",
+    "find the maximum of a list",
+    "check if a number is prime",
+    "compute the factorial of n",
+    "count vowels in a string",
+    "sum the digits of a number",
+    "remove duplicates from a list",
+    "convert celsius to fahrenheit",
+]
+
+CODE = "def f(x):\n    return x\n"
+
+@pytest.fixture
+def index(tmp_path):
+    index = SolutionIndex(str(tmp_path / "solutions.sqlite"))
+    for requirement in CORPUS:
+        index.record(requirement, CODE, [])
+    return index
+
+@pytest.mark.parametrize("query, stored", [
+    ("return the string backwards", "reverse a string"),
+    ("write a function to reverse the given strings", "reverse a string"),
+    ("get the largest element of a list", "find the maximum of a list"),
+    ("determine whether a number is prime", "check if a number is prime"),
+    ("compute n factorial", "compute the factorial of n"),
+    ("remove duplicate items from a list", "remove duplicates from a list"),
+])
+def test_paraphrases_hit(index, query, stored):
+    match = index.lookup(query)
+    assert match is not None and match.requirement == stored
+
+@pytest.mark.parametrize("query", [
+    "find the minimum of a list",
+    "reverse a list",
+    "count consonants in a string",
+    "sum the digits of a string",
+    "check if a number is even",
+    "convert fahrenheit to celsius",
+])
+def test_near_misses_are_rejected(index, query):
+    assert index.lookup(query) is None
+
+def test_scores_use_the_current_idf(tmp_path):
+    index = SolutionIndex(str(tmp_path / "solutions.sqlite"))
+    index.record("reverse a string", CODE, [])
+    before = index.similarities("return the string backwards")[0]
+    for requirement in CORPUS[1:]:
+        index.record(requirement, CODE, [])
+    # Stored vectors are re-weighted, so an identical normalised text still scores 1
+    assert before == pytest.approx(1.0)
+    assert index.similarities("return the string backwards")[0] == pytest.approx(1.0)
+    assert index.similarities("reverse a list")[0] < 0.5
+
+def test_reloaded_index_scores_the_same(index, tmp_path):
+    reloaded = SolutionIndex(str(tmp_path / "solutions.sqlite"))
+    assert len(reloaded) == len(CORPUS)
+    for query in ("reverse a list", "get the largest element of a list"):
+        assert reloaded.similarities(query).max() == pytest.approx(index.similarities(query).max())
+
+def test_named_functions():
+    assert named_functions("Write `is_prime` and call it as is_prime(n)") == {"is_prime": 1}
+    assert named_functions("implement reverse_string for text") == {"reverse_string": None}
+    assert named_functions("merge(a, b) two sorted lists") == {"merge": 2}
+    assert named_functions("reverse a string (in place)") == {}
+
+def test_fits_checks_name_and_arity():
+    code = "def reverse_string(s, start=0):\n    return s[::-1]\n"
+    assert fits("reverse a string", code)
+    assert fits("reverse_string(s) returns s backwards", code)
+    assert fits("reverse_string(s, 1)", code)
+    assert not fits("reverse_string(s, 1, 2)", code)
+    assert not fits("implement `reverse_text`", code)
+    assert not fits("reverse_string(s)", "def reverse_string(s:\n")
+
+def test_hit_with_wrong_function_is_not_reused(tmp_path):
+    index = SolutionIndex(str(tmp_path / "solutions.sqlite"))
+    index.record("reverse a string", "def reverse_string(s):\n    return s[::-1]\n", [])
+    assert index.lookup("reverse_string(s): reverse a string").code.startswith("def reverse_string")
+    assert index.lookup("reverse_text(s): reverse a string") is None
+    assert index.stats()["rejected"] == 1
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    index = SolutionIndex(str(tmp_path / "solutions.sqlite"), max_entries=2)
+    index.record("reverse a string", CODE, [])
+    index.record("check if a number is prime", CODE, [])
+    assert index.lookup("reverse the string") is not None
+    index.record("compute the factorial of n", CODE, [])
+    assert len(index) == 2
+    assert index.lookup("determine whether a number is prime") is None
+    assert index.lookup("reverse the string") is not None
@@ -0,0 +1,232 @@
+"""Prompt token accounting and compaction for agent calls
+
+Prompts are measured with tiktoken before they are sent. Code sent back
+to the agents has test scaffolding removed, and errors are cut down to
+the relevant traceback frames and a token budget. ``BudgetedRunnable``
+sizes ``max_tokens`` per call from the expected output and retries with
+a larger limit when a response is cut off mid-JSON, so truncation is
+reported instead of surfacing as a parse error.
+"""
+import ast
+import functools
+import os
+import re
+from typing import Any, Callable, Optional
+
+from langchain.chains.openai_functions import create_structured_output_runnable
+from langchain_core.exceptions import OutputParserException
+from langchain_core.runnables import Runnable, RunnableConfig
+from pydantic import ValidationError
+
+ENCODING = "cl100k_base"
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(ENCODING)
+    except Exception as e:
+        # tiktoken downloads the BPE file on first use; offline we estimate instead
+        print(f"tiktoken unavailable ({type(e).__name__}); estimating 4 characters per token")
+        return None
+
+def count_tokens(text):
+    encoding = _encoding()
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_tokens(text, budget):
+    """Keep the start and, mostly, the end of ``text`` within ``budget`` tokens"""
+    tokens = count_tokens(text)
+    if tokens <= budget:
+        return text
+    keep = int(len(text) * budget / tokens)
+    head = keep // 4
+    return f"{text[:head]}\n... [{tokens - budget} tokens trimmed] ...\n{text[len(text) - (keep - head):]}"
+
+def context_tokens():
+    return int(os.getenv("LLM_CONTEXT_TOKENS") or 128000)
+
+def max_output_tokens():
+    """Upper bound for any single response; each agent call sizes its own limit below it"""
+    return int(os.getenv("LLM_MAX_TOKENS") or 4096)
+
+def error_tokens():
+    return int(os.getenv("LLM_ERROR_TOKENS") or 600)
+
+_HARNESS_MARKER = "\n\n_TARGET = "  # start of the constants harness.build_harness appends
+
+def _is_main_guard(node):
+    test = node.test if isinstance(node, ast.If) else None
+    return (
+        isinstance(test, ast.Compare)
+        and isinstance(test.left, ast.Name) and test.left.id == "__name__"
+        and any(isinstance(c, ast.Constant) and c.value == "__main__" for c in test.comparators)
+    )
+
+def _is_test_name(name):
+    return name.lower().startswith(("test", "_test"))
+
+def _is_scaffolding(node):
+    if isinstance(node, ast.Assert) or _is_main_guard(node):
+        return True
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        return _is_test_name(node.name)
+    if isinstance(node, ast.ClassDef):
+        bases = [getattr(base, "attr", getattr(base, "id", "")) for base in node.bases]
+        return node.name.startswith("Test") or "TestCase" in bases
+    if isinstance(node, ast.Assign):
+        return all(isinstance(t, ast.Name) and _is_test_name(t.id) for t in node.targets)
+    if isinstance(node, ast.Expr) and isinstance(node.value, ast.Call):
+        func = node.value.func
+        name = getattr(func, "id", None) or getattr(func, "attr", "")
+        return name == "print" or _is_test_name(name) or name in ("main", "testmod")
+    if isinstance(node, (ast.For, ast.While)):
+        # Loops over test cases that assert or print results
+        return any(isinstance(n, ast.Assert) or (isinstance(n, ast.Call) and getattr(n.func, "id", None) == "print")
+                   for n in ast.walk(node))
+    return False
+
+def strip_scaffolding(code):
+    """The program without test scaffolding
+
+    Drops an appended local harness, ``if __name__ == "__main__"`` blocks,
+    top-level asserts, print and test calls, test functions and classes,
+    ``test*`` variables and loops that assert or print. Lines are removed
+    from the source rather than regenerated, so comments survive. Code
+    that does not parse is returned without the harness only.
+    """
+    code = code.split(_HARNESS_MARKER)[0]
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return code
+    drop = set()
+    for node in tree.body:
+        if _is_scaffolding(node):
+            first = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+            drop.update(range(first - 1, node.end_lineno))
+    if not drop:
+        return code
+    kept = "".join(line for i, line in enumerate(code.splitlines(keepends=True)) if i not in drop)
+    return re.sub(r"\n{3,}", "\n\n", kept).strip() + "\n"
+
+_FRAME = re.compile(r'^  File "(?P<file>[^"]+)", line \d+')
+_INTERNAL = ("sandbox_worker.py", "site-packages", "<frozen ", "/lib/python")
+
+def trim_traceback(error, frames=3):
+    """Keep the last ``frames`` frames of the final traceback in ``error``
+
+    Frames from the sandbox, the standard library and installed packages
+    are dropped, and of chained "During handling of the above exception"
+    sections only the immediate cause's last line is kept.
+    """
+    sections = re.split(r"\n\n(?:During handling of the above exception, another exception occurred|"
+                        r"The above exception was the direct cause of the following exception):\n\n", error)
+    causes = [s.strip().splitlines()[-1] for s in sections[:-1] if s.strip()][-1:]
+    lines = sections[-1].splitlines()
+    if not any(_FRAME.match(line) for line in lines):
+        return error
+
+    header, blocks, tail = [], [], []
+    for line in lines:
+        if _FRAME.match(line):
+            blocks.append([line])
+        elif blocks and line.startswith("    "):
+            blocks[-1].append(line)
+        elif blocks:
+            tail.append(line)
+        else:
+            header.append(line)
+    relevant = [b for b in blocks if not any(mark in _FRAME.match(b[0]).group("file") for mark in _INTERNAL)]
+    relevant = relevant or blocks[-1:]
+    omitted = len(blocks) - min(len(relevant), frames)
+    kept = relevant[-frames:]
+    out = [f"(caused by {cause})" for cause in causes] + header
+    if omitted:
+        out.append(f"  ... {omitted} frame{'s' if omitted != 1 else ''} omitted")
+    for block in kept:
+        # Drop the ^^^^ position markers; they cost tokens and the line is already shown
+        out.extend(line for line in block if line.strip(" ^~"))
+    return "\n".join(out + tail)
+
+def compact_error(error, budget=None):
+    """Trimmed traceback within ``budget`` tokens (LLM_ERROR_TOKENS by default)"""
+    if not error:
+        return error
+    return truncate_tokens(trim_traceback(error), budget or error_tokens())
+
+def output_budget(expected, prompt_tokens=0):
+    """max_tokens for an answer of about ``expected`` tokens
+
+    Leaves headroom for JSON escaping of code in the function call, stays
+    under LLM_MAX_TOKENS and within the context window left after
+    the prompt.
+    """
+    budget = int(expected * 1.5) + 256
+    return max(256, min(budget, max_output_tokens(), context_tokens() - prompt_tokens))
+
+def _cut_off(error):
+    """Whether a parse failure looks like JSON that stopped mid-document"""
+    if isinstance(error, ValidationError):
+        return any(e["type"] == "json_invalid" for e in error.errors())
+    return True
+
+class BudgetedRunnable(Runnable):
+    """Structured-output agent that measures its prompt and sizes max_tokens per call
+
+    ``expected_tokens(input)`` estimates the size of the answer, e.g. from
+    the code being refined. When the answer is cut off at the limit the
+    call is retried once with LLM_MAX_TOKENS and a warning is
+    printed.
+    """
+
+    def __init__(self, schema, llm, prompt, expected_tokens: Callable[[dict], int], name=None):
+        self.schema = schema
+        self.llm = llm
+        self.prompt = prompt
+        self.expected_tokens = expected_tokens
+        self.agent_name = name or schema.__name__
+        self._runnables = {}
+
+    def _runnable(self, max_tokens):
+        if max_tokens not in self._runnables:
+            self._runnables[max_tokens] = create_structured_output_runnable(
+                self.schema, self.llm.bind(max_tokens=max_tokens), self.prompt
+            )
+        return self._runnables[max_tokens]
+
+    def _plan(self, input):
+        prompt_tokens = count_tokens(self.prompt.format(**input))
+        if prompt_tokens + 256 > context_tokens():
+            raise ValueError(f"{self.agent_name} prompt is {prompt_tokens} tokens, over the "
+                             f"{context_tokens()} token context window")
+        # Round up to a multiple of 256 so few distinct runnables are built
+        max_tokens = -(-output_budget(self.expected_tokens(input), prompt_tokens) // 256) * 256
+        print(f"{self.agent_name}: prompt {prompt_tokens} tokens, max_tokens {max_tokens}")
+        return prompt_tokens, max_tokens
+
+    def _retry_limit(self, max_tokens, prompt_tokens, error):
+        ceiling = min(max_output_tokens(), context_tokens() - prompt_tokens)
+        if max_tokens >= ceiling or not _cut_off(error):
+            raise error
+        print(f"Warning: {self.agent_name} response was truncated at max_tokens={max_tokens}; "
+              f"retrying with {ceiling}")
+        return ceiling
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        prompt_tokens, max_tokens = self._plan(input)
+        try:
+            return self._runnable(max_tokens).invoke(input, config, **kwargs)
+        except (OutputParserException, ValidationError) as e:
+            max_tokens = self._retry_limit(max_tokens, prompt_tokens, e)
+        return self._runnable(max_tokens).invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        prompt_tokens, max_tokens = self._plan(input)
+        try:
+            return await self._runnable(max_tokens).ainvoke(input, config, **kwargs)
+        except (OutputParserException, ValidationError) as e:
+            max_tokens = self._retry_limit(max_tokens, prompt_tokens, e)
+        return await self._runnable(max_tokens).ainvoke(input, config, **kwargs)
@@ -1,40 +1,94 @@
-from langgraph.graph import END, StateGraph
-from models import AgentCoder
-from agents import create_agents
+import time
+
+from langgraph.graph import END, START, StateGraph
+from models import AgentCoder, TestCaseResult
+from metrics import current_run, instrument_node
+from candidates import CANDIDATE_STATS, generate_candidates, race_candidates
+from harness import code_hash, revalidate, run_test_cases, signature_matches, summarise_failures
+from sandbox import get_sandbox_pool
+from perf_check import check_performance, format_report
+from retry_policy import REGENERATE_TESTS, STOP, RetryPolicy, classify_error, disputed_tests, failing_cases, failure_signature
+from static_check import STATIC_STATS, check_code, format_diagnostics
+from token_budget import compact_error, strip_scaffolding
+
+def create_workflow(coder, tester_agent, execution, refine_code, spec_tester=None,
+                    candidate_coder=None, candidates=1, cancel_policy="first_pass", checkpointer=None,
+                    solution_index=None, perf_budget=None, retry_policy=None):
+    """Create the workflow graph
+
+    With ``spec_tester`` the programmer and a requirement-only tester run
+    in parallel; the code-aware tester is used only when the generated
+    tests do not fit the generated function's signature.
+
+    With ``candidate_coder`` and ``candidates`` > 1 the programmer samples
+    that many candidates in parallel and the first executer pass races
+    them on the tests (see candidates.race_candidates); the debugger only
+    runs when every candidate fails.
+
+    After a debugger fix the executer re-runs the previously failing test
+    cases first and the full suite only once they pass, and skips running
+    entirely when the code's AST hash is unchanged (see harness.revalidate).
+
+    With ``solution_index`` the programmer first looks for a passing
+    solution to a near-duplicate requirement and, when one is found,
+    sends it straight to the tester instead of calling the coder; every
+    solution that passes is recorded (see solution_index.py).
+
+    Every program passes a static check (see static_check.py) before
+    the tester or executer sees it; code that cannot run goes back to the
+    debugger with the diagnostics, without a sandbox run or LLM harness.
+
+    With ``perf_budget`` code that passes its tests is also timed on
+    scaled-up inputs (see perf_check.py); code over the budget goes back
+    to the debugger with the measurements.
+
+    Every failure goes through ``retry_policy`` (see retry_policy.py),
+    which classifies it and chooses between refining the code,
+    regenerating the tests and stopping within its time and token
+    budgets. Without one, a policy with default budgets and fix rates
+    kept in memory is used.
+
+    With ``checkpointer`` the state is saved after every node, so runs
+    can be resumed or branched by run id (see checkpoints.py).
+    """
+    retry_policy = retry_policy or RetryPolicy()
 
-def create_workflow(coder, tester_agent, execution, refine_code):
-    """Create the workflow graph"""
     def programmer(state):
-        print(f'Entering in Programmer')
+        print('Entering in Programmer')
         requirement = state['requirement']
-        code_ = coder.invoke({'requirement': requirement})
+        codes = []
+        match = solution_index.lookup(requirement) if solution_index is not None else None
+        if match is not None:
+            # Still re-validated against tests written for this requirement
+            print(f"Reusing the solution to a similar requirement ({match.similarity:.2f}): {match.requirement!r}")
+            code = match.code
+        else:
+            if candidate_coder is not None and candidates > 1:
+                codes = generate_candidates(candidate_coder, requirement, candidates)
+            # Tests are written against the first candidate; all candidates share them
+            code = codes[0] if codes else coder.invoke({'requirement': requirement}).code
         return {
-            'code': code_.code, 
+            'code': code, 
             'requirement': requirement,
             'retry_count': 0,
             'errors': None,
             'tests': {},
-            'success': False
+            'success': False,
+            'test_results': [],
+            'code_hash': None,
+            'candidates': codes,
+            'started_at': time.time(),
+            'retry_history': [],
+            'reused_from': match and {'requirement': match.requirement, 'similarity': match.similarity}
         }
 
     def debugger(state):
-        print(f'Entering in Debugger')
+        print('Entering in Debugger')
         errors = state['errors']
         code = state['code']
         retry_count = state.get('retry_count', 0) + 1
-        
-        if retry_count > 3:  # Maximum retry limit
-            print("Maximum retry limit reached. Stopping debug cycle.")
-            return {
-                'code': code,
-                'errors': None,
-                'requirement': state['requirement'],
-                'retry_count': retry_count,
-                'tests': state['tests'],
-                'success': False
-            }
-            
-        refine_code_ = refine_code.invoke({'code': code, 'error': errors})
+        # Send only the program and the relevant part of the error, not the scaffolding around them
+        refine_code_ = refine_code.invoke({'code': strip_scaffolding(code), 'error': compact_error(errors)})
         return {
             'code': refine_code_.code,
             'errors': None,
@@ -45,91 +99,281 @@ def create_workflow(coder, tester_agent, execution, refine_code):
         }
 
     def executer(state):
-        print(f'Entering in Executer')
+        print('Entering in Executer')
         tests = state['tests']
         input_ = tests['input']
         output_ = tests['output']
         code = state['code']
-        executable_code = execution.invoke({"code": code, "input": input_, 'output': output_})
+
+        if len(state.get('candidates') or []) > 1:
+            winner, outcomes = race_candidates(state['candidates'], input_, output_, cancel_policy)
+            CANDIDATE_STATS.record(winner)
+            print(CANDIDATE_STATS.summary())
+            scored = {i: r for i, r in outcomes.items() if r is not None}
+            if scored:
+                # Keep the winner, or the candidate passing the most cases for the debugger to refine
+                best = winner if winner is not None else max(scored, key=lambda i: sum(c.passed for c in scored[i]))
+                code, results = state['candidates'][best], scored[best]
+            else:
+                results = None
+        else:
+            previous = [TestCaseResult(**r) for r in state.get('test_results') or []]
+            if len(previous) != len(input_):
+                # Call the target function on each test row locally instead of asking the LLM for a harness
+                results = run_test_cases(code, input_, output_)
+            elif state.get('code_hash') and code_hash(code, input_) == state['code_hash']:
+                # The fix only touched formatting, comments or unreachable helpers
+                print("Code unchanged since the last run (same AST hash). Reusing its test results.")
+                results = previous
+            else:
+                results = revalidate(code, input_, output_, previous)
+        if results is not None:
+            success = all(r.passed for r in results)
+            error = None
+            if success:
+                print("Code Execution Successful")
+                # With a performance budget the solution is recorded once it meets it
+                if solution_index is not None and perf_budget is None:
+                    solution_index.record(state['requirement'], code, state['tests'])
+            else:
+                print('Found Error While Running')
+                error = f"Execution Error : {summarise_failures(results)}"
+                print(error)
+            return {
+                'code': code,
+                'errors': error,
+                'requirement': state['requirement'],
+                'tests': state['tests'],
+                'retry_count': state.get('retry_count', 0),
+                'success': success,
+                'test_results': [r.model_dump() for r in results],
+                'code_hash': code_hash(code, input_),
+                'candidates': [],
+                'performance': None
+            }
+
+        # No function matches the test inputs: fall back to the LLM-written harness
+        executable_code = execution.invoke({"code": strip_scaffolding(code), "input": input_, 'output': output_})
         error = None
         try:
-            exec(executable_code.code)
+            # Run in an isolated worker process instead of exec() in the server process
+            result = get_sandbox_pool().run(executable_code.code)
+            if not result.success:
+                raise RuntimeError(compact_error(result.traceback or result.error))
             print("Code Execution Successful")
+            # Keep the program itself in the state; the harness is rebuilt on every run
             return {
-                'code': executable_code.code,
+                'code': code,
                 'errors': None,
                 'requirement': state['requirement'],
                 'tests': state['tests'],
                 'retry_count': state.get('retry_count', 0),
-                'success': True
+                'success': True,
+                'test_results': [],
+                'code_hash': None,
+                'candidates': [],
+                'performance': None
             }
         except Exception as e:
             print('Found Error While Running')
             error = f"Execution Error : {e}"
             print(error)
             return {
-                'code': executable_code.code,
+                'code': code,
                 'errors': error,
                 'requirement': state['requirement'],
                 'tests': state['tests'],
                 'retry_count': state.get('retry_count', 0),
-                'success': False
+                'success': False,
+                'test_results': [],
+                'code_hash': None,
+                'candidates': [],
+                'performance': None
             }
 
     def tester(state):
-        print(f'Entering in Tester')
+        print('Entering in Tester')
         requirement = state['requirement']
         code = state['code']
-        tests = tester_agent.invoke({'requirement': requirement, 'code': code})
+        history = state.get('retry_history') or []
+        if history and history[-1]['action'] == REGENERATE_TESTS:
+            # Point the tester at the expectations the code disagrees with
+            requirement += disputed_tests(state.get('test_results'))
+        tests = tester_agent.invoke({'requirement': requirement, 'code': strip_scaffolding(code)})
         return {
             'tests': {'input': tests.Input, 'output': tests.Output},
-            'requirement': requirement,
+            'requirement': state['requirement'],
             'code': state['code'],
             'retry_count': state.get('retry_count', 0),
             'errors': None,
-            'success': False
+            'success': False,
+            'test_results': [],
+            'code_hash': None
         }
 
-    def decide_to_end(state):
-        print(f'Entering in Decide to End')
-        retry_count = state.get('retry_count', 0)
+    def spec_test_writer(state):
+        print('Entering in Spec Tester')
+        try:
+            tests = spec_tester.invoke({'requirement': state['requirement']})
+        except Exception as e:
+            # The code-aware tester picks up from here
+            print(f"Spec tester failed: {e}")
+            return {'spec_tests': {}}
+        return {'spec_tests': {'input': tests.Input, 'output': tests.Output}}
+
+    def reconcile(state):
+        print('Entering in Reconcile')
+        spec_tests = state.get('spec_tests') or {}
+        if spec_tests and signature_matches(state['code'], spec_tests['input']):
+            return {'tests': spec_tests}
+        print("Spec tests do not match the code signature. Falling back to the code-aware tester.")
+        return {'tests': {}}
+
+    def static_checker(state):
+        print('Entering in Static Check')
+        inputs = (state.get('tests') or {}).get('input')
+        report = check_code(state['code'], inputs)
+        update = {'code': report.code}
+        candidates = state.get('candidates') or []
+        if len(candidates) > 1:
+            # Candidates that cannot run are dropped before the race
+            checked = [report] + [check_code(c, inputs) for c in candidates[1:]]
+            runnable = [r.code for r in checked if r.passed]
+            if runnable:
+                update['code'], update['candidates'] = runnable[0], runnable
+                report = next(r for r in checked if r.passed)
+        STATIC_STATS.record(report)
+        for fix in report.fixes:
+            print(f"Static check fixed the code: {fix}")
+        for warning in report.warnings:
+            print(f"Static check warning: {warning}")
+        if not report.passed:
+            error = format_diagnostics(report)
+            print(error)
+            print(STATIC_STATS.summary())
+            return {**update, 'errors': error, 'success': False, 'test_results': [], 'code_hash': None,
+                    'candidates': []}
+        return {**update, 'errors': None}
+
+    def decide_after_check(state):
+        if state.get('errors'):
+            return 'retry_policy'
+        return 'executer' if state.get('tests') else 'tester'
+
+    def performance_check(state):
+        print('Entering in Performance Check')
+        report = check_performance(state['code'], state['tests']['input'], perf_budget)
+        if report.skipped:
+            print(f"Performance check skipped: {report.skipped}")
+        elif report.exponent is not None:
+            print(f"Empirical complexity n^{report.exponent:.2f}, peak memory {report.peak_memory_mb} MB")
+        if report.breaches:
+            error = format_report(report)
+            print(error)
+            return {'performance': report.model_dump(), 'errors': error, 'success': False}
+        if solution_index is not None:
+            solution_index.record(state['requirement'], state['code'], state['tests'])
+        return {'performance': report.model_dump()}
+
+    def perf_due(state):
+        return state.get('success') and perf_budget is not None and state.get('performance') is None
+
+    def retry_decision(state):
+        print('Entering in Retry Policy')
+        history = [dict(entry) for entry in state.get('retry_history') or []]
         success = state.get('success', False)
-        
+        # A performance fix is only judged once the refined code has been timed again
+        if history and 'fixed' not in history[-1] and not (perf_due(state) and history[-1]['class'] == 'performance'):
+            history[-1]['fixed'] = retry_policy.settle(history[-1], success, failing_cases(state))
         if success:
-            print("All tests passed successfully. Exiting workflow.")
-            return 'end'
-        elif state.get('errors') and retry_count <= 3:
-            return 'debugger'
-        else:
-            print("Maximum retries reached or no errors to fix. Exiting workflow.")
-            return 'end'
+            if not perf_due(state):
+                print("All tests passed successfully. Exiting workflow.")
+            return {'retry_history': history}
+
+        error_class, detail = classify_error(state.get('errors'), state.get('test_results'), history,
+                                             state.get('code_hash'))
+        run = current_run()
+        tokens = None
+        started = state.get('started_at') or time.time()
+        if run is not None:
+            totals = run.totals()
+            tokens = totals['prompt_tokens'] + totals['completion_tokens']
+            # Budgets apply per invocation, so a resumed run starts a fresh clock
+            started = max(started, run.started)
+        elapsed = time.time() - started
+        decision = retry_policy.decide(error_class, detail, history, elapsed, tokens)
+        print(f"Retry policy: {error_class} ({detail}) -> {decision.action}: {decision.reason}")
+        history.append({
+            'class': error_class,
+            'detail': detail,
+            'action': decision.action,
+            'fix_rate': round(decision.fix_rate, 3),
+            'failing': failing_cases(state),
+            'signature': failure_signature(state.get('test_results')),
+            'code_hash': state.get('code_hash'),
+            'elapsed': round(elapsed, 2),
+            'tokens': tokens,
+        })
+        update = {'retry_history': history}
+        if decision.action == STOP:
+            print(retry_policy.summary())
+            if error_class == 'performance':
+                print("Keeping the code that passes its tests.")
+                update.update(success=True, errors=None)
+        return update
+
+    def decide_next(state):
+        if state.get('success'):
+            return 'perf_check' if perf_due(state) else 'end'
+        action = (state.get('retry_history') or [{}])[-1].get('action')
+        return {'refine': 'debugger', REGENERATE_TESTS: 'tester'}.get(action, 'end')
 
     # Create the workflow
     workflow = StateGraph(AgentCoder)
 
     # Add nodes
-    workflow.add_node("programmer", programmer)
-    workflow.add_node("debugger", debugger)
-    workflow.add_node("executer", executer)
-    workflow.add_node("tester", tester)
+    workflow.add_node("programmer", instrument_node("programmer", programmer))
+    workflow.add_node("debugger", instrument_node("debugger", debugger))
+    workflow.add_node("executer", instrument_node("executer", executer))
+    workflow.add_node("tester", instrument_node("tester", tester))
+    workflow.add_node("static_check", instrument_node("static_check", static_checker))
+    workflow.add_node("retry_policy", instrument_node("retry_policy", retry_decision))
+    if perf_budget is not None:
+        workflow.add_node("perf_check", instrument_node("perf_check", performance_check))
+        workflow.add_edge("perf_check", "retry_policy")
 
     # Build graph
-    workflow.set_entry_point("programmer")
-    workflow.add_edge("programmer", "tester")
-    workflow.add_edge("debugger", "executer")
-    workflow.add_edge("tester", "executer")
+    if spec_tester is None:
+        workflow.set_entry_point("programmer")
+        workflow.add_edge("programmer", "static_check")
+    else:
+        # Generate code and requirement-only tests concurrently, then join before execution
+        workflow.add_node("spec_tester", instrument_node("spec_tester", spec_test_writer))
+        workflow.add_node("reconcile", instrument_node("reconcile", reconcile))
+        workflow.add_edge(START, "programmer")
+        workflow.add_edge(START, "spec_tester")
+        workflow.add_edge(["programmer", "spec_tester"], "reconcile")
+        workflow.add_edge("reconcile", "static_check")
+    # Every program is checked before it is tested or run; tests are checked against it for arity
+    workflow.add_edge("debugger", "static_check")
+    workflow.add_edge("tester", "static_check")
+    workflow.add_conditional_edges(
+        "static_check",
+        decide_after_check,
+        {"tester": "tester", "executer": "executer", "retry_policy": "retry_policy"},
+    )
 
-    # Add conditional edges
+    # Every outcome goes through the retry policy, which ends the run or picks the next step
+    workflow.add_edge("executer", "retry_policy")
     workflow.add_conditional_edges(
-        "executer",
-        decide_to_end,
+        "retry_policy",
+        decide_next,
         {
             "end": END,
             "debugger": "debugger",
+            "tester": "tester",
+            **({"perf_check": "perf_check"} if perf_budget is not None else {}),
         },
     )
 
-    # Add final edge to end
-    workflow.add_edge("decide_to_end", END)
-
-    return workflow.compile() 
\ No newline at end of file
+    return workflow.compile(checkpointer=checkpointer) 
\ No newline at end of file